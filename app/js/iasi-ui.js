@@ -51,7 +51,7 @@ export async function loadEvent(name){
     const r = await fetch(apiUrl, { headers });
     if (r.ok){
       const j = await r.json();
-      if (j.ok && j.data) return j.data;
+      if (j.ok && j.data){ if (j.version!=null) j.data._version = j.version; return j.data; }
     }
   }catch(e){ /* ignore and fallback to static/demo */ }
 
@@ -217,30 +217,117 @@ async function listIndicesFromServer(){
   finally{ Spinner.hide(); }
 }
 
+// Merge a /get_iasi?since= delta into DATA.events[name] in place. Returns true if anything changed.
+function applyDelta(name, j){
+  if(!j.delta){ DATA.events[name] = j.data || j; if(j.version!=null) DATA.events[name]._version = j.version; return true; }
+  const ev = DATA.events[name];
+  const changed = (j.rows && j.rows.length) || (j.removed && j.removed.length) || ev._version !== j.version;
+  const tl = Array.isArray(ev.timeline) ? ev.timeline : (ev.timeline = []);
+  if (j.removed && j.removed.length){
+    const gone = new Set(j.removed);
+    for(let i=tl.length-1;i>=0;i--){ if(gone.has(tl[i].date)) tl.splice(i,1); }
+  }
+  if (j.rows && j.rows.length){
+    const idx = new Map(tl.map((r,i)=>[r.date,i]));
+    let needSort = false;
+    for(const r of j.rows){
+      if(idx.has(r.date)){ tl[idx.get(r.date)] = r; continue; }
+      if(tl.length && r.date < tl[tl.length-1].date) needSort = true;
+      idx.set(r.date, tl.length); tl.push(r);
+    }
+    if(needSort) tl.sort((a,b)=> a.date < b.date ? -1 : (a.date > b.date ? 1 : 0));
+  }
+  if (j.metrics) ev.metrics = j.metrics;
+  if (j.meta) ev.meta = Object.assign({}, ev.meta||{}, j.meta);
+  ev._version = j.version;
+  return !!changed;
+}
+
+// Fetch only what changed since the version we hold (full payload if nothing is cached yet)
+async function syncEvent(name){
+  const cur = DATA.events[name];
+  const since = (cur && cur._version!=null) ? `?since=v${cur._version}` : '';
+  const res = await fetch(`${SERVER_BASE}/get_iasi/${encodeURIComponent(name)}${since}`, { headers: buildAuthHeaders() });
+  const j = await res.json();
+  if(!j.ok) throw new Error(j.error||res.statusText);
+  return applyDelta(name, j);
+}
+
 async function reloadFromServer(){
   const sel = document.getElementById('eventSelect'); const name = sel.value; if(!name) return toast('Seleccione un índice para recargar','error');
-  try{ Spinner.show(); const headers = buildAuthHeaders(); const res = await fetch(`${SERVER_BASE}/get_iasi/${encodeURIComponent(name)}`, { headers }); const j = await res.json(); if(j.ok){ DATA.events[name] = j.data || j; toast('Recargado desde servidor: '+name,'info'); await render(); } else toast('Error recargando: '+(j.error||res.statusText),'error'); }
-  catch(e){ toast('Error de red recargando índice: '+e.message,'error'); }
+  try{ Spinner.show(); const changed = await syncEvent(name); toast((changed?'Recargado desde servidor: ':'Sin cambios en servidor: ')+name,'info'); if(changed) await render(); }
+  catch(e){ toast('Error recargando índice: '+e.message,'error'); }
   finally{ Spinner.hide(); }
 }
 
 // Init on load
 window.addEventListener('DOMContentLoaded', async () => { initMap(); attachUI(); await render(); });
 
-// Server status polling
+function showInboxStatus(st){
+  let el=document.getElementById('serverStatus');
+  if(!el){ el=document.createElement('div'); el.id='serverStatus'; document.querySelector('.toolbar').appendChild(el); }
+  el.textContent = `inbox: processed=${st.processed||0} invalid=${st.invalid||0} queued=${st.queued||0}`;
+}
+
+function setServerIndicator(color){ const t=document.getElementById('serverToken'); if(t) t.style.borderColor = color; }
+
+// Server status polling (fallback when the /events SSE stream is unavailable)
 async function pollServerStatus(){
-  const base = 'http://127.0.0.1:5001';
   try{
-    const h = await fetch(base + '/health');
-    if(h.ok){ document.getElementById('serverToken').style.borderColor = '#8be989'; }
-    else { document.getElementById('serverToken').style.borderColor = '#ffd36a'; }
-  }catch(e){ document.getElementById('serverToken').style.borderColor = '#ff7b72'; }
+    const h = await fetch(SERVER_BASE + '/health');
+    setServerIndicator(h.ok ? '#8be989' : '#ffd36a');
+  }catch(e){ setServerIndicator('#ff7b72'); }
   try{
     const headers = buildAuthHeaders();
-    const s = await fetch(base + '/status', { headers });
-    if(s.ok){ const j = await s.json(); if(j.ok && j.status){ const st=j.status; let el=document.getElementById('serverStatus'); if(!el){ el=document.createElement('div'); el.id='serverStatus'; document.querySelector('.toolbar').appendChild(el);} el.textContent = `inbox: processed=${st.processed||0} invalid=${st.invalid||0} queued=${st.queued||0}`; }
-    }
+    const s = await fetch(SERVER_BASE + '/status', { headers });
+    if(s.ok){ const j = await s.json(); if(j.ok && j.status) showInboxStatus(j.status); }
+  }catch(e){ /* ignore */ }
+  // pick up new days for the selected event (only events that came from the server carry a version)
+  try{
+    const name = document.getElementById('eventSelect').value;
+    if(name && DATA.events[name] && DATA.events[name]._version!=null && await syncEvent(name)) await render();
   }catch(e){ /* ignore */ }
 }
-setInterval(pollServerStatus, 10000);
-setTimeout(pollServerStatus, 2000);
+
+let pollTimer = null;
+function startPolling(){
+  if(pollTimer) return;
+  pollTimer = setInterval(pollServerStatus, 10000);
+  setTimeout(pollServerStatus, 2000);
+}
+
+// Push channel: job lifecycle (queued/ingested/scored/published), inbox status and IASi state changes
+let eventSource = null;
+function connectEvents(){
+  if(typeof EventSource === 'undefined') return startPolling();
+  if(eventSource) eventSource.close();
+  const tok = (document.getElementById('serverToken')||{}).value || '';
+  let opened = false, failures = 0;
+  eventSource = new EventSource(`${SERVER_BASE}/events?token=${encodeURIComponent(tok.trim())}`);
+  eventSource.onopen = () => { opened = true; failures = 0; setServerIndicator('#8be989'); if(pollTimer){ clearInterval(pollTimer); pollTimer=null; } };
+  eventSource.onerror = () => {
+    setServerIndicator('#ff7b72');
+    // the browser retries on its own; give up on SSE only if it never connected
+    if(!opened && ++failures >= 3){ eventSource.close(); eventSource = null; startPolling(); }
+  };
+  const parse = (e) => { try{ return JSON.parse(e.data); }catch(_){ return {}; } };
+  eventSource.addEventListener('status', e => showInboxStatus(parse(e)));
+  eventSource.addEventListener('queued', e => { const d=parse(e); toast(`Carga en cola: ${d.event}`,'info'); });
+  eventSource.addEventListener('failed', e => { const d=parse(e); toast(`Error procesando ${d.event}: ${d.error||''}`,'error'); });
+  eventSource.addEventListener('state', e => {
+    const d=parse(e);
+    if(d.from) toast(`${d.event}: ${d.from} → ${d.to} (IASi ${fmt(d.iasi,2)})`, d.to==='Alerta'?'error':'info', 8000);
+  });
+  eventSource.addEventListener('published', async e => {
+    const d=parse(e); const sel=document.getElementById('eventSelect');
+    if(!Array.from(sel.options).some(o=>o.value===d.event)) sel.add(new Option(d.event,d.event));
+    const cur = DATA.events[d.event];
+    if(cur && cur._version!=null && cur._version!==d.version){
+      try{ if(await syncEvent(d.event) && sel.value===d.event) await render(); }catch(_){ /* ignore */ }
+    }
+  });
+}
+window.addEventListener('DOMContentLoaded', () => {
+  connectEvents();
+  const t=document.getElementById('serverToken'); if(t) t.addEventListener('change', connectEvents);
+});
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+aoi_index.py
+In-memory spatial index over the AOI files (config/aoi_*.geojson): one prepared
+shapely geometry per file under an STRtree, keyed by the repo-relative path used
+as aoi_path in the event catalog (e.g. config/aoi_maule.geojson).
+
+Only the changed file is re-parsed on update() (called by /upload_aoi); the tree
+itself is immutable in shapely 2, so it is rebuilt lazily from the cached
+geometries on the next query, which is cheap even for hundreds of AOIs.
+
+Used by upload_server.py (/list_indices?bbox=, /nearest) and by run_eval_batch.py
+to assign earthquakes of a shared catalog to event AOIs when labeling.
+
+Usage:
+  python scripts/aoi_index.py nearest -35.0 -72.5 [-k 3]
+  python scripts/aoi_index.py bbox -76 -40 -70 -30
+"""
+import argparse
+import json
+import math
+import threading
+from pathlib import Path
+
+import numpy as np
+import shapely
+from shapely.geometry import box, shape
+from shapely.ops import nearest_points, unary_union
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_DIR = ROOT / 'config'
+EARTH_R_KM = 6371.0088
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def load_geometry(path):
+    gj = json.loads(Path(path).read_text(encoding='utf-8'))
+    if gj.get('type') == 'FeatureCollection':
+        geoms = [shape(f['geometry']) for f in gj.get('features') or [] if f.get('geometry')]
+    elif gj.get('type') == 'Feature':
+        geoms = [shape(gj['geometry'])]
+    else:
+        geoms = [shape(gj)]
+    if not geoms:
+        raise ValueError(f'AOI sin geometrías: {path}')
+    g = geoms[0] if len(geoms) == 1 else unary_union(geoms)
+    shapely.prepare(g)
+    return g
+
+
+def aoi_key(path):
+    p = Path(path).resolve()
+    try:
+        return p.relative_to(ROOT).as_posix()
+    except ValueError:
+        return str(p)
+
+
+class AOIIndex:
+    def __init__(self, cfg_dir=CFG_DIR, pattern='aoi_*.geojson', logger=None):
+        self.cfg_dir = Path(cfg_dir)
+        self.pattern = pattern
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._entries = {}      # key -> (mtime_ns, geometry)
+        self._tree = None
+        self._keys = []
+        self._geoms = []
+        self.load()
+
+    def load(self):
+        for p in sorted(self.cfg_dir.glob(self.pattern)):
+            self.update(p)
+        return len(self._entries)
+
+    def update(self, path):
+        """(Re)load one AOI file; returns False if it could not be parsed."""
+        path = Path(path)
+        key = aoi_key(path)
+        try:
+            mtime = path.stat().st_mtime_ns
+            with self._lock:
+                cur = self._entries.get(key)
+                if cur and cur[0] == mtime:
+                    return True
+            geom = load_geometry(path)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning('AOI index: could not load %s: %s', path, e)
+            self.remove(path)
+            return False
+        with self._lock:
+            self._entries[key] = (mtime, geom)
+            self._tree = None
+        return True
+
+    def remove(self, path):
+        with self._lock:
+            if self._entries.pop(aoi_key(path), None) is not None:
+                self._tree = None
+
+    def _index(self):
+        with self._lock:
+            if self._tree is None:
+                self._keys = list(self._entries)
+                self._geoms = [self._entries[k][1] for k in self._keys]
+                self._tree = shapely.STRtree(self._geoms)
+            return self._tree, self._keys, self._geoms
+
+    def __len__(self):
+        return len(self._entries)
+
+    def geometry(self, key):
+        e = self._entries.get(key)
+        return e[1] if e else None
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """Keys of AOIs intersecting the bbox."""
+        tree, keys, _ = self._index()
+        return [keys[i] for i in tree.query(box(minx, miny, maxx, maxy), predicate='intersects')]
+
+    def covering(self, lon, lat):
+        """Keys of AOIs whose geometry contains (or touches) the point."""
+        tree, keys, _ = self._index()
+        return [keys[i] for i in tree.query(shapely.Point(lon, lat), predicate='intersects')]
+
+    def _distances(self, lon, lat, idx, geoms):
+        pt = shapely.Point(lon, lat)
+        out = []
+        for i in idx:
+            q = nearest_points(geoms[i], pt)[0]
+            out.append((float(haversine_km(lon, lat, q.x, q.y)), int(i)))
+        return out
+
+    def nearest(self, lon, lat, k=1):
+        """[(key, distance_km)] of the k AOIs closest to (lon, lat); 0 km if inside."""
+        tree, keys, geoms = self._index()
+        if not keys or k <= 0:
+            return []
+        k = min(k, len(keys))
+        r = 0.5
+        while True:
+            idx = tree.query(box(lon - r, lat - r, lon + r, lat + r))
+            if len(idx) >= k or r >= 360:
+                found = sorted(self._distances(lon, lat, idx, geoms))
+                # anything outside the box is at least as far as the box half-width (in km)
+                lat_edge = min(89.9, abs(lat) + r)
+                reach_km = r * min(110.574, 111.320 * math.cos(math.radians(lat_edge)))
+                if len(found) >= k and (found[k - 1][0] <= reach_km or r >= 360):
+                    return [(keys[i], round(d, 3)) for d, i in found[:k]]
+            r *= 4
+
+    def assign(self, lons, lats, max_km=0.0):
+        """For each point, the AOI keys within max_km (0: only AOIs containing it)."""
+        tree, keys, geoms = self._index()
+        out = []
+        for lon, lat in zip(lons, lats):
+            if max_km <= 0:
+                out.append(self.covering(lon, lat))
+                continue
+            r = max_km / (111.320 * max(math.cos(math.radians(min(89.9, abs(lat)))), 1e-6))
+            idx = tree.query(box(lon - r, lat - max_km / 110.574, lon + r, lat + max_km / 110.574))
+            out.append([keys[i] for d, i in self._distances(lon, lat, idx, geoms) if d <= max_km])
+        return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Consultas espaciales sobre config/aoi_*.geojson')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    nn = sub.add_parser('nearest')
+    nn.add_argument('lat', type=float)
+    nn.add_argument('lon', type=float)
+    nn.add_argument('-k', type=int, default=3)
+    bb = sub.add_parser('bbox')
+    for c in ('minx', 'miny', 'maxx', 'maxy'):
+        bb.add_argument(c, type=float)
+    args = ap.parse_args()
+    idx = AOIIndex()
+    if args.cmd == 'nearest':
+        for key, d in idx.nearest(args.lon, args.lat, args.k):
+            print(f'{d:10.3f} km\t{key}')
+    else:
+        for key in idx.query_bbox(args.minx, args.miny, args.maxx, args.maxy):
+            print(key)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+backtest.py
+Rolling-origin (walk-forward) backtest of the IASi blend.
+
+evaluate_timeline_metrics() picks best_threshold on the very timeline it scores,
+so its numbers are in-sample. Here, for every event and every origin t
+(each --step-days after --min-train-days of history):
+  1. calibrate on the past: the days of all events whose label is already known
+     at t (date + window_days < t). Weights are chosen among --candidates random
+     points of the simplex plus the configured weights.yaml blend, by AUC-PR;
+     then the threshold by F1 on the grid of best_threshold_f1();
+  2. score the next --horizon-days of the event with those weights/threshold.
+Per-origin metrics go to outputs/backtest/origins.csv, pooled out-of-sample
+metrics (all horizons concatenated; with --step-days < --horizon-days a day
+counts once per origin covering it) and the in-sample reference to
+outputs/backtest/summary.json.
+
+The transformed components (one per registry component, per day) come from the same join as
+run_eval_batch.py and are cached in outputs/cache/components/<event>.npz, keyed
+by the size/mtime of every input file, so a re-backtest reads no CSVs unless an
+input changed. Workers receive the component arrays once (pool initializer) and
+then only origins. Origins sit on a calendar grid shared by all events, so each
+one is calibrated once and scores every event covering it; all candidate weights
+are scored with one matrix product and vectorized AUC-PR / F1. --budget-s stops
+scheduling origins (newest first) once the time budget is spent. Calibrations
+are cached by a hash of the past data they saw, so a daily re-backtest only
+calibrates the origins whose history changed (normally just the new ones).
+
+Usage:
+  python scripts/backtest.py --window-days 14 --horizon-days 30 --step-days 30 --workers 4
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from bootstrap_ci import auc_pr_rows, f1_rows, false_alarms_rows, lead_time_rows
+from telemetry import stage, write_run_summary
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / 'outputs' / 'cache' / 'components'
+OUT_DIR = ROOT / 'outputs' / 'backtest'
+CALIB_CACHE = ROOT / 'outputs' / 'cache' / 'backtest_calibrations.json'
+THR_GRID = np.round(np.arange(30, 86) / 100, 2)   # best_threshold_f1 default grid
+
+_DATA = None
+
+
+def _fingerprint(paths):
+    h = hashlib.sha256()
+    for p in paths:
+        p = Path(p)
+        st = p.stat() if p.exists() else None
+        h.update(f'{p}|{st.st_size if st else -1}|{st.st_mtime_ns if st else -1}\n'.encode())
+    return h.hexdigest()
+
+
+def event_inputs(reb, ev):
+    files = [ch.path(ev) for ch in reb.REGISTRY.channels]
+    files += [reb.CAT_DIR / f"{ev['name']}.csv", reb.SHARED_CATALOG, ROOT / ev['aoi'],
+              reb.CFG / 'zscore.yaml', reb.CFG / 'join.yaml', reb.CFG / 'channels.yaml']
+    return files
+
+
+def event_components(ev, window_days, cache_dir=CACHE_DIR):
+    """(days int64, X (n, components), y) for one event; cached by input fingerprint."""
+    import run_eval_batch as reb
+    key = _fingerprint(event_inputs(reb, ev))
+    cache = Path(cache_dir) / f"{ev['name']}.npz"
+    lab = f'y{window_days}'
+    if cache.exists():
+        with np.load(cache) as z:
+            if str(z['key']) == key and lab in z:
+                return z['days'], z['X'], z[lab]
+    join = reb.event_join(ev)
+    days = join.days
+    X = reb.score_join(join)[0].T
+    cat = reb.load_eq_catalog(reb.eq_catalog_for(ev['name'], ev['aoi']), mw_min=6.5)
+    dates = reb.parse_times(join.dates())
+    y = np.asarray(reb.labels_from_catalog(dates, cat, window_days), dtype=bool)
+    extra = {}
+    if cache.exists():
+        with np.load(cache) as z:
+            if str(z['key']) == key:
+                extra = {k: z[k] for k in z.files if k.startswith('y')}
+    extra[lab] = y
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(cache, key=np.array(key), days=days, X=X, **extra)
+    return days, X, y
+
+
+def candidate_weights(n, base, seed=0):
+    """(n + 1, components): the configured blend first, then Dirichlet(1) samples."""
+    rng = np.random.default_rng(seed)
+    base = np.asarray(base, dtype=np.float64)
+    return np.vstack([base[None, :], rng.dirichlet(np.ones(len(base)), size=n)])
+
+
+def calibrate(X, y, W, base_thr):
+    """(weight row, threshold, in-sample AUC-PR) chosen on (X, y)."""
+    if not y.any():
+        return 0, base_thr, float('nan')
+    S = X @ W.T                                           # (days, candidates)
+    order = np.argsort(-S, axis=0, kind='stable')
+    auc = auc_pr_rows(y[order].T.astype(np.int8))
+    best = int(np.argmax(auc))
+    s = S[:, best]
+    f1 = f1_rows(np.broadcast_to(y, (len(THR_GRID), len(y))), s[None, :] >= THR_GRID[:, None])
+    return best, float(THR_GRID[int(np.argmax(f1))]), float(auc[best])
+
+
+def _init(data, W, base_thr, window_days):
+    global _DATA
+    _DATA = (data, W, base_thr, window_days)
+
+
+def calibration_key(origin):
+    """Hash of what the calibration at origin depends on: candidates and known past days."""
+    data, W, _, window_days = _DATA
+    cut = origin - window_days
+    h = hashlib.sha256(W.tobytes() + f'|{cut}'.encode())
+    for name in sorted(data):
+        days, X, y = data[name]
+        m = days < cut
+        h.update(name.encode() + X[m].tobytes() + y[m].tobytes())
+    return h.hexdigest()
+
+
+def run_origin(origin, names, horizon, calib=None):
+    """Calibrate once on everything known before origin (unless calib is given), then
+    score the next horizon days of each event in names. Returns (records, calib)."""
+    data, W, base_thr, window_days = _DATA
+    cut = origin - window_days
+    past_y = np.concatenate([d[2][d[0] < cut] for d in data.values()])
+    if calib is None:
+        past_X = np.concatenate([d[1][d[0] < cut] for d in data.values()])
+        calib = calibrate(past_X, past_y, W, base_thr)
+    wi, thr, auc_in = calib
+    out = []
+    for name in names:
+        days, X, y = data[name]
+        test = (days >= origin) & (days < origin + horizon)
+        s = X[test] @ W[wi]
+        yt = y[test]
+        rec = {'event': name, 'origin': str(np.datetime64(int(origin), 'D')), 'train_days': int(len(past_y)),
+               'train_pos': int(past_y.sum()), 'test_days': int(test.sum()), 'test_pos': int(yt.sum()),
+               'weights': [round(float(v), 4) for v in W[wi]], 'configured': wi == 0, 'threshold': thr,
+               'auc_pr_train': None if np.isnan(auc_in) else round(auc_in, 4)}
+        rec.update(metrics(yt, s, thr))
+        rec['scores'] = s
+        rec['labels'] = yt
+        out.append(rec)
+    return out, calib
+
+
+def metrics(y, s, thr):
+    import run_eval_batch as reb
+    per_day = reb.PER_DAY          # timeline rows per day (hour resolution: 24)
+    if not len(y):
+        return {'auc_pr': None, 'f1': None, 'brier': None, 'false_alarm_pm': None, 'lead_time_days': None}
+    y = np.asarray(y, dtype=bool)
+    s = np.asarray(s, dtype=np.float64)
+    thr = np.broadcast_to(np.asarray(thr, dtype=np.float64), s.shape)
+    yhat = (s >= thr)[None, :]
+    order = np.argsort(-s, kind='stable')
+    return {
+        'auc_pr': round(float(auc_pr_rows(y[order][None, :].astype(np.int8))[0]), 4),
+        'f1': round(float(f1_rows(y[None, :], yhat)[0]), 4),
+        'brier': round(float(((y - s) ** 2).mean()), 4),
+        'false_alarm_pm': round(float(false_alarms_rows(y[None, :], yhat, max(1.0, len(y) / per_day / 30.4375))[0]), 3),
+        'lead_time_days': round(float(lead_time_rows(y[None, :], yhat)[0]) / per_day, 2),
+    }
+
+
+def origins_for(days, min_train, step, horizon):
+    """Origins on a calendar grid shared by all events (multiples of step days since
+    1970-01-01), so events with overlapping spans share the calibration of an origin."""
+    if not len(days):
+        return []
+    start, end = int(days[0]) + min_train, int(days[-1]) - horizon + 1
+    first = -(-start // step) * step
+    return list(range(first, end + 1, step))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Backtest con origen móvil (walk-forward)')
+    ap.add_argument('--window-days', type=int, default=14, help='Ventana de etiquetas (sismo en los próximos N días)')
+    ap.add_argument('--horizon-days', type=int, default=30)
+    ap.add_argument('--step-days', type=int, default=30)
+    ap.add_argument('--min-train-days', type=int, default=180)
+    ap.add_argument('--candidates', type=int, default=256, help='Combinaciones de pesos evaluadas por origen')
+    ap.add_argument('--workers', type=int, default=None)
+    ap.add_argument('--budget-s', type=float, default=None, help='Tiempo máximo; los orígenes más antiguos se omiten')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('-e', '--event', action='append')
+    args = ap.parse_args()
+    t_start = time.perf_counter()
+    import run_eval_batch as reb
+    events = [ev for ev in reb.EVENTS if not args.event or ev['name'] in args.event]
+    with stage('load') as st:
+        data = {ev['name']: event_components(ev, args.window_days) for ev in events}
+        data = {n: d for n, d in data.items() if len(d[0])}
+        st.rows = sum(len(d[0]) for d in data.values())
+    W = candidate_weights(args.candidates, reb.KERNEL.weights, args.seed)
+    by_origin = {}
+    for n, d in data.items():
+        for o in origins_for(d[0], args.min_train_days, args.step_days, args.horizon_days):
+            by_origin.setdefault(o, []).append(n)
+    tasks = sorted(by_origin.items(), key=lambda t: -t[0])   # newest origins first under a budget
+    # calibrations already computed on identical past data (e.g. yesterday's run) are reused
+    _init(data, W, reb.TH['alert'], args.window_days)
+    cached = {}
+    if CALIB_CACHE.exists():
+        cached = json.loads(CALIB_CACHE.read_text(encoding='utf-8'))
+    keys = {o: calibration_key(o) for o, _ in tasks}
+    results, skipped = [], 0
+    for o, names in tasks:
+        if keys[o] in cached:
+            results += run_origin(o, names, args.horizon_days, tuple(cached[keys[o]]))[0]
+    reused = len(tasks)
+    tasks = [t for t in tasks if keys[t[0]] not in cached]
+    reused -= len(tasks)
+    workers = args.workers or min(len(tasks) or 1, os.cpu_count() or 1)
+    with stage('backtest') as st:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=(data, W, reb.TH['alert'], args.window_days)) as pool:
+            pending = set()
+            it = iter(tasks)
+            for t in it:
+                pending.add(pool.submit(run_origin, t[0], t[1], args.horizon_days))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    recs, calib = f.result()
+                    results += recs
+                    cached[keys[int(np.datetime64(recs[0]['origin'], 'D').astype(np.int64))]] = list(calib)
+                over = args.budget_s is not None and time.perf_counter() - t_start > args.budget_s
+                for t in it:
+                    if over:
+                        skipped += 1
+                        continue
+                    pending.add(pool.submit(run_origin, t[0], t[1], args.horizon_days))
+                    if len(pending) >= workers * 2:
+                        break
+        st.rows = len(results)
+    results.sort(key=lambda r: (r['event'], r['origin']))
+    pooled_y = np.concatenate([r['labels'] for r in results] or [np.empty(0, bool)])
+    pooled_s = np.concatenate([r['scores'] for r in results] or [np.empty(0)])
+    pooled_t = np.concatenate([np.full(len(r['scores']), r['threshold']) for r in results] or [np.empty(0)])
+    # in-sample reference: configured weights, threshold picked on the same days
+    insample = {}
+    if results:
+        allX = np.concatenate([d[1] for d in data.values()])
+        ally = np.concatenate([d[2] for d in data.values()])
+        s_in = allX @ W[0]
+        f1 = f1_rows(np.broadcast_to(ally, (len(THR_GRID), len(ally))), s_in[None, :] >= THR_GRID[:, None])
+        thr_in = float(THR_GRID[int(np.argmax(f1))])
+        insample = {**metrics(ally, s_in, thr_in), 'threshold': thr_in}
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    CALIB_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    CALIB_CACHE.write_text(json.dumps(cached), encoding='utf-8')
+    cols = ['event', 'origin', 'train_days', 'train_pos', 'test_days', 'test_pos', 'threshold', 'configured',
+            'auc_pr_train', 'auc_pr', 'f1', 'brier', 'false_alarm_pm', 'lead_time_days']
+    # weights.yaml keys (alpha, beta, ...) where the registry names one
+    wcols = [w if isinstance(w, str) else f'w_{c}' for c, w in
+             ((c, reb.REGISTRY.weight_spec(c)) for c in reb.COMPONENTS)]
+    with (OUT_DIR / 'origins.csv').open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(cols + wcols)
+        for r in results:
+            w.writerow([r[c] if c in r else '' for c in cols] + r['weights'])
+    elapsed = time.perf_counter() - t_start
+    summary = {
+        'params': vars(args), 'events': sorted(data), 'origins': len(results), 'skipped_by_budget': skipped,
+        'runtime_s': round(elapsed, 3), 'workers': workers, 'calibrations_reused': reused,
+        'pooled_out_of_sample': {**metrics(pooled_y, pooled_s, pooled_t), 'days': int(len(pooled_y)),
+                                 'positives': int(pooled_y.sum())},
+        'in_sample_reference': insample,
+    }
+    (OUT_DIR / 'summary.json').write_text(json.dumps(summary, indent=2), encoding='utf-8')
+    write_run_summary('backtest', {'origins': len(results), 'skipped_by_budget': skipped})
+    print(f"{len(results)} orígenes x eventos en {elapsed:.2f}s: {len(tasks) - skipped} calibraciones nuevas "
+          f"({workers} procesos), {reused} reutilizadas, {skipped} omitidas por presupuesto")
+    print('fuera de muestra (agregado):', summary['pooled_out_of_sample'])
+    print('referencia dentro de muestra:', insample)
+
+
+if __name__ == '__main__':
+    main()
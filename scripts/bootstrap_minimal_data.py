@@ -54,7 +54,7 @@ def fetch_usgs_catalog(bbox=None, starttime='1900-01-01', endtime='2025-12-31',
     return r.json()
 
 def usgs_to_csv(json_gj, out_path):
-    # Extrae date,mw
+    # Extrae date,mw,lat,lon,depth (lat/lon permiten asignar sismos a AOIs al etiquetar)
     features = json_gj.get('features', [])
     rows = []
     for f in features:
@@ -64,12 +64,13 @@ def usgs_to_csv(json_gj, out_path):
         dt = datetime.utcfromtimestamp(t/1000).strftime('%Y-%m-%d')
         mw = props.get('mag')
         if mw is None: continue
-        rows.append((dt, mw))
-    rows = sorted(set(rows))
+        coords = (f.get('geometry') or {}).get('coordinates') or [None, None, None]
+        rows.append((dt, mw, coords[1], coords[0], coords[2] if len(coords) > 2 else None))
+    rows = sorted(set(rows), key=lambda r: (r[0], r[1]))
     with out_path.open('w', encoding='utf-8', newline='') as f:
         import csv as _csv
         w = _csv.writer(f)
-        w.writerow(['date','mw'])
+        w.writerow(['date','mw','lat','lon','depth'])
         for r in rows:
             w.writerow(r)
 
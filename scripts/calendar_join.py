@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+calendar_join.py
+Cadence-aware join of the channel tables of an event (the channels of
+config/channels.yaml) on a dense calendar held as numpy arrays.
+
+The time axis is int64 epoch seconds (timebase.py) at the resolution of
+config/join.yaml (resolution: day | hour; observations may carry ISO timestamps
+and fall in the calendar unit that contains them). The calendar runs from the
+first to the last observed unit of any channel with a fixed step (step, in
+units of the resolution; step_days is still read at day resolution). For every
+channel the last observation at or before each calendar point is found with a
+vectorized forward fill (np.maximum.accumulate over the observation index
+scattered on the calendar), so the whole join is O(points x channels) with no
+per-point Python loop. Alongside the index, each channel gets:
+
+  age[c, t]     calendar units (days or hours) since the observation in force (-1: none yet)
+  weight[c, t]  1 while the age is <= max_age_days; beyond that 0 (mode: drop) or
+                0.5 ** ((age_days - max_age_days) / half_life_days) (mode: decay)
+
+so a single InSAR acquisition stops feeding D' after a couple of revisits
+instead of forever, while daily sensors go stale within days. The scoring
+kernel (channels.py) multiplies each transformed component by its weight. A
+dropped channel reads as missing (column() gives NaN, rows() None), as before
+the first observation.
+
+A channel table is either a signal_table.SignalTable (its parsed date index and
+typed columns are used directly) or a list of dict rows. Observations with an
+empty or unparseable date are left out of the join (with a warning).
+
+Usage:
+  python scripts/calendar_join.py bench --days 36500 --obs 20000
+  python scripts/calendar_join.py bench --days 3650 --resolution hour
+  python scripts/calendar_join.py check
+"""
+import argparse
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from signal_table import SignalTable
+from timebase import DAY_S, RESOLUTIONS, floor, format_times, valid_epoch
+
+log = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_PATH = ROOT / 'config' / 'join.yaml'
+# used when config/join.yaml is missing or leaves a channel out: no staleness limit
+FOREVER = {'max_age_days': None, 'mode': 'drop', 'half_life_days': None}
+
+
+def load_config(path=CFG_PATH):
+    """(resolution, step, {channel: {'max_age_days', 'mode', 'half_life_days'}}); channels not listed use FOREVER."""
+    p = Path(path)
+    cfg = (yaml.safe_load(p.read_text(encoding='utf-8')) or {}) if p.exists() else {}
+    resolution = str(cfg.get('resolution', 'day'))
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'join.yaml: resolution debe ser una de {tuple(RESOLUTIONS)}, no {resolution!r}')
+    channels = {s: {**FOREVER, **(c or {})} for s, c in (cfg.get('channels') or {}).items()}
+    for s, c in channels.items():
+        if c['mode'] not in ('drop', 'decay'):
+            raise ValueError(f"join.yaml {s}: mode debe ser drop o decay, no {c['mode']!r}")
+    step = cfg.get('step', cfg.get('step_days', 1) if resolution == 'day' else 1)
+    return resolution, int(step), channels
+
+
+def staleness(age_days, cfg):
+    """Weight of observations age_days old under a channel's join.yaml settings: 1 up to
+    max_age_days, then 0 (mode: drop) or 0.5 ** ((age - max_age_days) / half_life_days) (mode: decay)."""
+    age = np.asarray(age_days, dtype=np.float64)
+    w = np.ones(age.shape)
+    max_age = cfg['max_age_days']
+    if max_age is None:
+        return w
+    old = age > max_age
+    if cfg['mode'] == 'decay' and cfg['half_life_days']:
+        return np.where(old, 0.5 ** ((age - max_age) / float(cfg['half_life_days'])), w)
+    w[old] = 0.0
+    return w
+
+
+def _times(rows, resolution):
+    """(t, ok): epoch seconds of each row's date / timestamp truncated to the calendar unit,
+    and False where the date is missing or unparseable."""
+    t, ok = valid_epoch([r.get('date') or '' for r in rows])
+    return floor(t, resolution), ok
+
+
+def _num(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class DenseJoin:
+    """Channel tables forward-filled on a dense calendar; see the module docstring."""
+
+    def __init__(self, tables, step=None, channels=None, resolution=None):
+        cfg = load_config() if step is None or channels is None or resolution is None else (None, None, None)
+        self.resolution = resolution or cfg[0]
+        self.step = int(step or cfg[1])
+        channels = channels or cfg[2]
+        self.unit = RESOLUTIONS[self.resolution]
+        step_s = self.step * self.unit
+        self.slots = list(tables)
+        self.tables = {}
+        obs_t = {}
+        for s in self.slots:
+            tab = tables[s]
+            if isinstance(tab, SignalTable):
+                ok = tab.valid
+                if not ok.all():
+                    tab = tab.take(ok)
+                d = floor(tab.t, self.resolution)
+                order = np.argsort(d, kind='stable')
+                self.tables[s] = tab if bool(np.all(order[1:] > order[:-1])) else tab.take(order)
+            else:
+                rows = list(tab or [])
+                d, ok = _times(rows, self.resolution)
+                if not ok.all():
+                    rows, d = [r for r, k in zip(rows, ok) if k], d[ok]
+                order = np.argsort(d, kind='stable')
+                self.tables[s] = [rows[i] for i in order]
+            if not ok.all():
+                log.warning('canal %s: %d observaciones con fecha vacía o inválida omitidas', s, int((~ok).sum()))
+            obs_t[s] = d[order]
+        present = [d for d in obs_t.values() if len(d)]
+        if present:
+            start = min(int(d[0]) for d in present)
+            end = max(int(d[-1]) for d in present)
+            n = -(-(end - start) // step_s) + 1
+        else:
+            start, n = 0, 0
+        self.t = start + step_s * np.arange(n, dtype=np.int64)
+        shape = (len(self.slots), n)
+        self.index = np.full(shape, -1, dtype=np.int64)
+        self.age = np.full(shape, -1, dtype=np.int64)
+        self.weight = np.zeros(shape, dtype=np.float64)
+        for c, s in enumerate(self.slots):
+            d = obs_t[s]
+            if not len(d):
+                continue
+            # calendar point from which each observation is visible (first point >= its unit)
+            pos = -(-(d - start) // step_s)
+            idx = np.full(n, -1, dtype=np.int64)
+            np.maximum.at(idx, pos, np.arange(len(d), dtype=np.int64))
+            idx = np.maximum.accumulate(idx)
+            has = idx >= 0
+            age_s = np.where(has, self.t - d[np.maximum(idx, 0)], -self.unit)
+            age = age_s / DAY_S
+            cfg = channels.get(s, FOREVER)
+            w = np.where(has, staleness(age, cfg), 0.0)
+            if cfg['max_age_days'] is not None and not (cfg['mode'] == 'decay' and cfg['half_life_days']):
+                idx = np.where(age > cfg['max_age_days'], -1, idx)
+            self.index[c], self.age[c], self.weight[c] = idx, age_s // self.unit, w
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def days(self):
+        """Day number (days since 1970-01-01) of each calendar point."""
+        return self.t // DAY_S
+
+    @property
+    def per_day(self):
+        """Calendar points per day."""
+        return DAY_S / (self.step * self.unit)
+
+    def dates(self):
+        """Calendar point labels (timebase.format_times: YYYY-MM-DD or YYYY-MM-DDTHH:MM)."""
+        return format_times(self.t, self.resolution)
+
+    def column(self, slot, col):
+        """Float value of col in force on each calendar point (NaN: none, dropped or not a number)."""
+        c = self.slots.index(slot)
+        tab = self.tables[slot]
+        if isinstance(tab, SignalTable):
+            vals = np.append(tab.float_column(col), np.nan)
+        else:
+            vals = np.array([_num(r.get(col)) for r in tab] + [np.nan], dtype=np.float64)
+        return vals[self.index[c]]    # index -1 picks the trailing NaN
+
+    def columns(self, inputs):
+        """{(slot, col): column()} for (slot, col) pairs whose slot is in the join."""
+        return {(s, col): self.column(s, col) for s, col in inputs if s in self.slots}
+
+    def rows(self):
+        """join_by_date-style rows: {'date', <slot>: source row or None, 'age': {...}, 'w': {...}}."""
+        dates = self.dates()
+        cols = [(s, self.tables[s], self.index[c].tolist(), self.age[c].tolist(), self.weight[c].tolist())
+                for c, s in enumerate(self.slots)]
+        out = []
+        for t in range(len(dates)):
+            r = {'date': str(dates[t]), 'age': {}, 'w': {}}
+            for s, tab, idx, age, w in cols:
+                i = idx[t]
+                r[s] = tab[i] if i >= 0 else None
+                r['age'][s] = age[t]
+                r['w'][s] = w[t]
+            out.append(r)
+        return out
+
+
+def cmd_bench(args):
+    rng = np.random.default_rng(0)
+    start = np.datetime64('1950-01-01T00:00', 's')
+    per_day = DAY_S // RESOLUTIONS[args.resolution]
+    tables = {}
+    for s, every in zip(('A', 'R', 'D', 'G', 'M', 'S'), (1, 1, 12, 1, 1, 1)):
+        k = min(args.obs, args.days // every)
+        d = np.sort(rng.choice(np.arange(0, args.days, every), size=k, replace=False))
+        # sub-daily resolution: observations at a random second of their day
+        sec = d * DAY_S + (rng.integers(0, DAY_S, k) if per_day > 1 else 0)
+        tables[s] = [{'date': str(x)} for x in start + sec]
+    _, _, channels = load_config()
+    t0 = time.perf_counter()
+    j = DenseJoin(tables, 1, channels, args.resolution)
+    dt = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    j.rows()
+    dr = time.perf_counter() - t0
+    print(f'{len(j)} puntos ({args.resolution}) x {len(j.slots)} canales: join {dt * 1000:.1f} ms, '
+          f'filas dict {dr * 1000:.0f} ms')
+
+
+def cmd_check(args):
+    """Regression: empty and malformed dates are dropped instead of breaking the join."""
+    rows = [{'date': '2020-01-03', 'x': '3'}, {'date': '', 'x': '9'}, {'date': '2020-13-01', 'x': '9'},
+            {'x': '9'}, {'date': '2020-01-01', 'x': '1'}]
+    for name, tab in (('filas', rows), ('SignalTable', SignalTable.from_rows(rows))):
+        j = DenseJoin({'A': tab}, 1, {'A': FOREVER}, 'day')
+        got = j.column('A', 'x').tolist()
+        assert j.dates().tolist() == ['2020-01-01', '2020-01-02', '2020-01-03'], (name, j.dates())
+        assert got == [1.0, 1.0, 3.0], (name, got)
+        assert j.index[0].tolist() == [0, 0, 1], (name, j.index)
+    print('OK: fechas vacías / inválidas omitidas (filas y SignalTable)')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Unión de canales en calendario denso con antigüedad de datos')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    be = sub.add_parser('bench')
+    be.add_argument('--days', type=int, default=36500)
+    be.add_argument('--obs', type=int, default=20000)
+    be.add_argument('--resolution', choices=tuple(RESOLUTIONS), default='day')
+    sub.add_parser('check')
+    args = ap.parse_args()
+    {'bench': cmd_bench, 'check': cmd_check}[args.cmd](args)
+
+
+if __name__ == '__main__':
+    main()
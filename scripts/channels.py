@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+channels.py
+Declarative registry of IASi channels (config/channels.yaml).
+
+Each channel declares its source CSV (a shared signal series or one file per
+event), its columns, the transform that turns one observation into a [0, 1]
+component, the IASi component it feeds and its weight, and validation ranges.
+The rest of the pipeline reads the registry instead of naming channels:
+run_eval_batch.py builds and joins the tables of every channel, scores them and
+writes one timeline column per component; export_iasi_json.py, rollups.py,
+validate_inputs.py, learned_scoring.py, backtest.py, uncertainty_bands.py and
+stream_scorer.py follow the same list.
+
+Registry.compile(weights) builds the scoring kernel once: one numpy step per
+channel (transform, staleness weight, max into its component) and one weighted
+sum over components, so N channels cost N vectorized passes over the days. The
+same kernel scores a (days,) timeline or a (samples, days) Monte Carlo block.
+Channel.scalar() is the per-observation version used by the streaming scorer.
+
+Transforms (missing / NaN inputs give 0, as a missing channel in compute_row):
+  clip         clip(x / scale, 0, 1)
+  sigmoid      1 / (1 + exp(-(x - center) / scale))
+  gated_scale  clip(x / scale, 0, 1) if gate >= gate_min else 0
+
+Usage:
+  python scripts/channels.py          # list channels, components and weights
+"""
+import math
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_PATH = ROOT / 'config' / 'channels.yaml'
+TRANSFORMS = ('clip', 'sigmoid', 'gated_scale')
+SCOPES = ('signal', 'event')
+
+_REGISTRIES = {}
+
+
+def to_float(v):
+    """float(v), or NaN for missing / non-numeric values."""
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class Channel:
+    def __init__(self, name, spec):
+        self.name = name
+        self.source = spec['source']
+        self.scope = spec.get('scope', 'signal')
+        self.optional = bool(spec.get('optional', False))
+        self.columns = list(spec.get('columns') or [])
+        self.numeric = list(spec.get('numeric') or [])
+        self.component = str(spec.get('component', name))
+        self.weight = spec.get('weight', 0.0)
+        self.validate = {c: tuple(r) for c, r in (spec.get('validate') or {}).items()}
+        t = dict(spec['transform'])
+        self.kind = t.pop('kind')
+        if self.scope not in SCOPES:
+            raise ValueError(f'canal {name}: scope debe ser uno de {SCOPES}')
+        if self.kind not in TRANSFORMS:
+            raise ValueError(f'canal {name}: transform debe ser uno de {TRANSFORMS}')
+        self.column = t['column']
+        self.scale = float(t.get('scale', 1.0))
+        self.center = float(t.get('center', 0.0))
+        self.gate = t.get('gate')
+        self.gate_min = float(t.get('gate_min', 0.0))
+        if self.kind == 'gated_scale' and not self.gate:
+            raise ValueError(f'canal {name}: gated_scale necesita gate')
+
+    @property
+    def inputs(self):
+        """Columns read by the transform."""
+        return (self.column, self.gate) if self.kind == 'gated_scale' else (self.column,)
+
+    def path(self, ev=None):
+        """Source CSV; event channels fill {name}, {feat}, ... from the event dict."""
+        src = self.source.format(**ev) if self.scope == 'event' else self.source
+        return ROOT / src
+
+    def vector(self, x, g=None):
+        """Transformed component of input array x (gate array g for gated_scale)."""
+        if self.kind == 'sigmoid':
+            with np.errstate(over='ignore'):
+                v = 1.0 / (1.0 + np.exp(-(np.nan_to_num(x) - self.center) / self.scale))
+            return np.where(np.isnan(x), 0.0, v)
+        v = np.where(np.isnan(x), 0.0, np.clip(np.nan_to_num(x) / self.scale, 0.0, 1.0))
+        if self.kind == 'gated_scale':
+            v = np.where(np.isnan(g) | (np.nan_to_num(g) < self.gate_min), 0.0, v)
+        return v
+
+    def scalar(self, obs):
+        """Transformed component of one observation dict (raises KeyError / ValueError if invalid).
+        Single-input channels also accept the value under 'value'."""
+        x = obs.get(self.column, obs.get('value')) if self.kind != 'gated_scale' else obs[self.column]
+        x = float(x)
+        if self.kind == 'sigmoid':
+            z = -(x - self.center) / self.scale
+            return 1.0 / (1.0 + math.exp(z)) if z < 700 else 0.0
+        if self.kind == 'gated_scale' and float(obs[self.gate]) < self.gate_min:
+            return 0.0
+        return min(1.0, max(0.0, x / self.scale))
+
+
+class Kernel:
+    """Fused scorer compiled from a registry and a weights dict; see the module docstring."""
+
+    def __init__(self, registry, weights):
+        self.components = list(registry.components)
+        self.weights = np.array([registry.component_weight(c, weights) for c in self.components])
+        comp_idx = {c: k for k, c in enumerate(self.components)}
+        self._steps = [(comp_idx[ch.component], ch) for ch in registry.channels]
+
+    def __call__(self, cols, w=None):
+        """cols: {(channel, column): array}, all the same shape (missing keys read as NaN);
+        w: optional {channel: staleness weight array}. Returns (components (k, *shape), IASi)."""
+        shape = np.shape(next(iter(cols.values()))) if cols else (0,)
+        comps = np.zeros((len(self.components),) + shape)
+        nan = np.full(shape, np.nan)
+        for k, ch in self._steps:
+            x = cols.get((ch.name, ch.column), nan)
+            v = ch.vector(x, cols.get((ch.name, ch.gate), nan) if ch.gate else None)
+            if w is not None and ch.name in w:
+                v = v * w[ch.name]
+            np.maximum(comps[k], v, out=comps[k])
+        return comps, np.tensordot(self.weights, comps, axes=1)
+
+    def weight_of(self, component):
+        return float(self.weights[self.components.index(component)])
+
+
+class Registry:
+    def __init__(self, spec):
+        self.channels = [Channel(name, s) for name, s in (spec.get('channels') or {}).items()]
+        if not self.channels:
+            raise ValueError('channels.yaml no declara canales')
+        self.by_name = {ch.name: ch for ch in self.channels}
+        self.components = list(dict.fromkeys(ch.component for ch in self.channels))
+
+    def signals(self):
+        return [ch for ch in self.channels if ch.scope == 'signal']
+
+    def event_channels(self):
+        return [ch for ch in self.channels if ch.scope == 'event']
+
+    def inputs(self):
+        """(channel, column) of every transform input, in registry order."""
+        return [(ch.name, c) for ch in self.channels for c in ch.inputs]
+
+    def weight_spec(self, component):
+        """Weight declared by the channels of a component: a number or a key of weights.yaml."""
+        found = {ch.weight for ch in self.channels if ch.component == component}
+        if len(found) != 1:
+            raise ValueError(f'componente {component}: sus canales declaran pesos distintos {sorted(map(str, found))}')
+        return found.pop()
+
+    def component_weight(self, component, weights):
+        w = self.weight_spec(component)
+        return float(weights[w]) if isinstance(w, str) else float(w)
+
+    def compile(self, weights):
+        return Kernel(self, weights)
+
+
+def load_registry(path=CFG_PATH):
+    """Registry of path, parsed once per process."""
+    key = str(path)
+    if key not in _REGISTRIES:
+        _REGISTRIES[key] = Registry(yaml.safe_load(Path(path).read_text(encoding='utf-8')) or {})
+    return _REGISTRIES[key]
+
+
+def main():
+    import run_eval_batch as reb
+    reg = load_registry()
+    kernel = reg.compile(reb.WEIGHTS)
+    for ch in reg.channels:
+        print(f'{ch.name:4s} {ch.scope:6s} {ch.kind:11s} {",".join(ch.inputs):24s} -> {ch.component}  {ch.source}')
+    print('IASi = ' + ' + '.join(f'{w:.2f}*{c}' for c, w in zip(kernel.components, kernel.weights)))
+
+
+if __name__ == '__main__':
+    main()
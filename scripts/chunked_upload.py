@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+chunked_upload.py
+Resumable chunked uploads for large satellite tables (server side).
+
+Protocol (see upload_server.py):
+  POST /upload_sat/chunked                 init -> upload_id, chunk_size, total_chunks
+  PUT  /upload_sat/chunked/<id>/<index>    raw chunk bytes, header X-Chunk-SHA256
+  GET  /upload_sat/chunked/<id>            received / missing chunk indices (resume)
+  POST /upload_sat/chunked/<id>/complete   assemble, verify sha256, queue like /upload_sat
+
+Chunks are written to data/inbox_sat/chunks/<id>/<index>.part independently, so
+any number of them can be uploaded in parallel and in any order; a chunk that is
+already present with the same checksum is acknowledged without rewriting it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+DEFAULT_CHUNK = 8 * 1024 * 1024
+MAX_CHUNK = 64 * 1024 * 1024
+
+
+class ChunkError(Exception):
+    def __init__(self, msg, code=400):
+        super().__init__(msg)
+        self.code = code
+
+
+class ChunkedUploads:
+    def __init__(self, root, ttl_s=48 * 3600):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+
+    def _dir(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise ChunkError('upload_id inválido', 404)
+        d = self.root / upload_id
+        if not (d / 'manifest.json').exists():
+            raise ChunkError('upload_id desconocido o expirado', 404)
+        return d
+
+    def manifest(self, upload_id):
+        return json.loads((self._dir(upload_id) / 'manifest.json').read_text(encoding='utf-8'))
+
+    def _save_manifest(self, d, man):
+        tmp = d / 'manifest.json.tmp'
+        tmp.write_text(json.dumps(man), encoding='utf-8')
+        os.replace(tmp, d / 'manifest.json')
+
+    def init(self, event, size, chunk_size=None, sha256=None, filename=None, options=None, job_id=None):
+        size = int(size)
+        if size <= 0:
+            raise ChunkError('size debe ser > 0')
+        chunk_size = int(chunk_size or DEFAULT_CHUNK)
+        if not (1024 <= chunk_size <= MAX_CHUNK):
+            raise ChunkError(f'chunk_size fuera de rango [1024, {MAX_CHUNK}]')
+        self.cleanup()
+        upload_id = uuid.uuid4().hex
+        d = self.root / upload_id
+        d.mkdir(parents=True)
+        man = {
+            'upload_id': upload_id, 'event': event, 'filename': filename, 'size': size,
+            'chunk_size': chunk_size, 'total_chunks': (size + chunk_size - 1) // chunk_size,
+            'sha256': sha256, 'options': options or {}, 'job_id': job_id, 'created_at': time.time(),
+        }
+        self._save_manifest(d, man)
+        return man
+
+    def _expected_len(self, man, index):
+        if index == man['total_chunks'] - 1:
+            return man['size'] - index * man['chunk_size']
+        return man['chunk_size']
+
+    def put_chunk(self, upload_id, index, data, sha256=None):
+        d = self._dir(upload_id)
+        man = self.manifest(upload_id)
+        index = int(index)
+        if not (0 <= index < man['total_chunks']):
+            raise ChunkError(f'índice de chunk fuera de rango (0..{man["total_chunks"] - 1})')
+        if len(data) != self._expected_len(man, index):
+            raise ChunkError(f'chunk {index}: tamaño {len(data)} != {self._expected_len(man, index)}')
+        digest = hashlib.sha256(data).hexdigest()
+        if sha256 and sha256.lower() != digest:
+            raise ChunkError(f'chunk {index}: checksum no coincide', 422)
+        part = d / f'{index}.part'
+        sums = d / f'{index}.sha256'
+        if part.exists() and sums.exists() and sums.read_text() == digest:
+            return digest, False
+        fd, tmp = tempfile.mkstemp(dir=str(d), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, part)
+        sums.write_text(digest)
+        return digest, True
+
+    def received(self, upload_id):
+        d = self._dir(upload_id)
+        return sorted(int(p.stem) for p in d.glob('*.part') if (d / f'{p.stem}.sha256').exists())
+
+    def status(self, upload_id):
+        man = self.manifest(upload_id)
+        got = self.received(upload_id)
+        have = set(got)
+        return {**man, 'received': got, 'missing': [i for i in range(man['total_chunks']) if i not in have]}
+
+    def assemble(self, upload_id, dest):
+        """Concatenate all chunks into dest, verify size/sha256 and drop the session."""
+        st = self.status(upload_id)
+        if st['missing']:
+            raise ChunkError(f"faltan {len(st['missing'])} chunks", 409)
+        d = self._dir(upload_id)
+        h = hashlib.sha256()
+        tmp = Path(str(dest) + '.assembling')
+        with tmp.open('wb') as out:
+            for i in range(st['total_chunks']):
+                with (d / f'{i}.part').open('rb') as f:
+                    while True:
+                        buf = f.read(1024 * 1024)
+                        if not buf:
+                            break
+                        h.update(buf)
+                        out.write(buf)
+        if tmp.stat().st_size != st['size']:
+            tmp.unlink()
+            raise ChunkError('tamaño final no coincide', 422)
+        if st['sha256'] and st['sha256'].lower() != h.hexdigest():
+            tmp.unlink()
+            raise ChunkError('sha256 del archivo completo no coincide', 422)
+        os.replace(tmp, dest)
+        shutil.rmtree(d, ignore_errors=True)
+        return h.hexdigest(), st
+
+    def cleanup(self):
+        """Remove sessions older than ttl_s (abandoned uploads)."""
+        now = time.time()
+        with self._lock:
+            for d in self.root.iterdir():
+                m = d / 'manifest.json'
+                try:
+                    if d.is_dir() and (not m.exists() or now - m.stat().st_mtime > self.ttl_s):
+                        newest = max([p.stat().st_mtime for p in d.iterdir()] or [0])
+                        if now - newest > self.ttl_s:
+                            shutil.rmtree(d, ignore_errors=True)
+                except Exception:
+                    continue
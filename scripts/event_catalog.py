@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+event_catalog.py
+SQLite catalog with one row per published index (outputs/indices/<evento>/iasi.json).
+It is updated on every publish (upload_server /upload_iasi and export_iasi_json.py)
+so /list_indices and /summary never have to open the per-event files.
+
+Usage:
+  python scripts/event_catalog.py rebuild     # re-scan outputs/indices/*/iasi.json
+  python scripts/event_catalog.py list
+"""
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from history_store import HistoryStore
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT_INDICES = ROOT / 'outputs' / 'indices'
+DB_PATH = ROOT / 'outputs' / 'catalog.sqlite'
+
+DEFAULT_TH = {'observation': 0.50, 'caution_min': 0.50, 'caution_max': 0.69, 'alert': 0.70}
+
+COLUMNS = ['name', 'lat', 'lon', 'aoi_path', 'bbox_minx', 'bbox_miny', 'bbox_maxx', 'bbox_maxy',
+           'first_date', 'last_date', 'n_days', 'last_iasi', 'state', 'metrics', 'updated_at', 'version']
+SORTABLE = {'name', 'last_date', 'last_iasi', 'state', 'updated_at', 'version', 'n_days'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    name TEXT PRIMARY KEY,
+    lat REAL, lon REAL,
+    aoi_path TEXT,
+    bbox_minx REAL, bbox_miny REAL, bbox_maxx REAL, bbox_maxy REAL,
+    first_date TEXT, last_date TEXT, n_days INTEGER,
+    last_iasi REAL, state TEXT,
+    metrics TEXT,
+    updated_at REAL,
+    version INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_events_state ON events(state);
+CREATE INDEX IF NOT EXISTS idx_events_last_iasi ON events(last_iasi);
+CREATE INDEX IF NOT EXISTS idx_events_updated ON events(updated_at);
+"""
+
+
+def state_for(iasi, th=None):
+    """Same mapping as compute_row in run_eval_batch.py."""
+    t = dict(DEFAULT_TH)
+    if isinstance(th, dict):
+        t.update({k: float(v) for k, v in th.items() if k in t and v is not None})
+    if iasi is None:
+        return None
+    if iasi < t['observation']:
+        return 'Observación'
+    return 'Precaución' if iasi <= t['caution_max'] else 'Alerta'
+
+
+def geojson_bbox(gj):
+    """(minx, miny, maxx, maxy) over every coordinate in a GeoJSON object, or None."""
+    xs, ys = [], []
+
+    def walk(c):
+        if isinstance(c, (list, tuple)) and c and isinstance(c[0], (int, float)):
+            xs.append(float(c[0]))
+            ys.append(float(c[1]))
+        elif isinstance(c, (list, tuple)):
+            for x in c:
+                walk(x)
+
+    def visit(o):
+        if not isinstance(o, dict):
+            return
+        if o.get('type') == 'FeatureCollection':
+            for f in o.get('features') or []:
+                visit(f)
+        elif o.get('type') == 'Feature':
+            visit(o.get('geometry'))
+        elif o.get('type') == 'GeometryCollection':
+            for g in o.get('geometries') or []:
+                visit(g)
+        else:
+            walk(o.get('coordinates'))
+
+    visit(gj)
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def aoi_bbox(aoi_path):
+    if not aoi_path:
+        return None
+    p = Path(aoi_path)
+    if not p.is_absolute():
+        p = ROOT / p
+    try:
+        return geojson_bbox(json.loads(p.read_text(encoding='utf-8')))
+    except Exception:
+        return None
+
+
+def row_from_payload(payload):
+    meta = payload.get('meta') or {}
+    tl = payload.get('timeline') or []
+    last = tl[-1] if tl else {}
+    last_iasi = float(last['IASi']) if last.get('IASi') is not None else None
+    bbox = aoi_bbox(meta.get('aoi_path')) or (None, None, None, None)
+    return {
+        'name': meta.get('name'),
+        'lat': meta.get('lat'),
+        'lon': meta.get('lon'),
+        'aoi_path': meta.get('aoi_path'),
+        'bbox_minx': bbox[0], 'bbox_miny': bbox[1], 'bbox_maxx': bbox[2], 'bbox_maxy': bbox[3],
+        'first_date': tl[0].get('date') if tl else None,
+        'last_date': last.get('date'),
+        'n_days': len(tl),
+        'last_iasi': last_iasi,
+        'state': last.get('estado') or state_for(last_iasi, meta.get('thresholds')),
+        'metrics': json.dumps(summarize_metrics(payload.get('metrics') or {}), ensure_ascii=False),
+    }
+
+
+def summarize_metrics(metrics):
+    keep = ('auc_pr', 'f1', 'false_alarm_pm', 'lead_time_days', 'brier', 'best_threshold')
+    return {win: {k: m.get(k) for k in keep if k in m} for win, m in metrics.items() if isinstance(m, dict)}
+
+
+class EventCatalog:
+    def __init__(self, path=DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        con = sqlite3.connect(str(self.path), timeout=10)
+        con.row_factory = sqlite3.Row
+        con.execute('PRAGMA journal_mode=WAL')
+        return con
+
+    def upsert(self, payload, version=None):
+        """Insert or update the row for payload['meta']['name']; returns the stored version."""
+        row = row_from_payload(payload)
+        if not row['name']:
+            raise ValueError('meta.name requerido')
+        with self._connect() as con:
+            cur = con.execute('SELECT version FROM events WHERE name=?', (row['name'],)).fetchone()
+            if version is None:
+                version = (cur['version'] or 0) + 1 if cur else 1
+            row['version'] = int(version)
+            row['updated_at'] = time.time()
+            con.execute(
+                f"INSERT OR REPLACE INTO events ({','.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})",
+                [row[c] for c in COLUMNS])
+        return row['version']
+
+    def delete(self, name):
+        with self._connect() as con:
+            con.execute('DELETE FROM events WHERE name=?', (name,))
+
+    def count(self):
+        with self._connect() as con:
+            return con.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def query(self, limit=None, offset=0, sort='name', order='asc', state=None, q=None,
+              min_iasi=None, updated_since=None, bbox=None, aoi_paths=None):
+        """Filtered/sorted/paginated rows. Returns (rows, total).
+        bbox=(minx, miny, maxx, maxy) keeps events whose AOI is in aoi_paths (AOIs
+        found by the spatial index) or whose lat/lon falls in the bbox."""
+        where, args = [], []
+        if bbox is not None:
+            paths = list(aoi_paths or [])
+            cond = '(lon BETWEEN ? AND ? AND lat BETWEEN ? AND ?)'
+            args += [bbox[0], bbox[2], bbox[1], bbox[3]]
+            if paths:
+                cond = f"(aoi_path IN ({','.join('?' * len(paths))}) OR {cond})"
+                args = paths + args
+            where.append(cond)
+        if state:
+            states = [s for s in str(state).split(',') if s]
+            where.append(f"state IN ({','.join('?' * len(states))})")
+            args += states
+        if q:
+            where.append('name LIKE ?')
+            args.append(f'%{q}%')
+        if min_iasi is not None:
+            where.append('last_iasi >= ?')
+            args.append(float(min_iasi))
+        if updated_since is not None:
+            where.append('updated_at >= ?')
+            args.append(float(updated_since))
+        sql_where = (' WHERE ' + ' AND '.join(where)) if where else ''
+        sort = sort if sort in SORTABLE else 'name'
+        order = 'DESC' if str(order).lower() == 'desc' else 'ASC'
+        with self._connect() as con:
+            total = con.execute(f'SELECT COUNT(*) FROM events{sql_where}', args).fetchone()[0]
+            sql = f'SELECT * FROM events{sql_where} ORDER BY {sort} {order}, name ASC'
+            page_args = list(args)
+            if limit is not None:
+                sql += ' LIMIT ? OFFSET ?'
+                page_args += [int(limit), int(offset or 0)]
+            rows = [self._to_dict(r) for r in con.execute(sql, page_args)]
+        return rows, total
+
+    def names_by_aoi(self, aoi_paths):
+        """{aoi_path: [event names]} for the given AOI paths."""
+        paths = list(aoi_paths)
+        if not paths:
+            return {}
+        out = {}
+        with self._connect() as con:
+            for r in con.execute(f"SELECT name, aoi_path FROM events WHERE aoi_path IN ({','.join('?' * len(paths))}) "
+                                 'ORDER BY name', paths):
+                out.setdefault(r['aoi_path'], []).append(r['name'])
+        return out
+
+    def get(self, name):
+        with self._connect() as con:
+            r = con.execute('SELECT * FROM events WHERE name=?', (name,)).fetchone()
+        return self._to_dict(r) if r else None
+
+    def summary(self):
+        with self._connect() as con:
+            by_state = {r['state'] or 'sin_datos': r['n'] for r in
+                        con.execute('SELECT state, COUNT(*) AS n FROM events GROUP BY state')}
+            agg = con.execute('SELECT COUNT(*) AS n, MAX(last_iasi) AS max_iasi, AVG(last_iasi) AS mean_iasi, '
+                              'MAX(last_date) AS last_date, MAX(updated_at) AS updated_at FROM events').fetchone()
+            events = [dict(r) for r in con.execute(
+                'SELECT name, lat, lon, last_date, last_iasi, state, version FROM events ORDER BY name')]
+        return {
+            'total': agg['n'],
+            'by_state': by_state,
+            'max_iasi': agg['max_iasi'],
+            'mean_iasi': round(agg['mean_iasi'], 4) if agg['mean_iasi'] is not None else None,
+            'last_date': agg['last_date'],
+            'updated_at': agg['updated_at'],
+            'events': events,
+        }
+
+    @staticmethod
+    def _to_dict(r):
+        d = dict(r)
+        d['bbox'] = [d.pop('bbox_minx'), d.pop('bbox_miny'), d.pop('bbox_maxx'), d.pop('bbox_maxy')]
+        if d['bbox'][0] is None:
+            d['bbox'] = None
+        try:
+            d['metrics'] = json.loads(d['metrics']) if d['metrics'] else {}
+        except Exception:
+            d['metrics'] = {}
+        return d
+
+    def rebuild(self, indices_dir=OUT_INDICES, history=None):
+        """Re-scan every iasi.json (slow path, only for bootstrap or repair). Versions come
+        from the history store, as on publish; a file written outside the publish/export
+        paths is recorded there as a new version first."""
+        n = 0
+        if not indices_dir.exists():
+            return n
+        history = history or HistoryStore.from_config()
+        for d in sorted(p for p in indices_dir.iterdir() if p.is_dir()):
+            f = d / 'iasi.json'
+            if not f.exists():
+                continue
+            try:
+                raw = f.read_bytes()
+                payload = json.loads(raw.decode('utf-8'))
+                name = payload.setdefault('meta', {}).setdefault('name', d.name)
+                # no-op when the file is already the latest logged version
+                entry, _ = history.put('iasi', name, raw)
+                self.upsert(payload, version=entry['version'])
+                n += 1
+            except Exception as e:
+                print(f'[WARN] {f}: {e}')
+        return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Catálogo SQLite de índices IASi publicados')
+    ap.add_argument('cmd', choices=['rebuild', 'list'])
+    ap.add_argument('--db', default=str(DB_PATH))
+    args = ap.parse_args()
+    cat = EventCatalog(args.db)
+    if args.cmd == 'rebuild':
+        print(f'OK: {cat.rebuild()} eventos catalogados en {cat.path}')
+    else:
+        rows, _ = cat.query()
+        for r in rows:
+            print(f"{r['name']}\t{r['last_date']}\t{r['last_iasi']}\t{r['state']}\tv{r['version']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 # Consolida timelines CSV + metrics CSV → outputs/indices/<evento>/iasi.json
-import csv, json
+import hashlib, json
 from pathlib import Path
 import yaml
+from event_catalog import EventCatalog
+from history_store import HistoryStore
+import rollups
+from channels import load_registry
+from signal_table import read_table
+from telemetry import stage, write_run_summary
 
 ROOT = Path(__file__).resolve().parents[1]
 OUT_TIMELINES = ROOT / "outputs" / "timelines"
@@ -10,6 +16,9 @@ OUT_METRICS = ROOT / "outputs" / "metrics"
 OUT_INDICES = ROOT / "outputs" / "indices"
 OUT_INDICES.mkdir(parents=True, exist_ok=True)
 
+METRIC_COLS = {"auc_pr": "AUC_PR", "f1": "F1", "false_alarm_pm": "false_alarms_per_month",
+               "lead_time_days": "lead_time_days", "brier": "brier"}
+
 EVENTS = [
     {"name":"Valdivia_1960","lat":-39.8,"lon":-73.2,"aoi_path":"config/aoi_valdivia.geojson"},
     {"name":"Maule_2010","lat":-35.0,"lon":-72.5,"aoi_path":"config/aoi_maule.geojson"},
@@ -18,87 +27,122 @@ EVENTS = [
 ]
 
 def read_timeline_csv(path):
-    if not Path(path).exists(): return []
-    with open(path,"r",encoding="utf-8") as f:
-        r=csv.DictReader(f)
-        out=[]
-        for row in r:
-            out.append({
-                "date": row["date"],
-                "A": float(row["A"]),
-                "R": float(row["R"]),
-                "D": float(row["D"]),
-                "M": float(row["M"]),
-                "S": float(row["S"]),
-                "IASi": float(row["IASi"])
-            })
-        return out
+    tab = read_table(path)
+    if not tab: return []
+    # una columna por componente del registro de canales (config/channels.yaml)
+    keys = ["date"] + list(load_registry().components) + ["IASi"]
+    cols = [tab.column("date").tolist()] + [tab.column(k).astype(float).tolist() for k in keys[1:]]
+    return [dict(zip(keys, vals)) for vals in zip(*cols)]
+
+def read_bands_csv(path):
+    """Bandas Monte Carlo por fecha (run_eval_batch.py --mc-samples): cuantiles del IASi y P(estado)."""
+    tab = read_table(path)
+    if not tab: return {}
+    q = {k[len("IASi_q"):]: tab.column(k).astype(float).tolist() for k in tab.columns if k.startswith("IASi_q")}
+    p = {k[2:]: tab.column(k).astype(float).tolist() for k in tab.columns if k.startswith("p_")}
+    return {d: {"IASi_q": {k: v[i] for k, v in q.items()}, "p_estado": {k: v[i] for k, v in p.items()}}
+            for i, d in enumerate(tab.column("date").tolist())}
 
 def read_metrics_csv(path):
-    if not Path(path).exists(): return None
-    with open(path,"r",encoding="utf-8") as f:
-        r=csv.DictReader(f)
-        rows=list(r)
-        if not rows: return None
-        row=rows[0]
-        return {
-            "auc_pr": float(row["AUC_PR"]),
-            "f1": float(row["F1"]),
-            "false_alarm_pm": float(row["false_alarms_per_month"]),
-            "lead_time_days": float(row["lead_time_days"]),
-            "brier": float(row["brier"]),
-            "best_threshold": float(row["best_threshold"])
-        }
+    rows = read_table(path)
+    if not rows: return None
+    row = rows[0]
+    out = {
+        "auc_pr": float(row["AUC_PR"]),
+        "f1": float(row["F1"]),
+        "false_alarm_pm": float(row["false_alarms_per_month"]),
+        "lead_time_days": float(row["lead_time_days"]),
+        "brier": float(row["brier"]),
+        "best_threshold": float(row["best_threshold"])
+    }
+    # intervalos bootstrap por bloques (run_eval_batch.py --bootstrap), si están
+    if row.get("AUC_PR_lo", "") != "":
+        out["ci"] = {k: [float(row[f"{col}_lo"]), float(row[f"{col}_hi"])] for k, col in METRIC_COLS.items()}
+        block = float(row["bootstrap_block_days"])    # fraccionario con resolution: hour
+        out["bootstrap"] = {"resamples": int(row["bootstrap_resamples"]),
+                            "block_days": int(block) if block.is_integer() else block,
+                            "conf": float(row["ci_level"])}
+    return out
+
+def read_scoring_meta():
+    """Modo de scoring de la última corrida de run_eval_batch.py (linear o learned + sha256 del modelo)."""
+    p = OUT_TIMELINES / "scoring.json"
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return {"mode": "linear"}
 
 def main():
+    catalog = EventCatalog()
+    history = HistoryStore.from_config()
+    scoring = read_scoring_meta()
     for ev in EVENTS:
         name = ev["name"]
-        tl = read_timeline_csv(OUT_TIMELINES / f"{name}_iasi.csv")
-        metrics = {}
-        for win in ("7","14","30"):
-            m = read_metrics_csv(OUT_METRICS / f"{name}_metrics_{win}d.csv")
-            if m: metrics[win]=m
-        # include config weights and thresholds if available
-        cfg_dir = Path(__file__).resolve().parents[1] / "config"
-        weights = None
-        thresholds = None
-        try:
-            wfile = cfg_dir / "weights.yaml"
-            if wfile.exists():
-                with open(wfile, 'r', encoding='utf-8') as f:
-                    weights = yaml.safe_load(f)
-        except Exception:
+        with stage("export") as st:
+            tl_csv = OUT_TIMELINES / f"{name}_iasi.csv"
+            tl = read_timeline_csv(tl_csv)
+            st.rows = len(tl)
+            st.bytes_read = tl_csv.stat().st_size if tl_csv.exists() else 0
+            bands = read_bands_csv(OUT_TIMELINES / f"{name}_bands.csv")
+            for row in tl:
+                if row["date"] in bands: row.update(bands[row["date"]])
+            metrics = {}
+            for win in ("7","14","30"):
+                m = read_metrics_csv(OUT_METRICS / f"{name}_metrics_{win}d.csv")
+                if m: metrics[win]=m
+            # include config weights and thresholds if available
+            cfg_dir = Path(__file__).resolve().parents[1] / "config"
             weights = None
-        try:
-            tfile = cfg_dir / "thresholds.yaml"
-            if tfile.exists():
-                with open(tfile, 'r', encoding='utf-8') as f:
-                    thresholds = yaml.safe_load(f)
-        except Exception:
             thresholds = None
+            try:
+                wfile = cfg_dir / "weights.yaml"
+                if wfile.exists():
+                    with open(wfile, 'r', encoding='utf-8') as f:
+                        weights = yaml.safe_load(f)
+            except Exception:
+                weights = None
+            try:
+                tfile = cfg_dir / "thresholds.yaml"
+                if tfile.exists():
+                    with open(tfile, 'r', encoding='utf-8') as f:
+                        thresholds = yaml.safe_load(f)
+            except Exception:
+                thresholds = None
 
-        payload = {
-            "meta": {
-                "name": name,
-                "lat": ev["lat"],
-                "lon": ev["lon"],
-                "aoi_path": ev["aoi_path"],
-                "team": "Los Abejorros Científicos",
-                "members": [
-                    "Roxana Andrea Salazar Marín",
-                    "Greimar José Salazar Marín",
-                    "Jhon Alexandre Meneses Ospina"
-                ],
-                "weights": weights,
-                "thresholds": thresholds
-            },
-            "timeline": tl,
-            "metrics": metrics
-        }
-        outdir = OUT_INDICES / name
-        outdir.mkdir(parents=True, exist_ok=True)
-        with open(outdir/"iasi.json","w",encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+            payload = {
+                "meta": {
+                    "name": name,
+                    "lat": ev["lat"],
+                    "lon": ev["lon"],
+                    "aoi_path": ev["aoi_path"],
+                    "team": "Los Abejorros Científicos",
+                    "members": [
+                        "Roxana Andrea Salazar Marín",
+                        "Greimar José Salazar Marín",
+                        "Jhon Alexandre Meneses Ospina"
+                    ],
+                    "weights": weights,
+                    "thresholds": thresholds,
+                    "scoring": scoring
+                },
+                "timeline": tl,
+                "metrics": metrics
+            }
+        with stage("publish") as st:
+            outdir = OUT_INDICES / name
+            outdir.mkdir(parents=True, exist_ok=True)
+            target = outdir/"iasi.json"
+            body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+            entry, _ = history.record("iasi", name, target, body)
+            target.write_bytes(body)
+            catalog.upsert(payload, version=entry["version"])
+            st.rows = len(tl)
+            st.bytes_written = len(body)
+        with stage("rollups") as st:
+            # semanal/mensual/anual junto a iasi.json; solo recalcula los periodos con días nuevos
+            doc = rollups.refresh(outdir, tl, source_sha=hashlib.sha256(body).hexdigest())
+            st.rows = doc["recomputed_days"]
+    write_run_summary("export_iasi_json")
     print("OK: iasi.json generado por evento en outputs/indices/")
 
 if __name__=="__main__":
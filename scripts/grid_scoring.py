@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+grid_scoring.py
+Spatial IASi: tile an event AOI into a regular grid of cells and score every
+cell on every day as a (cells x days) array.
+
+A, R, M and S are regional signals (one value per day, same join as
+run_eval_batch.py); only D varies per cell, computed from the deformation /
+coherence rasters (see raster_features.py): the D feature columns (p95 |defo|,
+mean coherence, ...) over the pixels inside each cell, through the transform
+declared for D in config/channels.yaml, carried forward between acquisitions and
+weighted by the staleness of D in config/join.yaml (calendar_join.staleness of
+the age of each cell's acquisition in force, as DenseJoin does for the regional
+D). Then, per day block, IASi[c, t] = base[t] + gamma * w[c, t] * D[c, t] with
+base[t] the non-D part.
+
+The day axis is processed in blocks sized from --mem-mb, so memory stays fixed
+whatever the grid size (10k cells x 10k days fits in the default 256 MB). Blocks
+are appended to a column-major (cells, days) .npy, so writing is sequential and
+np.load(..., mmap_mode='r')[cell] still gives one cell's timeline.
+
+Usage:
+  python scripts/grid_scoring.py score -e Maule_2010 --raster data/rasters/maule --cell-km 5
+  python scripts/grid_scoring.py cell -e Maule_2010 --cell 42          # one cell timeline as CSV
+  python scripts/grid_scoring.py bench --cells 10000 --days 10000     # synthetic memory/time check
+
+Outputs (outputs/grid/<event>/):
+  cells.csv         cell_id, lon, lat, max_iasi, max_date, alert_days
+  summary.csv       per day: max / p50 / p90 / p95 over cells, cells in alert, argmax cell
+  iasi_cells.npy    float32 (cells, days) IASi matrix; dates.txt holds the day axis
+"""
+import argparse
+import csv
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from calendar_join import FOREVER, load_config as load_join_config, staleness
+from channels import load_registry
+from raster_features import (AREA_THRESHOLD_MM, KM_PER_DEG_LAT, KM_PER_DEG_LON, RasterSource, _aoi_geometry,
+                             aoi_mask, pixel_area_km2)
+from telemetry import stage, write_run_summary
+from timebase import DAY_S, to_epoch
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT_GRID = ROOT / 'outputs' / 'grid'
+# raster_features.reduce_date() columns that can be computed per cell
+CELL_COLUMNS = ('mean_defo_mm', 'p95_defo_mm', 'mean_coh', 'area_defo_gt10mm_km2')
+
+
+def d_channel():
+    """Channel D of config/channels.yaml; its transform inputs must be CELL_COLUMNS."""
+    ch = load_registry().by_name['D']
+    missing = [c for c in ch.inputs if c not in CELL_COLUMNS]
+    if missing:
+        raise ValueError(f'canal D: {missing} no se pueden calcular por celda desde los rásters '
+                         f'(disponibles: {", ".join(CELL_COLUMNS)})')
+    return ch
+
+
+def tile_aoi(aoi_path, cell_km=5.0, point_radius_km=10.0):
+    """Regular grid of cell_km cells over the AOI; keeps cells intersecting it.
+    Returns a dict with the grid geometry, lookup[row, col] -> cell id (-1 outside)
+    and lon/lat centers of the kept cells."""
+    import shapely
+    geom = _aoi_geometry(aoi_path, point_radius_km)
+    minx, miny, maxx, maxy = geom.bounds
+    lat_c = (miny + maxy) / 2
+    dy = cell_km / KM_PER_DEG_LAT
+    dx = cell_km / (KM_PER_DEG_LON * max(math.cos(math.radians(lat_c)), 1e-6))
+    nx = max(1, math.ceil((maxx - minx) / dx))
+    ny = max(1, math.ceil((maxy - miny) / dy))
+    ix, iy = np.meshgrid(np.arange(nx), np.arange(ny))
+    x0 = minx + ix * dx
+    y1 = maxy - iy * dy
+    keep = shapely.intersects(geom, shapely.box(x0, y1 - dy, x0 + dx, y1))
+    lookup = np.full((ny, nx), -1, dtype=np.int32)
+    lookup[keep] = np.arange(int(keep.sum()), dtype=np.int32)
+    return {
+        'minx': minx, 'maxy': maxy, 'dx': dx, 'dy': dy, 'nx': nx, 'ny': ny, 'lookup': lookup,
+        'lon': (x0 + dx / 2)[keep], 'lat': (y1 - dy / 2)[keep],
+    }
+
+
+def pixel_labels(grid, src_grid, window, mask):
+    """Cell id of every pixel in the raster AOI window (-1 outside the AOI / grid)."""
+    row0, row1, col0, col1 = window
+    lons = src_grid['lon0'] + (np.arange(col0, col1) + 0.5) * src_grid['dlon']
+    lats = src_grid['lat0'] - (np.arange(row0, row1) + 0.5) * src_grid['dlat']
+    ci = np.floor((lons - grid['minx']) / grid['dx']).astype(np.int64)
+    ri = np.floor((grid['maxy'] - lats) / grid['dy']).astype(np.int64)
+    ok = (ri[:, None] >= 0) & (ri[:, None] < grid['ny']) & (ci[None, :] >= 0) & (ci[None, :] < grid['nx']) & mask
+    labels = np.full(mask.shape, -1, dtype=np.int32)
+    rr, cc = np.nonzero(ok)
+    labels[rr, cc] = grid['lookup'][ri[rr], ci[cc]]
+    return labels
+
+
+def cell_d_for_date(src, date, window, sel, labels, n_cells, ch, px_area):
+    """D transform (channel ch) per cell for one date (NaN where the cell has no valid pixel).
+    px_area: km² of each selected pixel, for area_defo_gt10mm_km2."""
+    row0, row1, col0, col1 = window
+    defo, coh = src.read(date)
+    d = np.abs(np.asarray(defo[row0:row1, col0:col1], dtype=np.float32)).ravel()[sel]
+    c = np.asarray(coh[row0:row1, col0:col1], dtype=np.float32).ravel()[sel]
+    fc = np.isfinite(c)
+    fd = np.isfinite(d)
+    nc = np.bincount(labels[fc], minlength=n_cells)
+    nd = np.bincount(labels[fd], minlength=n_cells)
+    stats = {}
+    for col in ch.inputs:
+        if col == 'mean_coh':
+            stats[col] = np.bincount(labels[fc], weights=c[fc], minlength=n_cells) / np.maximum(nc, 1)
+        elif col == 'mean_defo_mm':
+            stats[col] = np.bincount(labels[fd], weights=d[fd], minlength=n_cells) / np.maximum(nd, 1)
+        elif col == 'area_defo_gt10mm_km2':
+            stats[col] = np.bincount(labels[fd], weights=(d[fd] > AREA_THRESHOLD_MM) * px_area[fd],
+                                     minlength=n_cells)
+        else:
+            # per-cell p95: sort by (cell, value) with NaN last inside each cell, then interpolate
+            order = np.lexsort((np.where(fd, d, np.inf), labels))
+            ds = d[order]
+            starts = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_cells))[:-1]))
+            pos = 0.95 * np.maximum(nd - 1, 0)
+            lo = np.minimum(starts + np.floor(pos).astype(np.int64), max(len(ds) - 1, 0))
+            hi = np.minimum(starts + np.ceil(pos).astype(np.int64), max(len(ds) - 1, 0))
+            stats[col] = ds[lo] + (ds[hi] - ds[lo]) * (pos - np.floor(pos)) if len(ds) else np.zeros(n_cells)
+    dval = ch.vector(np.asarray(stats[ch.column], dtype=np.float64),
+                     np.asarray(stats[ch.gate], dtype=np.float64) if ch.gate else None)
+    return np.where((nd > 0) & (nc > 0), dval, np.nan).astype(np.float32)
+
+
+def build_cell_d(src, grid, out_dir, point_radius_km=10.0, workers=None, aoi_path=None):
+    """(dfeat, dsrc): (n_dates, cells) float32 memmap of D per acquisition date, forward-filled per
+    cell, and int32 memmap of the acquisition (row of src.dates) each value comes from (-1: none yet)."""
+    window, mask = aoi_mask(aoi_path, src.grid, point_radius_km)
+    labels = pixel_labels(grid, src.grid, window, mask).ravel()
+    sel = np.nonzero(labels >= 0)[0]
+    labels = labels[sel]
+    n_cells = len(grid['lon'])
+    ch = d_channel()
+    px_area = np.broadcast_to(pixel_area_km2(src.grid, window[0], window[1])[:, None],
+                              (window[1] - window[0], window[3] - window[2])).ravel()[sel]
+    dfeat = np.lib.format.open_memmap(out_dir / 'd_cells.npy', mode='w+', dtype=np.float32,
+                                      shape=(len(src.dates), n_cells))
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    def one(i):
+        dfeat[i] = cell_d_for_date(src, src.dates[i], window, sel, labels, n_cells, ch, px_area)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, range(len(src.dates))))
+    dsrc = np.lib.format.open_memmap(out_dir / 'd_cells_src.npy', mode='w+', dtype=np.int32,
+                                     shape=(len(src.dates), n_cells))
+    for i in range(len(src.dates)):
+        prev = dfeat[i - 1] if i else np.zeros(n_cells, dtype=np.float32)
+        prev_src = dsrc[i - 1] if i else np.full(n_cells, -1, dtype=np.int32)
+        new = ~np.isnan(dfeat[i])
+        dfeat[i] = np.where(new, dfeat[i], prev)
+        dsrc[i] = np.where(new, i, prev_src)
+    dfeat.flush()
+    dsrc.flush()
+    return dfeat, dsrc
+
+
+def daily_base(feat_dates):
+    """Day axis and non-D IASi per day, from the same join/kernel as run_eval_batch
+    (shared signals only; the D component comes per cell from the rasters)."""
+    import run_eval_batch as reb
+    tables = reb.build_signal_tables()
+    tables['D'] = [{'date': d} for d in feat_dates]
+    join = reb.join_tables(tables)
+    base = reb.score_join(join)[1].astype(np.float32)
+    return list(join.dates()), base, reb.KERNEL.weight_of('D'), reb.TH['alert']
+
+
+def open_matrix(path, n_cells, n_days):
+    """Binary handle positioned after a .npy header for a Fortran-order (cells, days) float32 array."""
+    f = open(path, 'wb')
+    np.lib.format.write_array_header_1_0(f, {'descr': '<f4', 'fortran_order': True, 'shape': (n_cells, n_days)})
+    return f
+
+
+def score_grid(base, fidx, dfeat, gamma, alert, out, mem_mb=256, stale=None):
+    """Write IASi for every (cell, day) to out (see open_matrix; None to skip) and
+    return (per-day summary, per-cell summary). fidx[t] is the row of dfeat in force
+    on day t (-1 before the first acquisition). stale: None (D never goes stale) or
+    (dsrc, acq_t, cal_t, cfg) with dsrc from build_cell_d, the epoch seconds of each
+    acquisition and of each day, and the join.yaml settings of D."""
+    n_days, n_cells = len(base), dfeat.shape[1]
+    # block (days x cells) float32: D rows gathered from dfeat, IASi and the percentile workspace,
+    # plus the gathered sources and float64 ages / weights with staleness
+    block = max(1, int(mem_mb * 2 ** 20 // (max(n_cells, 1) * 4 * (4 if stale is None else 10))))
+    day = {k: np.zeros(n_days, dtype=np.float32) for k in ('max', 'p50', 'p90', 'p95')}
+    day['alert'] = np.zeros(n_days, dtype=np.int64)
+    day['argmax'] = np.zeros(n_days, dtype=np.int64)
+    cell_max = np.full(n_cells, -np.inf, dtype=np.float32)
+    cell_argmax = np.zeros(n_cells, dtype=np.int64)
+    cell_alert = np.zeros(n_cells, dtype=np.int64)
+    for d0 in range(0, n_days, block):
+        d1 = min(n_days, d0 + block)
+        fi = fidx[d0:d1]
+        blk = np.zeros((d1 - d0, n_cells), dtype=np.float32)
+        has = fi >= 0
+        if has.any():
+            blk[has] = dfeat[fi[has]]
+            if stale is not None:
+                dsrc, acq_t, cal_t, cfg = stale
+                src = dsrc[fi[has]]
+                age = (cal_t[d0:d1][has, None] - acq_t[np.maximum(src, 0)]) / DAY_S
+                blk[has] *= np.where(src >= 0, staleness(age, cfg), 0.0)
+        blk *= gamma
+        blk += base[d0:d1, None]
+        if out is not None:
+            out.write(blk.astype('<f4', copy=False).tobytes())
+        day['max'][d0:d1] = blk.max(axis=1)
+        day['argmax'][d0:d1] = blk.argmax(axis=1)
+        day['p50'][d0:d1], day['p90'][d0:d1], day['p95'][d0:d1] = np.percentile(blk, [50, 90, 95], axis=1)
+        hot = blk >= alert
+        day['alert'][d0:d1] = hot.sum(axis=1)
+        cell_alert += hot.sum(axis=0)
+        bmax = blk.max(axis=0)
+        better = bmax > cell_max
+        cell_argmax[better] = d0 + blk.argmax(axis=0)[better]
+        cell_max[better] = bmax[better]
+    return day, {'max': cell_max, 'argmax': cell_argmax, 'alert_days': cell_alert}
+
+
+def write_outputs(out_dir, days, grid, day, cell):
+    with (out_dir / 'dates.txt').open('w', encoding='utf-8') as f:
+        f.write('\n'.join(days) + '\n')
+    with (out_dir / 'summary.csv').open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['date', 'max', 'p50', 'p90', 'p95', 'cells_alert', 'argmax_cell'])
+        for t, d in enumerate(days):
+            w.writerow([d, f"{day['max'][t]:.4f}", f"{day['p50'][t]:.4f}", f"{day['p90'][t]:.4f}",
+                        f"{day['p95'][t]:.4f}", int(day['alert'][t]), int(day['argmax'][t])])
+    with (out_dir / 'cells.csv').open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['cell_id', 'lon', 'lat', 'max_iasi', 'max_date', 'alert_days'])
+        for c in range(len(grid['lon'])):
+            w.writerow([c, f"{grid['lon'][c]:.5f}", f"{grid['lat'][c]:.5f}", f"{cell['max'][c]:.4f}",
+                        days[int(cell['argmax'][c])] if days else '', int(cell['alert_days'][c])])
+
+
+def _event(name):
+    import run_eval_batch as reb
+    for ev in reb.EVENTS:
+        if ev['name'] == name:
+            return ev
+    return {'name': name, 'aoi': f'config/aoi_{name}.geojson'}
+
+
+def cmd_score(args):
+    ev = _event(args.event)
+    aoi = Path(args.aoi or ROOT / ev['aoi'])
+    out_dir = OUT_GRID / ev['name']
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with stage('grid_tile') as st:
+        grid = tile_aoi(aoi, args.cell_km, args.point_radius_km)
+        st.rows = len(grid['lon'])
+    with stage('grid_features') as st:
+        src = RasterSource(args.raster)
+        dfeat, dsrc = build_cell_d(src, grid, out_dir, args.point_radius_km, args.workers, aoi)
+        st.rows = dfeat.shape[0] * dfeat.shape[1]
+    with stage('grid_score') as st:
+        days, base, gamma, alert = daily_base(src.dates)
+        fidx = np.searchsorted(np.array(src.dates), np.array(days), side='right') - 1
+        stale = (dsrc, to_epoch(src.dates), to_epoch(days), load_join_config()[2].get('D', FOREVER))
+        with open_matrix(out_dir / 'iasi_cells.npy', len(grid['lon']), len(days)) as out:
+            day, cell = score_grid(base, fidx, dfeat, gamma, alert, out, args.mem_mb, stale)
+        write_outputs(out_dir, days, grid, day, cell)
+        st.rows = len(grid['lon']) * len(days)
+        st.bytes_written = (out_dir / 'iasi_cells.npy').stat().st_size
+    write_run_summary('grid_scoring', {'event': ev['name'], 'cells': len(grid['lon']), 'days': len(days)})
+    print(f"OK: {len(grid['lon'])} celdas x {len(days)} días -> {out_dir}")
+
+
+def cmd_cell(args):
+    out_dir = OUT_GRID / args.event
+    days = (out_dir / 'dates.txt').read_text(encoding='utf-8').split()
+    mat = np.load(out_dir / 'iasi_cells.npy', mmap_mode='r')
+    import run_eval_batch as reb
+    th = reb.TH
+    w = csv.writer(sys.stdout)
+    w.writerow(['date', 'IASi', 'estado'])
+    for d, v in zip(days, mat[args.cell]):
+        state = 'Observación' if v < th['observation'] else ('Precaución' if v <= th['caution_max'] else 'Alerta')
+        w.writerow([d, f'{v:.4f}', state])
+
+
+def cmd_bench(args):
+    rng = np.random.default_rng(0)
+    n_feat = max(1, args.days // 12)  # ~12-day revisit
+    with tempfile.TemporaryDirectory() as tmp:
+        dfeat = np.lib.format.open_memmap(Path(tmp) / 'd.npy', mode='w+', dtype=np.float32,
+                                          shape=(n_feat, args.cells))
+        for i in range(0, n_feat, 64):
+            dfeat[i:i + 64] = rng.random((min(64, n_feat - i), args.cells), dtype=np.float32)
+        base = rng.random(args.days, dtype=np.float32) * 0.6
+        fidx = np.minimum(np.arange(args.days) // 12, n_feat - 1)
+        dfeat.flush()
+        del dfeat
+        dfeat = np.load(Path(tmp) / 'd.npy', mmap_mode='r')
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        with open_matrix(Path(tmp) / 'o.npy', args.cells, args.days) as out:
+            score_grid(base, fidx, dfeat, 0.25, 0.70, out, args.mem_mb)
+        dt = time.perf_counter() - t0
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{args.cells} celdas x {args.days} días en {dt:.1f}s '
+          f'({args.cells * args.days / dt / 1e6:.1f} M celdas-día/s); '
+          f'pico RSS {rss1 / 1024:.0f} MB (+{(rss1 - rss0) / 1024:.0f} MB), presupuesto {args.mem_mb} MB')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='IASi por celdas sobre el AOI de un evento')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sc = sub.add_parser('score')
+    sc.add_argument('-e', '--event', required=True)
+    sc.add_argument('--raster', required=True, help='Directorio de rásters (ver raster_features.py)')
+    sc.add_argument('--aoi', help='GeoJSON del AOI (por defecto: el AOI del evento en run_eval_batch.EVENTS)')
+    sc.add_argument('--cell-km', type=float, default=5.0)
+    sc.add_argument('--point-radius-km', type=float, default=10.0)
+    sc.add_argument('--workers', type=int, default=None)
+    sc.add_argument('--mem-mb', type=float, default=256)
+    ce = sub.add_parser('cell')
+    ce.add_argument('-e', '--event', required=True)
+    ce.add_argument('--cell', type=int, required=True)
+    be = sub.add_parser('bench')
+    be.add_argument('--cells', type=int, default=10000)
+    be.add_argument('--days', type=int, default=10000)
+    be.add_argument('--mem-mb', type=float, default=256)
+    args = ap.parse_args()
+    {'score': cmd_score, 'cell': cmd_cell, 'bench': cmd_bench}[args.cmd](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+history_store.py
+Content-addressed history for files published by the upload server
+(outputs/indices/<evento>/iasi.json and config/aoi_<name>.geojson).
+
+Each version is stored once as a blob keyed by its sha256 (optionally gzip
+compressed) and referenced from a per-key version log (JSON lines). Uploading
+identical content twice does not add a new blob nor a new version.
+
+Writers live in several processes (the upload server and its retention
+thread, export_iasi_json.py, the CLI), so put()/record() and prune() hold an
+exclusive lock on <root>/.lock besides the in-process lock (fcntl.flock; on
+Windows msvcrt.locking of its first byte). prune()
+also leaves alone unreferenced blobs younger than blob_grace_s, in case a
+writer that does not take the lock is between storing a blob and logging it.
+
+Layout:
+  <root>/blobs/<sha[:2]>/<sha>[.gz]
+  <root>/logs/<kind>/<name>.jsonl     one line per version: version, ts, sha256, size
+  <root>/.lock                        locked by writers and prune
+
+Usage:
+  python scripts/history_store.py prune            # apply retention from config/server.yaml
+  python scripts/history_store.py migrate          # import legacy *.bak.<ts> files and remove them
+  python scripts/history_store.py log iasi Maule_2010
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import yaml
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_DIR = ROOT / 'config'
+OUT_INDICES = ROOT / 'outputs' / 'indices'
+
+DEFAULTS = {
+    'dir': 'outputs/history',
+    'compress': True,
+    'keep_versions': 10,
+    'keep_daily_days': 30,
+    'prune_interval_s': 3600,
+    'blob_grace_s': 600,
+}
+
+
+def load_config(server_cfg=CFG_DIR / 'server.yaml'):
+    """Read the 'history' section of config/server.yaml merged over DEFAULTS."""
+    cfg = dict(DEFAULTS)
+    try:
+        if Path(server_cfg).exists():
+            data = yaml.safe_load(Path(server_cfg).read_text(encoding='utf-8')) or {}
+            cfg.update(data.get('history') or {})
+    except Exception:
+        pass
+    return cfg
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after ~10 s; keep waiting like flock does
+            continue
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _atomic_write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class HistoryStore:
+    def __init__(self, root, compress=True):
+        self.root = Path(root)
+        self.compress = compress
+        self.blobs = self.root / 'blobs'
+        self.logs = self.root / 'logs'
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.logs.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = self.root / '.lock'
+
+    @contextmanager
+    def _locked(self):
+        """In-process lock plus an exclusive lock on <root>/.lock shared with other processes."""
+        with self._lock, self._lock_path.open('a') as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+    @classmethod
+    def from_config(cls, cfg=None):
+        cfg = cfg or load_config()
+        root = Path(cfg['dir'])
+        if not root.is_absolute():
+            root = ROOT / root
+        return cls(root, compress=bool(cfg.get('compress', True)))
+
+    # --- blobs ---
+    def _blob_path(self, sha):
+        base = self.blobs / sha[:2] / sha
+        gz = base.with_name(sha + '.gz')
+        if gz.exists():
+            return gz
+        if base.exists():
+            return base
+        return gz if self.compress else base
+
+    def has_blob(self, sha):
+        return self._blob_path(sha).exists()
+
+    def _put_blob(self, data):
+        sha = hashlib.sha256(data).hexdigest()
+        p = self._blob_path(sha)
+        if not p.exists():
+            payload = gzip.compress(data, mtime=0) if p.suffix == '.gz' else data
+            _atomic_write(p, payload)
+        else:
+            # reused blob: restart its grace period for prune()
+            os.utime(p)
+        return sha
+
+    def read_blob(self, sha):
+        p = self._blob_path(sha)
+        data = p.read_bytes()
+        return gzip.decompress(data) if p.suffix == '.gz' else data
+
+    # --- version logs ---
+    def _log_path(self, kind, name):
+        return self.logs / kind / f'{name}.jsonl'
+
+    def versions(self, kind, name):
+        p = self._log_path(kind, name)
+        if not p.exists():
+            return []
+        out = []
+        with p.open('r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    out.append(json.loads(line))
+        return out
+
+    def _write_log(self, kind, name, entries):
+        body = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries)
+        _atomic_write(self._log_path(kind, name), body.encode('utf-8'))
+
+    def put(self, kind, name, data, ts=None):
+        """Store data as the newest version of (kind, name).
+
+        Returns (entry, created). When the content equals the latest version
+        nothing is written and created is False.
+        """
+        with self._locked():
+            return self._put(kind, name, data, ts)
+
+    def _put(self, kind, name, data, ts=None):
+        ts = int(ts if ts is not None else time.time())
+        entries = self.versions(kind, name)
+        sha = hashlib.sha256(data).hexdigest()
+        if entries and entries[-1]['sha256'] == sha:
+            return entries[-1], False
+        self._put_blob(data)
+        entry = {
+            'version': (entries[-1]['version'] + 1) if entries else 1,
+            'ts': ts,
+            'sha256': sha,
+            'size': len(data),
+        }
+        p = self._log_path(kind, name)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with p.open('a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        return entry, True
+
+    def record(self, kind, name, target, data):
+        """put() for a file about to be overwritten with data.
+
+        If target exists but has no history yet, its current content is stored
+        first so the previous version is never lost.
+        """
+        target = Path(target)
+        with self._locked():
+            if target.exists() and not self.versions(kind, name):
+                self._put(kind, name, target.read_bytes(), ts=target.stat().st_mtime)
+            return self._put(kind, name, data)
+
+    def latest(self, kind, name):
+        entries = self.versions(kind, name)
+        return entries[-1] if entries else None
+
+    def get(self, kind, name, version=None):
+        entries = self.versions(kind, name)
+        if not entries:
+            return None
+        if version is None:
+            return self.read_blob(entries[-1]['sha256'])
+        for e in entries:
+            if e['version'] == int(version):
+                return self.read_blob(e['sha256'])
+        return None
+
+    def keys(self):
+        for kdir in sorted(p for p in self.logs.iterdir() if p.is_dir()):
+            for lp in sorted(kdir.glob('*.jsonl')):
+                yield kdir.name, lp.stem
+
+    # --- retention ---
+    @staticmethod
+    def _retained(entries, keep_versions, keep_daily_days, now):
+        """Keep the last N versions plus the newest version of each day within M days."""
+        keep = set(e['version'] for e in entries[-keep_versions:]) if keep_versions > 0 else set()
+        cutoff = now - keep_daily_days * 86400
+        by_day = {}
+        for e in entries:
+            if e['ts'] >= cutoff:
+                day = datetime.fromtimestamp(e['ts'], tz=timezone.utc).date()
+                by_day[day] = e['version']
+        keep.update(by_day.values())
+        if entries:
+            keep.add(entries[-1]['version'])
+        return [e for e in entries if e['version'] in keep]
+
+    def prune(self, keep_versions=10, keep_daily_days=30, now=None, grace_s=DEFAULTS['blob_grace_s']):
+        """Apply the retention policy to every log and delete unreferenced blobs older than grace_s."""
+        now = now if now is not None else time.time()
+        removed_versions = 0
+        with self._locked():
+            referenced = set()
+            for kind, name in list(self.keys()):
+                entries = self.versions(kind, name)
+                kept = self._retained(entries, keep_versions, keep_daily_days, now)
+                if len(kept) != len(entries):
+                    self._write_log(kind, name, kept)
+                    removed_versions += len(entries) - len(kept)
+                referenced.update(e['sha256'] for e in kept)
+            removed_blobs = 0
+            for bp in self.blobs.glob('*/*'):
+                sha = bp.name.split('.')[0]
+                if sha in referenced:
+                    continue
+                try:
+                    if time.time() - bp.stat().st_mtime < grace_s:
+                        continue
+                    bp.unlink()
+                except FileNotFoundError:
+                    continue
+                removed_blobs += 1
+        return {'versions_removed': removed_versions, 'blobs_removed': removed_blobs}
+
+    def start_retention(self, keep_versions=10, keep_daily_days=30, interval_s=3600, logger=None,
+                        grace_s=DEFAULTS['blob_grace_s']):
+        """Run prune() periodically in a daemon thread."""
+        def _loop():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    res = self.prune(keep_versions, keep_daily_days, grace_s=grace_s)
+                    if logger and (res['versions_removed'] or res['blobs_removed']):
+                        logger.info('History retention: %s', res)
+                except Exception:
+                    if logger:
+                        logger.exception('History retention failed')
+        t = threading.Thread(target=_loop, name='history-retention', daemon=True)
+        t.start()
+        return t
+
+
+def migrate_legacy_backups(store, indices_dir=OUT_INDICES, cfg_dir=CFG_DIR):
+    """Import iasi.json.bak.<ts> and aoi_<name>.geojson.bak.<ts> files and remove them."""
+    moved = 0
+    legacy = []
+    if indices_dir.exists():
+        for d in indices_dir.iterdir():
+            if d.is_dir():
+                legacy += [('iasi', d.name, p) for p in d.glob('iasi.json.bak.*')]
+    legacy += [('aoi', p.name[len('aoi_'):].split('.geojson')[0], p) for p in cfg_dir.glob('aoi_*.geojson.bak.*')]
+    legacy.sort(key=lambda x: int(x[2].name.rsplit('.', 1)[1]) if x[2].name.rsplit('.', 1)[1].isdigit() else 0)
+    for kind, name, p in legacy:
+        suffix = p.name.rsplit('.', 1)[1]
+        ts = int(suffix) if suffix.isdigit() else int(p.stat().st_mtime)
+        store.put(kind, name, p.read_bytes(), ts=ts)
+        p.unlink()
+        moved += 1
+    return moved
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Historial deduplicado de iasi.json y AOI')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('prune', help='Aplica la política de retención')
+    sub.add_parser('migrate', help='Importa archivos *.bak.<ts> existentes')
+    lg = sub.add_parser('log', help='Lista versiones de un archivo')
+    lg.add_argument('kind', choices=['iasi', 'aoi'])
+    lg.add_argument('name')
+    args = ap.parse_args()
+
+    cfg = load_config()
+    store = HistoryStore.from_config(cfg)
+    if args.cmd == 'prune':
+        print(store.prune(int(cfg['keep_versions']), int(cfg['keep_daily_days']), grace_s=float(cfg['blob_grace_s'])))
+    elif args.cmd == 'migrate':
+        print(f'OK: {migrate_legacy_backups(store)} backups importados en {store.root}')
+    elif args.cmd == 'log':
+        for e in store.versions(args.kind, args.name):
+            print(json.dumps(e))
+
+
+if __name__ == '__main__':
+    main()
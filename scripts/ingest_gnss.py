@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+ingest_gnss.py
+Ingest continuous GNSS station time series (daily ENU displacements) and reduce
+them to a per-event, per-day GNSS deformation feature written next to the InSAR
+features: data/features/gnss_<event>.csv with
+  date, gnss_disp_mm, gnss_disp_max_mm, gnss_rate_mm_d, gnss_n_stations
+
+Input directory (--dir, default data/gnss):
+  <STATION>.csv    date, east_mm, north_mm, up_mm  (also e_mm/n_mm/u_mm or dE/dN/dU)
+                   optional lat, lon columns (first located row wins)
+  stations.csv     station_id, lat, lon   (metadata; overrides the per-file lat/lon)
+
+Station files are parsed in parallel (one process per worker). Parsed series are
+cached as outputs/cache/gnss/series/<STATION>.npz together with the byte offset
+reached; on the next run a station whose file only grew (same leading bytes) is
+read from that offset, so a daily append costs one line per station.
+
+Each station's secular trend (linear, per component) is causal and piecewise: a
+first fit on the pre-period (the first MIN_FIT_DAYS days), then a refit on the
+days up to each point where the series has grown by REFIT_GROWTH. A fit only
+applies to the days after the last day it saw (the pre-period fit also to the
+pre-period itself, or to the days of a first ingest shorter than it), so no day
+is detrended with later data, and since fits are only ever appended (cached in
+index.json), already-emitted days keep their values and append mode only
+rewrites new dates. --refit redoes every fit from scratch on the whole cached
+series (same fit points, so the same trends for stations first ingested with at
+least MIN_FIT_DAYS days and never rewritten). Per event, the assigned stations are laid out on a dense
+(stations x days x 3) array: residual = ENU - trend, daily difference = residual
+change between consecutive days, both reduced across stations with nan-aware
+numpy (median / max / count).
+
+Stations are assigned to events through the AOI index: every station within
+--max-km of an event AOI (0: inside it) contributes to that event.
+
+Usage:
+  python scripts/ingest_gnss.py                      # all events in run_eval_batch.EVENTS
+  python scripts/ingest_gnss.py -e Maule_2010 --max-km 150 --workers 8
+  python scripts/ingest_gnss.py --refit              # refit every station trend
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from telemetry import stage, write_run_summary
+
+ROOT = Path(__file__).resolve().parents[1]
+GNSS_DIR = ROOT / 'data' / 'gnss'
+CACHE_DIR = ROOT / 'outputs' / 'cache' / 'gnss'
+ENU_ALIASES = (('east_mm', 'north_mm', 'up_mm'), ('e_mm', 'n_mm', 'u_mm'), ('dE', 'dN', 'dU'))
+MIN_FIT_DAYS = 30      # shorter series are only de-meaned
+REFIT_GROWTH = 0.2     # refit the trend once the series grew 20% since the last fit
+HEAD_BYTES = 1024      # leading bytes hashed to detect rewritten (not appended) files
+
+
+def _head_sha(path, n):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(n)).hexdigest()
+
+
+def read_station(path, offset=0, header=None):
+    """Parse a station CSV from byte offset. Returns a dict with days (int64, days
+    since epoch), enu (n, 3) float64, lat/lon (or None), offset reached and header.
+    A trailing line without newline is left for the next run."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    text = data[:end].decode('utf-8')
+    lines = io.StringIO(text)
+    if header is None:
+        header = next(csv.reader(lines), [])
+    names = next((a for a in ENU_ALIASES if all(c in header for c in a)), None)
+    if 'date' not in header or names is None:
+        raise ValueError(f'{path}: se esperan columnas date + {"/".join(ENU_ALIASES[0])}')
+    ci = [header.index(c) for c in names]
+    di = header.index('date')
+    li = (header.index('lat'), header.index('lon')) if 'lat' in header and 'lon' in header else None
+    dates, enu, lat, lon = [], [], None, None
+    for rec in csv.reader(lines):
+        try:
+            vals = [float(rec[i]) for i in ci]
+            dates.append(rec[di][:10])
+        except (IndexError, ValueError):
+            continue
+        enu.append(vals)
+        if li and lat is None:
+            try:
+                lat, lon = float(rec[li[0]]), float(rec[li[1]])
+            except (IndexError, ValueError):
+                pass
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64) if dates else np.empty(0, dtype=np.int64)
+    return {'days': days, 'enu': np.asarray(enu, dtype=np.float64).reshape(-1, 3), 'lat': lat, 'lon': lon,
+            'offset': offset + end, 'header': header}
+
+
+def _read_job(args):
+    sid, path, offset, header = args
+    try:
+        return sid, read_station(path, offset, header), None
+    except Exception as e:
+        return sid, None, str(e)
+
+
+def fit_trend(days, enu):
+    """(t0, intercept[3], slope[3] per day) by least squares; slope 0 for short series."""
+    t0 = int(days[0]) if len(days) else 0
+    if len(days) < MIN_FIT_DAYS:
+        return t0, enu.mean(axis=0) if len(days) else np.zeros(3), np.zeros(3)
+    A = np.stack([np.ones(len(days)), (days - t0).astype(np.float64)], axis=1)
+    coef = np.linalg.lstsq(A, enu, rcond=None)[0]
+    return t0, coef[0], coef[1]
+
+
+def fit_trends(days, enu, trends=()):
+    """Extend the causal trend fits of a station series (see the module docstring): a list of
+    {'t0', 'a', 'b', 'n': days fitted (a prefix of the series), 'end': last day fitted}."""
+    trends = list(trends)
+    n = min(len(days), MIN_FIT_DAYS) if not trends else None
+    while True:
+        if trends:
+            last = trends[-1]['n']
+            n = max(math.ceil(last * (1 + REFIT_GROWTH)), last + 1)
+            if last < MIN_FIT_DAYS:
+                n = min(n, MIN_FIT_DAYS)
+        if not n or n > len(days):
+            return trends
+        t0, a, b = fit_trend(days[:n], enu[:n])
+        trends.append({'t0': t0, 'a': a.tolist(), 'b': b.tolist(), 'n': int(n), 'end': int(days[n - 1])})
+
+
+def detrend(days, enu, trends):
+    """Residual ENU: each day minus the last fit that ended before it (the first fit up to its end)."""
+    k = np.maximum(np.searchsorted(np.array([tr['end'] for tr in trends]), days, side='left') - 1, 0)
+    t0 = np.array([tr['t0'] for tr in trends])[k]
+    a, b = np.array([tr['a'] for tr in trends])[k], np.array([tr['b'] for tr in trends])[k]
+    return enu - (a + (days - t0).astype(np.float64)[:, None] * b)
+
+
+class GNSSStore:
+    """Cached station series + metadata + trends under outputs/cache/gnss."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.dir = Path(cache_dir)
+        self.series_dir = self.dir / 'series'
+        self.index_path = self.dir / 'index.json'
+        self.index = {}
+        if self.index_path.exists():
+            self.index = json.loads(self.index_path.read_text(encoding='utf-8'))
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.index, indent=1), encoding='utf-8')
+        os.replace(tmp, self.index_path)
+
+    def series(self, sid):
+        p = self.series_dir / f'{sid}.npz'
+        if not p.exists():
+            return np.empty(0, dtype=np.int64), np.empty((0, 3))
+        with np.load(p) as z:
+            return z['days'], z['enu']
+
+    def _store_series(self, sid, days, enu):
+        self.series_dir.mkdir(parents=True, exist_ok=True)
+        np.savez(self.series_dir / f'{sid}.npz', days=days, enu=enu)
+
+    def plan(self, gnss_dir):
+        """Read jobs (sid, path, offset, header) for new, grown or rewritten station files."""
+        jobs = []
+        for p in sorted(Path(gnss_dir).glob('*.csv')):
+            if p.name == 'stations.csv':
+                continue
+            sid = p.stem
+            st = p.stat()
+            meta = self.index.get(sid)
+            if meta and meta['size'] == st.st_size and meta['mtime_ns'] == st.st_mtime_ns:
+                continue
+            if (meta and st.st_size >= meta['offset']
+                    and _head_sha(p, min(HEAD_BYTES, meta['offset'])) == meta['head_sha']):
+                jobs.append((sid, str(p), meta['offset'], meta['header']))
+            else:
+                jobs.append((sid, str(p), 0, None))
+        return jobs
+
+    def apply(self, sid, path, parsed, appended, refit=False):
+        """Merge a parse result into the cache; returns the number of new days."""
+        old_days, old_enu = self.series(sid) if appended else (np.empty(0, dtype=np.int64), np.empty((0, 3)))
+        days = np.concatenate([old_days, parsed['days']])
+        enu = np.concatenate([old_enu, parsed['enu']])
+        # one value per day, last one read wins
+        order = np.argsort(days, kind='stable')[::-1]
+        _, first = np.unique(days[order], return_index=True)
+        keep = order[first]              # np.unique sorts by day
+        days, enu = days[keep], enu[keep]
+        self._store_series(sid, days, enu)
+        st = Path(path).stat()
+        meta = self.index.get(sid, {}) if appended else {}
+        meta.update({'path': str(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                     'offset': parsed['offset'], 'header': parsed['header'],
+                     'head_sha': _head_sha(path, min(HEAD_BYTES, parsed['offset'])), 'n': int(len(days))})
+        if parsed['lat'] is not None and meta.get('lat') is None:
+            meta['lat'], meta['lon'] = parsed['lat'], parsed['lon']
+        # caches from before the causal fits hold a single whole-series 'trend': start over
+        meta.pop('trend', None)
+        meta['trends'] = fit_trends(days, enu, () if refit else meta.get('trends', ()))
+        self.index[sid] = meta
+        return int(len(days) - len(old_days))
+
+    def refit_all(self):
+        for sid, meta in self.index.items():
+            days, enu = self.series(sid)
+            meta.pop('trend', None)
+            meta['trends'] = fit_trends(days, enu)
+
+    def set_locations(self, stations_csv):
+        p = Path(stations_csv)
+        if not p.exists():
+            return 0
+        n = 0
+        with p.open('r', encoding='utf-8') as f:
+            for r in csv.DictReader(f):
+                meta = self.index.get(r.get('station_id', ''))
+                try:
+                    lat, lon = float(r['lat']), float(r['lon'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if meta is not None:
+                    meta['lat'], meta['lon'] = lat, lon
+                    n += 1
+        return n
+
+    def located(self):
+        return [sid for sid, m in self.index.items() if m.get('lat') is not None]
+
+
+def update_cache(store, gnss_dir, workers=None, refit=False):
+    """Parse new/appended station data in parallel; returns (files read, new days)."""
+    jobs = store.plan(gnss_dir)
+    new_days = 0
+    if jobs:
+        workers = workers or min(8, os.cpu_count() or 1)
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_read_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        else:
+            results = [_read_job(j) for j in jobs]
+        for (sid, path, offset, _), (_, parsed, error) in zip(jobs, results):
+            if error:
+                print(f'[WARN] {sid}: {error}')
+                continue
+            new_days += store.apply(sid, path, parsed, appended=offset > 0, refit=refit)
+    if refit:
+        store.refit_all()
+    return len(jobs), new_days
+
+
+def event_features(store, sids):
+    """Per-day GNSS feature rows over the given stations (dense days x stations layout)."""
+    series = [(sid, *store.series(sid)) for sid in sids]
+    series = [s for s in series if len(s[1])]
+    if not series:
+        return []
+    d0 = min(int(s[1][0]) for s in series)
+    d1 = max(int(s[1][-1]) for s in series)
+    X = np.full((len(series), d1 - d0 + 1, 3), np.nan)
+    for i, (sid, days, enu) in enumerate(series):
+        X[i, days - d0] = detrend(days, enu, store.index[sid]['trends'])
+    disp = np.sqrt((X ** 2).sum(axis=2))              # NaN where the station has no data
+    rate = np.full_like(disp, np.nan)
+    rate[:, 1:] = np.sqrt((np.diff(X, axis=1) ** 2).sum(axis=2))
+    n = np.isfinite(disp).sum(axis=0)
+    has = np.flatnonzero(n)
+    with warnings.catch_warnings():
+        # all-NaN columns of rate (first day of every station) are expected
+        warnings.simplefilter('ignore', RuntimeWarning)
+        med = np.nanmedian(disp[:, has], axis=0)
+        mx = np.nanmax(disp[:, has], axis=0)
+        rmed = np.nanmedian(rate[:, has], axis=0)
+    dates = (has + d0).astype('datetime64[D]').astype(str)
+    rows = []
+    for k in range(len(has)):
+        r = {'date': str(dates[k]), 'gnss_disp_mm': f'{med[k]:.4f}', 'gnss_disp_max_mm': f'{mx[k]:.4f}',
+             'gnss_n_stations': str(int(n[has[k]]))}
+        if not np.isnan(rmed[k]):
+            r['gnss_rate_mm_d'] = f'{rmed[k]:.4f}'
+        rows.append(r)
+    return rows
+
+
+def assign_stations(store, events, max_km):
+    """{event name: [station ids]} using the AOI index (distance to the AOI geometry)."""
+    from aoi_index import AOIIndex, aoi_key
+    sids = store.located()
+    if not sids:
+        return {ev['name']: [] for ev in events}
+    index = AOIIndex()
+    for ev in events:
+        index.update(ROOT / ev['aoi'])
+    hits = index.assign([store.index[s]['lon'] for s in sids], [store.index[s]['lat'] for s in sids], max_km)
+    by_key = {}
+    for sid, keys in zip(sids, hits):
+        for k in keys:
+            by_key.setdefault(k, []).append(sid)
+    return {ev['name']: by_key.get(aoi_key(ROOT / ev['aoi']), []) for ev in events}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description='Ingest GNSS station series into per-event GNSS features')
+    p.add_argument('--dir', default=str(GNSS_DIR), help='Directory with <STATION>.csv files')
+    p.add_argument('--stations', help='Station metadata CSV (default: <dir>/stations.csv)')
+    p.add_argument('-e', '--event', action='append', help='Event name (repeatable; default: all events)')
+    p.add_argument('--aoi', help='AOI GeoJSON for a single --event not in run_eval_batch.EVENTS')
+    p.add_argument('--out-dir', default='data/features', help='Output directory for gnss_<event>.csv')
+    p.add_argument('--mode', choices=['overwrite', 'append'], default='append', help='Write mode')
+    p.add_argument('--max-km', type=float, default=100.0, help='Station to AOI distance (0: inside only)')
+    p.add_argument('--workers', type=int, default=None, help='Station files parsed in parallel')
+    p.add_argument('--refit', action='store_true', help='Refit every station trend')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    from ingest_satellite import _write_rows
+    from run_eval_batch import EVENTS
+    events = EVENTS
+    if args.event:
+        known = {ev['name']: ev for ev in EVENTS}
+        if args.aoi and len(args.event) == 1:
+            events = [{'name': args.event[0], 'aoi': str(Path(args.aoi).resolve())}]
+        else:
+            missing = [e for e in args.event if e not in known]
+            if missing:
+                raise SystemExit(f'Evento(s) desconocido(s): {missing} (usa --aoi)')
+            events = [known[e] for e in args.event]
+    store = GNSSStore()
+    with stage('ingest_parse') as st:
+        n_files, new_days = update_cache(store, args.dir, args.workers, args.refit)
+        store.set_locations(args.stations or Path(args.dir) / 'stations.csv')
+        store.save()
+        st.rows = new_days
+    print(f'GNSS: {len(store.index)} estaciones en caché, {n_files} archivos leídos, {new_days} días nuevos')
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    changed = {}
+    with stage('ingest_gnss') as st:
+        for name, sids in assign_stations(store, events, args.max_km).items():
+            rows = event_features(store, sids)
+            print(f'{name}: {len(sids)} estaciones, {len(rows)} días')
+            changed[name] = _write_rows(rows, out_dir / f'gnss_{name}.csv', args.mode) if rows else 0
+            st.rows += len(rows)
+    write_run_summary('ingest_gnss', {'stations': len(store.index), 'files_read': n_files,
+                                      'new_days': new_days, 'rows_changed': changed})
+
+
+if __name__ == '__main__':
+    main()
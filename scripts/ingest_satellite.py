@@ -7,28 +7,51 @@ the IASi prototype expects for deformation/features (data/features/*.csv).
 Usage examples:
   python scripts/ingest_satellite.py --input raw_sat.csv --event Valdivia_1960
   python scripts/ingest_satellite.py -i raw.csv -e Maule_2010 --mode append
+  python scripts/ingest_satellite.py --raster data/rasters/maule -e Maule_2010 --aoi config/aoi_maule.geojson --mode append
 
 The input CSV must contain at least a date column and either 'p95_defo_mm' and 'mean_coh'
 or you can map your column names with --p95-col and --coh-col.
 
+Raster mode (--raster) reduces per-date deformation/coherence arrays (.npy/.npz,
+memory-mapped; see raster_features.py) over the AOI polygon and also produces
+mean_defo_mm and area_defo_gt10mm_km2.
+
 Output: writes to data/features/features_<event>.csv with header: date,mean_coh,p95_defo_mm
-Dates are normalized to YYYY-MM-DD and invalid rows are skipped.
+(plus mean_defo_mm,area_defo_gt10mm_km2 when available, in validate_inputs.py order).
+Dates are normalized to YYYY-MM-DD, or to a UTC timestamp YYYY-MM-DDTHH:MM:SS when
+the input carries the acquisition time (ISO 8601, optional Z / offset); the join
+uses it at hour resolution and folds it into its day otherwise. Invalid rows are
+skipped.
+In append mode only rows whose (date, values) differ from the stored features are
+merged; if nothing changed the output file is left untouched. The number of changed
+rows is reported as rows_changed in outputs/timings/ingest_satellite.json so the
+upload server can skip the pipeline for no-op uploads.
 """
 import argparse
 import csv
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+from telemetry import stage, write_run_summary
+
+# column order of the features table (same as SCHEMAS['features'] in validate_inputs.py)
+FEATURE_COLS = ['date', 'mean_defo_mm', 'p95_defo_mm', 'mean_coh', 'area_defo_gt10mm_km2']
 
 
 def parse_args():
     p = argparse.ArgumentParser(description='Ingest satellite table to IASi feature CSV')
-    p.add_argument('-i', '--input', required=True, help='Input CSV path (satellite output)')
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument('-i', '--input', help='Input CSV path (satellite output)')
+    src.add_argument('--raster', help='Directory with per-date deformation/coherence rasters (.npy/.npz)')
     p.add_argument('-e', '--event', required=True, help='Event name (used to name output file)')
     p.add_argument('--out-dir', default='data/features', help='Output directory for feature CSVs')
     p.add_argument('--mode', choices=['overwrite','append'], default='overwrite', help='Write mode')
-    p.add_argument('--date-col', default='date', help='Column name for date (YYYY-MM-DD)')
+    p.add_argument('--date-col', default='date', help='Column name for date (YYYY-MM-DD or ISO timestamp)')
     p.add_argument('--coh-col', default='mean_coh', help='Column name for coherence (0..1)')
     p.add_argument('--p95-col', default='p95_defo_mm', help='Column name for 95th percentile deformation (mm)')
+    p.add_argument('--aoi', help='AOI GeoJSON for --raster (default: config/aoi_<event>.geojson)')
+    p.add_argument('--workers', type=int, default=None, help='Dates reduced in parallel (--raster)')
+    p.add_argument('--point-radius-km', type=float, default=10.0, help='Buffer for point/line AOIs (--raster)')
     return p.parse_args()
 
 
@@ -39,11 +62,14 @@ def norm_date(s):
             return datetime.strptime(s, fmt).date().isoformat()
         except Exception:
             continue
-    # try ISO parse fallback
+    # ISO date / timestamp fallback; a timestamp keeps the acquisition time, in UTC
     try:
-        return datetime.fromisoformat(s).date().isoformat()
+        d = datetime.fromisoformat(s[:-1] + '+00:00' if s.endswith('Z') else s)
     except Exception:
         return None
+    if d.tzinfo is not None:
+        d = d.astimezone(timezone.utc).replace(tzinfo=None)
+    return d.isoformat(timespec='seconds') if len(s.strip()) > 10 else d.date().isoformat()
 
 
 def ingest(in_path, event, out_dir, mode, date_col, coh_col, p95_col):
@@ -54,6 +80,33 @@ def ingest(in_path, event, out_dir, mode, date_col, coh_col, p95_col):
     out_dir.mkdir(parents=True, exist_ok=True)
     out_file = out_dir / f'features_{event}.csv'
 
+    with stage('ingest_parse') as st:
+        st.bytes_read = inp.stat().st_size
+        rows = _read_rows(inp, date_col, coh_col, p95_col)
+        st.rows = len(rows)
+        changed = _write_rows(rows, out_file, mode)
+        if changed and out_file.exists():
+            st.bytes_written = out_file.stat().st_size
+    return changed
+
+
+def ingest_raster(raster_dir, event, out_dir, mode, aoi, workers=None, point_radius_km=10.0):
+    from raster_features import raster_feature_rows
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / f'features_{event}.csv'
+    if aoi is None:
+        aoi = Path(__file__).resolve().parents[1] / 'config' / f'aoi_{event}.geojson'
+    with stage('ingest_raster') as st:
+        rows = raster_feature_rows(raster_dir, aoi, workers=workers, point_radius_km=point_radius_km)
+        st.rows = len(rows)
+        changed = _write_rows(rows, out_file, mode)
+        if changed and out_file.exists():
+            st.bytes_written = out_file.stat().st_size
+    return changed
+
+
+def _read_rows(inp, date_col, coh_col, p95_col):
     rows = []
     with inp.open('r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
@@ -76,39 +129,69 @@ def ingest(in_path, event, out_dir, mode, date_col, coh_col, p95_col):
             except Exception:
                 continue
             rows.append({'date': d, 'mean_coh': f'{coh_v:.4f}', 'p95_defo_mm': f'{p95_v:.4f}'})
+    return rows
 
+
+def _same_values(old, new):
+    try:
+        return all(round(float(old[k]), 4) == round(float(v), 4) for k, v in new.items() if k != 'date')
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _fieldnames(*keysets):
+    present = set().union(*keysets)
+    return [c for c in FEATURE_COLS if c in present] + sorted(present - set(FEATURE_COLS))
+
+
+def _write_rows(rows, out_file, mode):
+    """Write rows to out_file; returns how many rows were new or changed."""
     if not rows:
         print('No filas válidas encontradas en la entrada; no se escribirá archivo.')
-        return
+        return 0
 
     # If append, read existing and merge by date (keep latest from input)
     if mode == 'append' and out_file.exists():
         existing = {}
         with out_file.open('r', encoding='utf-8') as f:
             r = csv.DictReader(f)
+            old_cols = r.fieldnames or []
             for rec in r:
                 existing[rec['date']] = rec
-        for rec in rows:
-            existing[rec['date']] = rec
+        incoming = {rec['date']: rec for rec in rows}
+        changed = [rec for d, rec in incoming.items() if d not in existing or not _same_values(existing[d], rec)]
+        if not changed:
+            print(f'Sin cambios respecto a {out_file} ({len(incoming)} filas ya presentes); no se reescribe.')
+            return 0
+        for rec in changed:
+            # keep stored columns the new row does not carry (e.g. CSV rows without area)
+            existing[rec['date']] = {**existing.get(rec['date'], {}), **rec}
         merged = [existing[k] for k in sorted(existing.keys())]
         with out_file.open('w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['date','mean_coh','p95_defo_mm'])
+            writer = csv.DictWriter(f, fieldnames=_fieldnames(old_cols, *(r.keys() for r in changed)), restval='')
             writer.writeheader()
             writer.writerows(merged)
-        print(f'Archivo actualizado (append) en: {out_file} ({len(merged)} filas)')
+        print(f'Archivo actualizado (append) en: {out_file} ({len(merged)} filas, {len(changed)} nuevas/cambiadas)')
+        return len(changed)
     else:
         # overwrite
         rows_sorted = sorted(rows, key=lambda x: x['date'])
         with out_file.open('w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['date','mean_coh','p95_defo_mm'])
+            writer = csv.DictWriter(f, fieldnames=_fieldnames(*(r.keys() for r in rows_sorted)), restval='')
             writer.writeheader()
             writer.writerows(rows_sorted)
         print(f'Archivo escrito: {out_file} ({len(rows_sorted)} filas)')
+        return len(rows_sorted)
 
 
 def main():
     args = parse_args()
-    ingest(args.input, args.event, args.out_dir, args.mode, args.date_col, args.coh_col, args.p95_col)
+    if args.raster:
+        changed = ingest_raster(args.raster, args.event, args.out_dir, args.mode, args.aoi, args.workers,
+                                args.point_radius_km)
+    else:
+        changed = ingest(args.input, args.event, args.out_dir, args.mode, args.date_col, args.coh_col, args.p95_col)
+    write_run_summary('ingest_satellite', {'event': args.event, 'rows_changed': changed})
 
 
 if __name__ == '__main__':
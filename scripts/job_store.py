@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+job_store.py
+Persistent store (SQLite) for upload jobs: every /upload_sat gets a job id that is
+returned to the client and passed to the ingest / scoring / export scripts via the
+IASI_JOB_ID environment variable. Each job records per-stage timestamps, latency,
+row counts and the final outcome, plus upload-to-publish freshness.
+
+Usage:
+  python scripts/job_store.py list [--event Maule_2010]
+  python scripts/job_store.py show <job_id>
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'outputs' / 'jobs.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    event TEXT,
+    path TEXT,
+    created_at REAL,
+    updated_at REAL,
+    status TEXT,
+    outcome TEXT,
+    error TEXT,
+    rows INTEGER,
+    bytes INTEGER,
+    stages TEXT,
+    published_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_event ON jobs(event, created_at);
+"""
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:16]
+
+
+class JobStore:
+    def __init__(self, path=DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        con = sqlite3.connect(str(self.path), timeout=10)
+        con.row_factory = sqlite3.Row
+        con.execute('PRAGMA journal_mode=WAL')
+        return con
+
+    def create(self, event, path=None, job_id=None, created_at=None):
+        job_id = job_id or new_job_id()
+        now = created_at or time.time()
+        with self._lock, self._connect() as con:
+            con.execute('INSERT INTO jobs (id, event, path, created_at, updated_at, status, rows, bytes, stages) '
+                        'VALUES (?,?,?,?,?,?,?,?,?)',
+                        (job_id, event, str(path) if path else None, now, now, 'received', 0, 0, '{}'))
+        return job_id
+
+    def _update(self, job_id, fn):
+        with self._lock, self._connect() as con:
+            r = con.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+            if r is None:
+                return None
+            job = dict(r)
+            job['stages'] = json.loads(job['stages'] or '{}')
+            fn(job)
+            job['updated_at'] = time.time()
+            con.execute('UPDATE jobs SET path=?, updated_at=?, status=?, outcome=?, error=?, rows=?, bytes=?, '
+                        'stages=?, published_at=? WHERE id=?',
+                        (job['path'], job['updated_at'], job['status'], job['outcome'], job['error'], job['rows'],
+                         job['bytes'], json.dumps(job['stages']), job['published_at'], job_id))
+            return job
+
+    def stage(self, job_id, name, started_at, finished_at=None, rows=None, nbytes=None, **extra):
+        """Record one stage; status becomes the stage name."""
+        finished_at = finished_at or time.time()
+
+        def fn(job):
+            st = {'started_at': started_at, 'finished_at': finished_at,
+                  'seconds': round(finished_at - started_at, 6)}
+            if rows is not None:
+                st['rows'] = rows
+                job['rows'] = max(job['rows'] or 0, rows)
+            if nbytes is not None:
+                st['bytes'] = nbytes
+                job['bytes'] = max(job['bytes'] or 0, nbytes)
+            st.update({k: v for k, v in extra.items() if v is not None})
+            job['stages'][name] = st
+            job['status'] = name
+            if name == 'published':
+                job['published_at'] = finished_at
+        return self._update(job_id, fn)
+
+    def set_path(self, job_id, path):
+        def fn(job):
+            job['path'] = str(path)
+        return self._update(job_id, fn)
+
+    def finish(self, job_id, outcome, error=None):
+        def fn(job):
+            job['outcome'] = outcome
+            job['error'] = error
+            job['status'] = outcome
+        return self._update(job_id, fn)
+
+    def get(self, job_id):
+        with self._connect() as con:
+            r = con.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+        return self._to_dict(r) if r else None
+
+    def list(self, event=None, limit=50, offset=0):
+        sql, args = 'SELECT * FROM jobs', []
+        if event:
+            sql += ' WHERE event=?'
+            args.append(event)
+        sql += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
+        args += [int(limit), int(offset)]
+        with self._connect() as con:
+            return [self._to_dict(r) for r in con.execute(sql, args)]
+
+    @staticmethod
+    def _to_dict(r):
+        d = dict(r)
+        d['stages'] = json.loads(d['stages'] or '{}')
+        d['latency_s'] = {k: v.get('seconds') for k, v in d['stages'].items()}
+        end = d['published_at'] or (d['updated_at'] if d['outcome'] else None)
+        d['total_s'] = round(end - d['created_at'], 6) if end else None
+        d['freshness_s'] = round(d['published_at'] - d['created_at'], 6) if d['published_at'] else None
+        return d
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Consulta de jobs de carga (upload -> publish)')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    ls = sub.add_parser('list')
+    ls.add_argument('--event')
+    ls.add_argument('--limit', type=int, default=20)
+    sh = sub.add_parser('show')
+    sh.add_argument('job_id')
+    args = ap.parse_args()
+    store = JobStore()
+    if args.cmd == 'list':
+        for j in store.list(args.event, args.limit):
+            print(f"{j['id']}\t{j['event']}\t{j['status']}\t{j['outcome'] or '-'}\ttotal={j['total_s']}s")
+    else:
+        print(json.dumps(store.get(args.job_id), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
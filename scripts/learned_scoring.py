@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+learned_scoring.py
+Alternative to the fixed linear blend of compute_row(): a calibrated classifier
+trained on the transformed components (one per component of the channel
+registry, config/channels.yaml, for every day of every event timeline) against catalog labels (earthquake >= Mw 6.5 in the next
+--window-days, same labels as the metrics in run_eval_batch.py). Its predicted
+probability replaces IASi; `estado` keeps the thresholds of thresholds.yaml.
+
+Training:
+  - per-event datasets are built in parallel (one process per event);
+  - leave-one-event-out folds are fitted and scored in parallel (held-out
+    AUC-PR / Brier in the model metadata);
+  - the final model is fitted on every event.
+Models: logistic (LogisticRegression) or gbm (HistGradientBoostingClassifier),
+both wrapped in CalibratedClassifierCV.
+
+The fitted model is pickled to outputs/models/<sha256>.pkl, named by the sha256
+of its bytes, with <sha256>.json metadata and outputs/models/latest.json pointing
+to the newest one. load_model() verifies the hash and caches the model per
+process, so inference (one predict_proba call per event timeline) never reloads it.
+
+Usage:
+  python scripts/learned_scoring.py train --kind logistic --window-days 14 --workers 4
+  python scripts/learned_scoring.py list
+  python scripts/run_eval_batch.py --scoring learned [--model <sha prefix>]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from channels import load_registry
+
+ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = ROOT / 'outputs' / 'models'
+FEATURES = list(load_registry().components)
+KINDS = ('logistic', 'gbm')
+
+_LOADED = {}
+
+
+def event_dataset(name, window_days):
+    """(X, y) for one event of run_eval_batch.EVENTS: transformed components and labels."""
+    import run_eval_batch as reb
+    ev = next(e for e in reb.EVENTS if e['name'] == name)
+    join = reb.event_join(ev)
+    if not len(join):
+        return np.empty((0, len(FEATURES))), np.empty(0, dtype=np.int64)
+    X = reb.score_join(join)[0].T
+    dates = reb.parse_times(join.dates())
+    cat = reb.load_eq_catalog(reb.eq_catalog_for(name, ev['aoi']), mw_min=6.5)
+    y = np.asarray(reb.labels_from_catalog(dates, cat, window_days), dtype=np.int64)
+    return X, y
+
+
+def make_model(kind, calibration='sigmoid', seed=0):
+    from sklearn.calibration import CalibratedClassifierCV
+    if kind == 'logistic':
+        from sklearn.linear_model import LogisticRegression
+        base = LogisticRegression(class_weight='balanced', max_iter=1000)
+    elif kind == 'gbm':
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        base = HistGradientBoostingClassifier(max_iter=200, learning_rate=0.05, max_leaf_nodes=15,
+                                              class_weight='balanced', random_state=seed)
+    else:
+        raise ValueError(f'kind debe ser uno de {KINDS}')
+    return CalibratedClassifierCV(base, method=calibration, cv=3)
+
+
+def _fit(kind, calibration, X, y):
+    if len(np.unique(y)) < 2:
+        raise ValueError(f'las etiquetas tienen una sola clase ({int(y.sum())} positivos de {len(y)})')
+    return make_model(kind, calibration).fit(X, y)
+
+
+def _fold(args):
+    """Fit on every event but one; AUC-PR / Brier on the held-out event."""
+    held, kind, calibration, data = args
+    from sklearn.metrics import average_precision_score, brier_score_loss
+    X = np.concatenate([d[0] for n, d in data.items() if n != held])
+    y = np.concatenate([d[1] for n, d in data.items() if n != held])
+    Xh, yh = data[held]
+    try:
+        p = _fit(kind, calibration, X, y).predict_proba(Xh)[:, 1]
+    except ValueError as e:
+        return held, {'error': str(e)}
+    out = {'n': int(len(yh)), 'positives': int(yh.sum()), 'brier': round(float(brier_score_loss(yh, p)), 4)}
+    if 0 < yh.sum() < len(yh):
+        out['auc_pr'] = round(float(average_precision_score(yh, p)), 4)
+    return held, out
+
+
+def _dataset_job(args):
+    name, window_days = args
+    return name, event_dataset(name, window_days)
+
+
+def train(kind='logistic', window_days=14, calibration='sigmoid', workers=None, events=None):
+    import run_eval_batch as reb
+    names = events or [e['name'] for e in reb.EVENTS]
+    workers = workers or min(len(names), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        data = dict(pool.map(_dataset_job, [(n, window_days) for n in names]))
+        data = {n: d for n, d in data.items() if len(d[1])}
+        if not data:
+            raise SystemExit('Sin datos: ejecuta primero bootstrap / ingestas para tener timelines')
+        folds = dict(pool.map(_fold, [(n, kind, calibration, data) for n in data])) if len(data) > 1 else {}
+    X = np.concatenate([d[0] for d in data.values()])
+    y = np.concatenate([d[1] for d in data.values()])
+    model = _fit(kind, calibration, X, y)
+    meta = {'kind': kind, 'calibration': calibration, 'window_days': window_days, 'features': FEATURES,
+            'events': sorted(data), 'n': int(len(y)), 'positives': int(y.sum()), 'folds': folds,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sklearn': _sklearn_version()}
+    return save_model(model, meta)
+
+
+def _sklearn_version():
+    import sklearn
+    return sklearn.__version__
+
+
+def save_model(model, meta, models_dir=MODELS_DIR):
+    """Pickle model as <sha256>.pkl (+ .json metadata) and point latest.json to it; returns the sha256."""
+    body = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    sha = hashlib.sha256(body).hexdigest()
+    models_dir = Path(models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+    (models_dir / f'{sha}.pkl').write_bytes(body)
+    meta = {**meta, 'sha256': sha, 'bytes': len(body)}
+    (models_dir / f'{sha}.json').write_text(json.dumps(meta, indent=2), encoding='utf-8')
+    tmp = models_dir / 'latest.json.tmp'
+    tmp.write_text(json.dumps({'sha256': sha}), encoding='utf-8')
+    os.replace(tmp, models_dir / 'latest.json')
+    return sha
+
+
+def resolve(ref='latest', models_dir=MODELS_DIR):
+    models_dir = Path(models_dir)
+    if ref in (None, '', 'latest'):
+        p = models_dir / 'latest.json'
+        if not p.exists():
+            raise FileNotFoundError('No hay modelos entrenados (python scripts/learned_scoring.py train)')
+        return json.loads(p.read_text(encoding='utf-8'))['sha256']
+    found = [p.stem for p in models_dir.glob(f'{ref}*.pkl')]
+    if len(found) != 1:
+        raise FileNotFoundError(f'Modelo {ref!r}: {len(found)} coincidencias en {models_dir}')
+    return found[0]
+
+
+def load_model(ref='latest', models_dir=MODELS_DIR):
+    """{'sha256', 'model', 'meta'}; verified against its hash and loaded once per process."""
+    sha = resolve(ref, models_dir)
+    if sha not in _LOADED:
+        body = (Path(models_dir) / f'{sha}.pkl').read_bytes()
+        if hashlib.sha256(body).hexdigest() != sha:
+            raise ValueError(f'Modelo {sha[:12]}: el contenido no coincide con su hash')
+        meta = json.loads((Path(models_dir) / f'{sha}.json').read_text(encoding='utf-8'))
+        _LOADED[sha] = {'sha256': sha, 'model': pickle.loads(body), 'meta': meta}
+    return _LOADED[sha]
+
+
+def predict(loaded, X):
+    """Calibrated probabilities for a (days, components) matrix, in one batch."""
+    if loaded['meta'].get('features', FEATURES) != FEATURES:
+        raise ValueError(f"Modelo {loaded['sha256'][:12]}: entrenado con componentes {loaded['meta']['features']}, "
+                         f'el registro de canales tiene {FEATURES}; reentrena')
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+    if not len(X):
+        return np.empty(0)
+    return loaded['model'].predict_proba(X)[:, 1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Scoring IASi aprendido (scikit-learn)')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    tr = sub.add_parser('train')
+    tr.add_argument('--kind', choices=KINDS, default='logistic')
+    tr.add_argument('--window-days', type=int, default=14)
+    tr.add_argument('--calibration', choices=['sigmoid', 'isotonic'], default='sigmoid')
+    tr.add_argument('--workers', type=int, default=None)
+    tr.add_argument('-e', '--event', action='append', help='Eventos a usar (por defecto todos)')
+    sub.add_parser('list')
+    args = ap.parse_args()
+    if args.cmd == 'train':
+        sha = train(args.kind, args.window_days, args.calibration, args.workers, args.event)
+        meta = load_model(sha)['meta']
+        print(f"Modelo {sha[:12]} ({meta['kind']}, {meta['n']} días, {meta['positives']} positivos)")
+        for name, f in meta['folds'].items():
+            print(f'  fuera de muestra {name}: {f}')
+        return
+    latest = None
+    try:
+        latest = resolve('latest')
+    except FileNotFoundError:
+        pass
+    for p in sorted(MODELS_DIR.glob('*.json'), key=lambda p: p.stat().st_mtime):
+        if p.name == 'latest.json':
+            continue
+        m = json.loads(p.read_text(encoding='utf-8'))
+        mark = '*' if m['sha256'] == latest else ' '
+        print(f"{mark} {m['sha256'][:12]}  {m['kind']:8s} {m['window_days']:3d}d  n={m['n']} pos={m['positives']}  {m['created']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+raster_features.py
+Reduce per-date deformation / coherence rasters to the D-channel feature rows
+(date, mean_defo_mm, p95_defo_mm, mean_coh, area_defo_gt10mm_km2) over an AOI.
+Used by `ingest_satellite.py --raster <dir>`.
+
+Accepted layouts inside <dir> (regular lon/lat grid described by grid.json:
+{"lon0": west edge, "lat0": north edge, "dlon": deg, "dlat": deg, "width": W, "height": H}):
+  defo_<YYYY-MM-DD>.npy + coh_<YYYY-MM-DD>.npy   one 2-D array per date (memory-mapped)
+  defo.npy + coh.npy + dates.txt                  (T, H, W) stacks, one date per line (memory-mapped)
+  <YYYY-MM-DD>.npz with arrays defo, coh          read per date (npz members cannot be mapped)
+grid.json may be omitted for .npz inputs that carry 1-D 'lon' / 'lat' pixel-center arrays.
+
+The AOI polygon is rasterized once per (AOI, grid) into a boolean mask cropped to
+the AOI bounding window and cached under outputs/cache/masks/. Point or line AOIs
+are buffered by --point-radius-km. Each date only reads the AOI window, in blocks
+of rows, so memory per worker is bounded by the window width x block rows (plus
+the masked deformation values needed for the exact p95).
+"""
+import hashlib
+import json
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+MASK_CACHE = ROOT / 'outputs' / 'cache' / 'masks'
+AREA_THRESHOLD_MM = 10.0
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON = 111.320
+
+_DATE_RE = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+
+class RasterSource:
+    """Lazy access to the per-date defo/coh arrays of one raster directory."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        if not self.root.is_dir():
+            raise FileNotFoundError(f'Directorio de rásters no encontrado: {root}')
+        self.grid = None
+        gpath = self.root / 'grid.json'
+        if gpath.exists():
+            self.grid = json.loads(gpath.read_text(encoding='utf-8'))
+        self._stack = None
+        self._files = {}
+        if (self.root / 'defo.npy').exists() and (self.root / 'coh.npy').exists():
+            defo = np.load(self.root / 'defo.npy', mmap_mode='r')
+            coh = np.load(self.root / 'coh.npy', mmap_mode='r')
+            dates = [ln.strip() for ln in (self.root / 'dates.txt').read_text(encoding='utf-8').splitlines() if ln.strip()]
+            if defo.shape != coh.shape or defo.ndim != 3 or defo.shape[0] != len(dates):
+                raise ValueError('defo.npy / coh.npy deben ser pilas (T, H, W) con una fecha de dates.txt por capa')
+            self._stack = (defo, coh, {d: i for i, d in enumerate(dates)})
+            self.dates = sorted(dates)
+            shape = defo.shape[1:]
+        else:
+            for p in self.root.iterdir():
+                m = _DATE_RE.search(p.name)
+                if not m:
+                    continue
+                d = m.group(1)
+                if p.suffix == '.npz':
+                    self._files.setdefault(d, {})['npz'] = p
+                elif p.suffix == '.npy' and p.name.startswith('defo_'):
+                    self._files.setdefault(d, {})['defo'] = p
+                elif p.suffix == '.npy' and p.name.startswith('coh_'):
+                    self._files.setdefault(d, {})['coh'] = p
+            self.dates = sorted(d for d, f in self._files.items() if 'npz' in f or ('defo' in f and 'coh' in f))
+            if not self.dates:
+                raise ValueError(f'No se encontraron fechas de rásters en {root}')
+            shape = self.read(self.dates[0])[0].shape
+        if self.grid is None:
+            self.grid = self._grid_from_npz()
+        self.grid.setdefault('height', shape[0])
+        self.grid.setdefault('width', shape[1])
+        if (self.grid['height'], self.grid['width']) != tuple(shape):
+            raise ValueError(f"tamaño de grid.json {self.grid['height']}x{self.grid['width']} != ráster {shape}")
+
+    def _grid_from_npz(self):
+        first = self._files.get(self.dates[0], {}).get('npz') if self.dates else None
+        if first is None:
+            raise ValueError('se requiere grid.json salvo que los .npz traigan arreglos lon/lat')
+        with np.load(first) as z:
+            if 'lon' not in z or 'lat' not in z:
+                raise ValueError('se requiere grid.json salvo que los .npz traigan arreglos lon/lat')
+            lon, lat = np.asarray(z['lon'], dtype=float), np.asarray(z['lat'], dtype=float)
+        dlon = float(lon[1] - lon[0]) if lon.size > 1 else 1.0
+        dlat = float(lat[0] - lat[1]) if lat.size > 1 else 1.0
+        return {'lon0': float(lon[0]) - dlon / 2, 'lat0': float(lat[0]) + dlat / 2, 'dlon': dlon, 'dlat': dlat}
+
+    def read(self, date):
+        """(defo, coh) 2-D arrays for date; memory-mapped where the format allows it."""
+        if self._stack is not None:
+            defo, coh, idx = self._stack
+            return defo[idx[date]], coh[idx[date]]
+        f = self._files[date]
+        if 'npz' in f:
+            with np.load(f['npz']) as z:
+                return z['defo'], z['coh']
+        return np.load(f['defo'], mmap_mode='r'), np.load(f['coh'], mmap_mode='r')
+
+
+def _aoi_geometry(aoi_path, point_radius_km):
+    from shapely import affinity
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+    gj = json.loads(Path(aoi_path).read_text(encoding='utf-8'))
+    feats = gj.get('features') if gj.get('type') == 'FeatureCollection' else [gj]
+    geoms = []
+    for f in feats:
+        g = shape(f.get('geometry') if f.get('type') == 'Feature' else f)
+        if g.geom_type not in ('Polygon', 'MultiPolygon'):
+            # points / lines: buffer in degrees, widened in longitude for the latitude
+            c = g.centroid
+            r = point_radius_km / KM_PER_DEG_LAT
+            g = affinity.scale(g.buffer(r), xfact=1.0 / max(math.cos(math.radians(c.y)), 1e-6), yfact=1.0,
+                               origin=c)
+        geoms.append(g)
+    if not geoms:
+        raise ValueError(f'AOI sin geometrías: {aoi_path}')
+    return unary_union(geoms)
+
+
+def aoi_mask(aoi_path, grid, point_radius_km=10.0, cache_dir=MASK_CACHE):
+    """Rasterize the AOI on grid (pixel centers inside the geometry).
+    Returns (window, mask) with window = (row0, row1, col0, col1) and mask cropped to it."""
+    key = hashlib.sha256(Path(aoi_path).read_bytes()
+                         + json.dumps([grid[k] for k in ('lon0', 'lat0', 'dlon', 'dlat', 'width', 'height')]
+                                      + [point_radius_km]).encode()).hexdigest()[:16]
+    cache = Path(cache_dir) / f'{Path(aoi_path).stem}_{key}.npz'
+    if cache.exists():
+        with np.load(cache) as z:
+            return tuple(int(v) for v in z['window']), z['mask']
+    import shapely
+    geom = _aoi_geometry(aoi_path, point_radius_km)
+    minx, miny, maxx, maxy = geom.bounds
+    lon0, lat0, dlon, dlat = grid['lon0'], grid['lat0'], grid['dlon'], grid['dlat']
+    col0 = max(0, int(math.floor((minx - lon0) / dlon)))
+    col1 = min(grid['width'], int(math.ceil((maxx - lon0) / dlon)))
+    row0 = max(0, int(math.floor((lat0 - maxy) / dlat)))
+    row1 = min(grid['height'], int(math.ceil((lat0 - miny) / dlat)))
+    if row1 <= row0 or col1 <= col0:
+        mask = np.zeros((0, 0), dtype=bool)
+        row0 = row1 = col0 = col1 = 0
+    else:
+        lons = lon0 + (np.arange(col0, col1) + 0.5) * dlon
+        lats = lat0 - (np.arange(row0, row1) + 0.5) * dlat
+        xx, yy = np.meshgrid(lons, lats)
+        shapely.prepare(geom)
+        mask = shapely.contains_xy(geom, xx, yy)
+    window = (row0, row1, col0, col1)
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache, window=np.array(window), mask=mask)
+    except OSError:
+        pass
+    return window, mask
+
+
+def pixel_area_km2(grid, row0, row1):
+    """Area of one pixel (km²) for each row in [row0, row1)."""
+    lats = grid['lat0'] - (np.arange(row0, row1) + 0.5) * grid['dlat']
+    return (grid['dlon'] * KM_PER_DEG_LON * np.cos(np.radians(lats))) * (grid['dlat'] * KM_PER_DEG_LAT)
+
+
+def reduce_date(src, date, window, mask, areas, block_rows=256):
+    """Feature row for one date, reading the AOI window block by block."""
+    row0, row1, col0, col1 = window
+    defo, coh = src.read(date)
+    n_coh = 0
+    sum_coh = 0.0
+    sum_defo = 0.0
+    area = 0.0
+    vals = []
+    for r in range(row0, row1, block_rows):
+        r2 = min(r + block_rows, row1)
+        m = mask[r - row0:r2 - row0]
+        d = np.abs(np.asarray(defo[r:r2, col0:col1], dtype=np.float32))
+        c = np.asarray(coh[r:r2, col0:col1], dtype=np.float32)
+        md = m & np.isfinite(d)
+        mc = m & np.isfinite(c)
+        dv = d[md]
+        vals.append(dv)
+        sum_defo += float(dv.sum(dtype=np.float64))
+        sum_coh += float(c[mc].sum(dtype=np.float64))
+        n_coh += int(mc.sum())
+        area += float(((md & (d > AREA_THRESHOLD_MM)) * areas[r - row0:r2 - row0, None]).sum())
+    dv = np.concatenate(vals) if vals else np.empty(0, dtype=np.float32)
+    if dv.size == 0 or n_coh == 0:
+        return None
+    return {
+        'date': date,
+        'mean_defo_mm': f'{sum_defo / dv.size:.4f}',
+        'p95_defo_mm': f'{float(np.percentile(dv, 95)):.4f}',
+        'mean_coh': f'{sum_coh / n_coh:.4f}',
+        'area_defo_gt10mm_km2': f'{area:.4f}',
+    }
+
+
+def raster_feature_rows(raster_dir, aoi_path, workers=None, point_radius_km=10.0, block_rows=256, dates=None):
+    """Feature rows (one per date with valid pixels) for the AOI, computed in parallel over dates."""
+    src = RasterSource(raster_dir)
+    window, mask = aoi_mask(aoi_path, src.grid, point_radius_km)
+    if not mask.any():
+        raise ValueError(f'El AOI {aoi_path} no cubre ningún píxel de la grilla del ráster')
+    areas = pixel_area_km2(src.grid, window[0], window[1])
+    todo = [d for d in src.dates if dates is None or d in dates]
+    workers = workers or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(lambda d: reduce_date(src, d, window, mask, areas, block_rows), todo))
+    return [r for r in rows if r is not None]
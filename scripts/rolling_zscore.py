@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+rolling_zscore.py
+Rolling-baseline z-scores for raw signal columns (r_ppm -> r_zscore,
+s_duration_h -> s_activity_z), computed per station instead of trusting the
+precomputed columns.
+
+Methods (config/zscore.yaml, per signal file):
+  ewm     exponentially weighted mean / variance, alpha = 2 / (window + 1)
+  window  mean / sample std over the last `window` observations (sliding Welford)
+  mad     median / 1.4826 * MAD over the last `window` observations (robust)
+The z-score of an observation is taken against the baseline of the observations
+before it, so a spike does not dampen itself. Until `min_periods` observations
+are available (or when the spread is 0) no z-score is produced and the stored
+column value, if any, is kept.
+
+Two equivalent paths:
+  RollingZ.update(x)   streaming, O(1) per observation for ewm / window
+                       (O(window) for mad, which keeps a sorted window)
+  batch_zscores(x)     vectorized (pandas / numpy) for backfills
+Per-station baseline state (ewm mean / variance / count, the window buffer or
+the MAD window) and the z-scores already produced are persisted under
+outputs/cache/zscore/ (ZScoreStore), so a run with new daily rows reuses the
+stored scores and only feeds the new observations through update(). A station
+is recomputed with the batch path when its history changed: fewer observations
+or a different last processed day, rows inserted before it, a different config,
+or edited values among the last TAIL observations (the check costs O(TAIL), not
+O(history), so older edits need `reset`).
+Observations with an empty or unparseable date are skipped.
+
+Usage:
+  python scripts/rolling_zscore.py score data/signals/radon.csv --column r_ppm --method mad --window 60
+  python scripts/rolling_zscore.py check --rows 100000         # streaming == batch
+  python scripts/rolling_zscore.py reset
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from signal_table import SignalTable
+from timebase import DAY_S, valid_epoch
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_PATH = ROOT / 'config' / 'zscore.yaml'
+CACHE_DIR = ROOT / 'outputs' / 'cache' / 'zscore'
+MAD_SCALE = 1.4826
+# observations hashed at the end of a station's stored prefix to detect edited history
+TAIL = 256
+METHODS = ('ewm', 'window', 'mad')
+
+# per signal file (stem): raw column -> z-score column consumed by compute_row()
+DEFAULTS = {
+    'radon': {'column': 'r_ppm', 'target': 'r_zscore', 'method': 'ewm', 'window': 30, 'min_periods': 7},
+    'sensors': {'column': 's_duration_h', 'target': 's_activity_z', 'method': 'ewm', 'window': 30,
+                'min_periods': 7},
+}
+
+
+def load_config(path=CFG_PATH):
+    """{signal: settings} from config/zscore.yaml over DEFAULTS; `enabled: false` drops a signal."""
+    cfg = {k: dict(v) for k, v in DEFAULTS.items()}
+    p = Path(path)
+    if p.exists():
+        import yaml
+        user = yaml.safe_load(p.read_text(encoding='utf-8')) or {}
+        for name, opts in user.items():
+            if isinstance(opts, dict):
+                cfg[name] = {**cfg.get(name, {}), **opts}
+    out = {}
+    for name, c in cfg.items():
+        if not c.get('enabled', True):
+            continue
+        if c.get('method') not in METHODS or not c.get('column') or not c.get('target'):
+            raise ValueError(f'zscore.yaml: configuración inválida para {name}: {c}')
+        c['window'] = int(c['window'])
+        c['min_periods'] = max(2, int(c.get('min_periods', 2)))
+        out[name] = c
+    return out
+
+
+class RollingZ:
+    """Streaming baseline for one station."""
+
+    def __init__(self, method='ewm', window=30, min_periods=7):
+        self.method = method
+        self.window = int(window)
+        self.min_periods = max(2, int(min_periods))
+        self.alpha = 2.0 / (self.window + 1)
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0          # ewm: biased EW variance; window: running M2
+        self.buf = deque()
+        self.sorted = []
+
+    def zscore(self, x):
+        """z of x against the current baseline (nan if not enough history or no spread)."""
+        n = min(self.n, self.window) if self.method != 'ewm' else self.n
+        if n < self.min_periods:
+            return math.nan
+        if self.method == 'ewm':
+            sd = math.sqrt(self.var) if self.var > 0 else 0.0
+            center = self.mean
+        elif self.method == 'window':
+            sd = math.sqrt(max(self.var, 0.0) / (n - 1))
+            center = self.mean
+        else:
+            center = _median_sorted(self.sorted)
+            sd = MAD_SCALE * float(np.median(np.abs(np.asarray(self.sorted) - center)))
+        return (x - center) / sd if sd > 1e-12 else math.nan
+
+    def push(self, x):
+        self.n += 1
+        if self.method == 'ewm':
+            if self.n == 1:
+                self.mean, self.var = x, 0.0
+            else:
+                d = x - self.mean
+                self.mean += self.alpha * d
+                self.var = (1 - self.alpha) * (self.var + self.alpha * d * d)
+            return
+        self.buf.append(x)
+        if self.method == 'mad':
+            bisect.insort(self.sorted, x)
+        else:
+            # Welford add
+            k = len(self.buf)
+            d = x - self.mean
+            self.mean += d / k
+            self.var += d * (x - self.mean)
+        if len(self.buf) > self.window:
+            old = self.buf.popleft()
+            if self.method == 'mad':
+                del self.sorted[bisect.bisect_left(self.sorted, old)]
+            else:
+                # Welford remove
+                k = len(self.buf)
+                d = old - self.mean
+                self.mean -= d / k
+                self.var -= d * (old - self.mean)
+
+    def update(self, x):
+        """Score x against the baseline, then add it to the baseline."""
+        z = self.zscore(x)
+        self.push(x)
+        return z
+
+    def to_state(self):
+        return {'method': self.method, 'window': self.window, 'min_periods': self.min_periods, 'n': self.n,
+                'mean': self.mean, 'var': self.var, 'buf': list(self.buf)}
+
+    @classmethod
+    def from_state(cls, s):
+        r = cls(s['method'], s['window'], s['min_periods'])
+        r.n, r.mean, r.var = s['n'], s['mean'], s['var']
+        r.buf = deque(s['buf'])
+        r.sorted = sorted(r.buf) if r.method == 'mad' else []
+        return r
+
+    @classmethod
+    def from_history(cls, x, method='ewm', window=30, min_periods=7):
+        """State after pushing all of x, built with the vectorized path."""
+        r = cls(method, window, min_periods)
+        x = np.asarray(x, dtype=np.float64)
+        r.n = len(x)
+        if not len(x):
+            return r
+        if method == 'ewm':
+            import pandas as pd
+            s = pd.Series(x).ewm(alpha=r.alpha, adjust=False)
+            r.mean = float(s.mean().iloc[-1])
+            r.var = float(s.var(bias=True).iloc[-1]) if len(x) > 1 else 0.0
+            return r
+        tail = x[-r.window:]
+        r.buf = deque(tail.tolist())
+        if method == 'mad':
+            r.sorted = sorted(r.buf)
+        else:
+            r.mean = float(tail.mean())
+            r.var = float(((tail - r.mean) ** 2).sum())
+        return r
+
+
+def _median_sorted(s):
+    k = len(s)
+    return s[k // 2] if k % 2 else 0.5 * (s[k // 2 - 1] + s[k // 2])
+
+
+def batch_zscores(x, method='ewm', window=30, min_periods=7, block=4096):
+    """Vectorized equivalent of feeding x through RollingZ.update (nan where undefined)."""
+    import pandas as pd
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    min_periods = max(2, int(min_periods))
+    if n == 0:
+        return np.empty(0)
+    s = pd.Series(x)
+    if method == 'ewm':
+        e = s.ewm(alpha=2.0 / (window + 1), adjust=False)
+        center = e.mean().shift(1).to_numpy()
+        sd = np.sqrt(e.var(bias=True).shift(1).to_numpy())
+        cnt = np.arange(n)
+    elif method == 'window':
+        r = s.rolling(window, min_periods=1)
+        center = r.mean().shift(1).to_numpy()
+        sd = r.std(ddof=1).shift(1).to_numpy()
+        cnt = np.minimum(np.arange(n), window)
+    else:
+        from numpy.lib.stride_tricks import sliding_window_view
+        center = s.rolling(window, min_periods=1).median().shift(1).to_numpy()
+        sd = np.full(n, np.nan)
+        pad = np.concatenate([np.full(window - 1, np.nan), x])
+        # window ending at observation i-1 is pad[i-1 : i-1+window]; blocked to bound memory
+        for i0 in range(1, n, block):
+            i1 = min(n, i0 + block)
+            w = sliding_window_view(pad[i0 - 1:i1 - 1 + window - 1], window)
+            sd[i0:i1] = MAD_SCALE * np.nanmedian(np.abs(w - center[i0:i1, None]), axis=1)
+        cnt = np.minimum(np.arange(n), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (x - center) / sd
+    z[(cnt < min_periods) | ~(sd > 1e-12)] = np.nan
+    return z
+
+
+def _tail_digest(days, values, k):
+    """sha256 of the last TAIL (day, value) pairs of the first k observations."""
+    lo = max(0, k - TAIL)
+    h = hashlib.sha256(days[lo:k].astype(np.int64).tobytes())
+    h.update(values[lo:k].astype(np.float64).tobytes())
+    return h.hexdigest()
+
+
+class ZScoreStore:
+    """Persisted per-station baseline state and produced z-scores for one signal file.
+
+    <cache_dir>/<name>.npz holds one float64 z array per station plus a 'meta'
+    JSON string: config fingerprint and, per station, the array key, the number of
+    observations covered, the last day, a _tail_digest() and the RollingZ state."""
+
+    def __init__(self, name, cfg, cache_dir=CACHE_DIR):
+        self.name = name
+        self.cfg = cfg
+        self.dir = Path(cache_dir)
+        self.path = self.dir / f'{name}.npz'
+        self.fingerprint = [cfg['column'], cfg['method'], cfg['window'], cfg['min_periods']]
+        self.stations = {}
+        self.z = {}
+        self._npz = None
+        if self.path.exists():
+            npz = np.load(self.path, allow_pickle=False)
+            meta = json.loads(str(npz['meta']))
+            if meta.get('config') == self.fingerprint:
+                self.stations = meta.get('stations', {})
+                self._npz = npz
+        self.stats = {'reused': 0, 'streamed': 0, 'recomputed': 0}
+
+    def _stored_z(self, station):
+        if station in self.z:
+            return self.z[station]
+        return self._npz[self.stations[station]['key']]
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.z = {s: self._stored_z(s) for s in self.stations}
+        if self._npz is not None:
+            self._npz.close()
+            self._npz = None
+        arrays = {}
+        for i, s in enumerate(self.stations):
+            arrays[f'z{i}'] = self.z[s]
+            self.stations[s]['key'] = f'z{i}'
+        meta = json.dumps({'config': self.fingerprint, 'stations': self.stations})
+        tmp = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with tmp.open('wb') as f:
+            np.savez(f, meta=np.array(meta), **arrays)
+        os.replace(tmp, self.path)
+        # cache of the JSON format, superseded by <name>.npz
+        self.path.with_suffix('.json').unlink(missing_ok=True)
+
+    def score(self, station, days, values):
+        """z-scores for one station's observations (days ascending, int days since epoch)."""
+        days = np.asarray(days, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        c = self.cfg
+        st = self.stations.get(station)
+        if st is not None:
+            k = st['n']
+            same = (0 < k <= len(days) and int(days[k - 1]) == st['last_day']
+                    and (k == len(days) or int(days[k]) > st['last_day'])
+                    and _tail_digest(days, values, k) == st['tail'])
+            if same:
+                old = self._stored_z(station)
+                self.stats['reused'] += k
+                if k == len(days):
+                    return old
+                eng = RollingZ.from_state(st['state'])
+                new = [eng.update(float(v)) for v in values[k:]]
+                z = np.concatenate([old, np.asarray(new, dtype=np.float64)])
+                self.stats['streamed'] += len(new)
+                self._keep(station, days, values, z, eng)
+                return z
+        z = batch_zscores(values, c['method'], c['window'], c['min_periods'])
+        self.stats['recomputed'] += len(values)
+        self._keep(station, days, values, z,
+                   RollingZ.from_history(values, c['method'], c['window'], c['min_periods']))
+        return z
+
+    def _keep(self, station, days, values, z, eng):
+        if not len(days):
+            return
+        n = len(days)
+        self.stations[station] = {'n': n, 'last_day': int(days[-1]), 'tail': _tail_digest(days, values, n),
+                                  'state': eng.to_state()}
+        self.z[station] = z
+
+
+def _floats(rows, col):
+    out = np.full(len(rows), np.nan)
+    for i, r in enumerate(rows):
+        try:
+            out[i] = float(r.get(col, ''))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def apply_to_rows(rows, store, station=''):
+    """Fill cfg['target'] of read_csv-style rows or a SignalTable (one series) from the raw column, in place."""
+    c = store.cfg
+    if isinstance(rows, SignalTable):
+        return _apply_to_table(rows, store, station)
+    if not rows or c['column'] not in rows[0]:
+        return 0
+    t, valid = valid_epoch([r.get('date') or '' for r in rows])
+    order = np.flatnonzero(valid)
+    order = order[np.argsort(t[order], kind='stable')]
+    vals = _floats([rows[i] for i in order], c['column'])
+    ok = np.flatnonzero(np.isfinite(vals))
+    if not len(ok):
+        return 0
+    days = t[order[ok]] // DAY_S
+    z = store.score(station, days, vals[ok])
+    n = 0
+    for i, zi in zip(ok, z):
+        if not math.isnan(zi):
+            rows[order[i]][c['target']] = f'{zi:.4f}'
+            n += 1
+    return n
+
+
+def _apply_to_table(table, store, station):
+    c = store.cfg
+    if not table or c['column'] not in table:
+        return 0
+    t = table.t
+    order = np.flatnonzero(table.valid)
+    order = order[np.argsort(t[order], kind='stable')]
+    vals = table.float_column(c['column'])[order]
+    ok = np.flatnonzero(np.isfinite(vals))
+    if not len(ok):
+        return 0
+    days = t[order[ok]] // DAY_S
+    z = store.score(station, days, vals[ok])
+    good = ~np.isnan(z)
+    target = table.float_column(c['target']).copy()
+    # rounded as the '%.4f' text the row path writes
+    target[order[ok[good]]] = [float(f'{v:.4f}') for v in z[good]]
+    table.set_column(c['target'], target)
+    return int(good.sum())
+
+
+def apply_to_index(index, store):
+    """Same for a SpaceTimeIndex (signal_index.py): one series per station_id."""
+    c = store.cfg
+    if index is None or c['column'] not in index.values:
+        return 0
+    vals = index.values[c['column']]
+    target = index.values.setdefault(c['target'], np.full(len(vals), np.nan))
+    station = index.station if index.station is not None else np.full(len(vals), '', dtype=object)
+    order = np.lexsort((index.days, station))
+    st_sorted = station[order]
+    bounds = np.flatnonzero(np.r_[True, st_sorted[1:] != st_sorted[:-1], True])
+    n = 0
+    for b0, b1 in zip(bounds[:-1], bounds[1:]):
+        sel = order[b0:b1]
+        sel = sel[np.isfinite(vals[sel])]
+        if not len(sel):
+            continue
+        z = store.score(str(st_sorted[b0]), index.days[sel], vals[sel])
+        good = ~np.isnan(z)
+        target[sel[good]] = z[good]
+        n += int(good.sum())
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Z-scores con línea base móvil por estación')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    sc = sub.add_parser('score')
+    sc.add_argument('csv')
+    sc.add_argument('--column', required=True)
+    sc.add_argument('--method', choices=METHODS, default='ewm')
+    sc.add_argument('--window', type=int, default=30)
+    sc.add_argument('--min-periods', type=int, default=7)
+    ck = sub.add_parser('check')
+    ck.add_argument('--rows', type=int, default=100000)
+    sub.add_parser('reset')
+    args = ap.parse_args()
+    if args.cmd == 'reset':
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        print(f'Estado eliminado: {CACHE_DIR}')
+        return
+    if args.cmd == 'score':
+        import csv
+        with open(args.csv, 'r', encoding='utf-8') as f:
+            rows = sorted(csv.DictReader(f), key=lambda r: r.get('date', ''))
+        vals = _floats(rows, args.column)
+        z = batch_zscores(vals, args.method, args.window, args.min_periods)
+        print('date,' + args.column + ',z')
+        for r, v, zi in zip(rows, vals, z):
+            print(f"{r.get('date', '')},{v},{'' if math.isnan(zi) else f'{zi:.4f}'}")
+        return
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.normal(size=args.rows)) * 0.1 + rng.standard_t(3, size=args.rows)
+    for method in METHODS:
+        t0 = time.perf_counter()
+        zb = batch_zscores(x, method, 30, 7)
+        tb = time.perf_counter() - t0
+        eng = RollingZ(method, 30, 7)
+        t0 = time.perf_counter()
+        zs = np.array([eng.update(v) for v in x])
+        ts = time.perf_counter() - t0
+        same = np.allclose(zb, zs, rtol=1e-6, atol=1e-6, equal_nan=True)
+        print(f'{method:6s} batch {tb:.3f}s  streaming {ts / len(x) * 1e6:.2f} µs/obs  iguales={same}')
+
+
+if __name__ == '__main__':
+    main()
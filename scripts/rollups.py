@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+rollups.py
+Weekly / monthly / yearly rollups of an event timeline, stored next to its
+iasi.json as rollups.json and served by /get_iasi/<name>?resolution=.
+
+Per period (keyed by its first day: Monday for weeks, the 1st for months,
+January 1st for years): days covered (hourly timelines, resolution: hour in
+config/join.yaml, fold their rows into the day they fall on), min / mean / max IASi, mean of each
+component of the channel registry (A, R, D, M, S), days in each estado under the thresholds of
+thresholds.yaml and the first alert date. Timelines are sorted by date, so
+every aggregate is a vectorized np.*.reduceat over the period boundaries of
+the day index.
+
+Updates are incremental: rollups.json keeps the last date it covers and a
+sha256 of the timeline arrays up to that date. When a new timeline starts with
+exactly those rows (days were only appended), the closed periods are kept and
+only the last stored period and the new ones are recomputed; any other change
+(edited past rows, new thresholds) rebuilds everything.
+
+Usage:
+  python scripts/rollups.py -e Maule_2010        # update from outputs/indices/<event>/iasi.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from channels import load_registry
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT_INDICES = ROOT / 'outputs' / 'indices'
+RESOLUTIONS = ('week', 'month', 'year')
+CHANNELS = tuple(load_registry().components)
+STATES = ('Observación', 'Precaución', 'Alerta')
+
+
+def period_start(days, resolution):
+    """First day (datetime64[D]) of the period of each day."""
+    if resolution == 'week':
+        # 1970-01-01 was a Thursday: shift so weeks start on Monday
+        return days - ((days.astype(np.int64) + 3) % 7).astype('m8[D]')
+    if resolution == 'month':
+        return days.astype('M8[M]').astype('M8[D]')
+    if resolution == 'year':
+        return days.astype('M8[Y]').astype('M8[D]')
+    raise ValueError(f'resolution debe ser una de {RESOLUTIONS}')
+
+
+def timeline_arrays(tl):
+    """(days, IASi, channels (len(CHANNELS), n)) from iasi.json timeline rows, sorted by date."""
+    tl = sorted(tl, key=lambda r: r['date'])
+    days = np.array([r['date'][:10] for r in tl], dtype='M8[D]')
+    iasi = np.array([float(r['IASi']) for r in tl], dtype=np.float64)
+    comps = np.array([[float(r.get(c, 0.0)) for r in tl] for c in CHANNELS], dtype=np.float64).reshape(len(CHANNELS), len(tl))
+    return days, iasi, comps
+
+
+def state_codes(iasi, th):
+    """0/1/2 = Observación/Precaución/Alerta, as run_eval_batch.state_for()."""
+    return np.where(iasi < th['observation'], 0, np.where(iasi <= th['caution_max'], 1, 2))
+
+
+def aggregate(days, iasi, comps, th, resolution):
+    """Rollup rows of one resolution for sorted days."""
+    if not len(days):
+        return []
+    starts = period_start(days, resolution)
+    idx = np.concatenate([[0], np.flatnonzero(starts[1:] != starts[:-1]) + 1])
+    n = np.diff(np.append(idx, len(days)))
+    # distinct days per period (equal to n for daily timelines)
+    n_days = np.add.reduceat(np.r_[True, days[1:] != days[:-1]].astype(np.int64), idx)
+    codes = state_codes(iasi, th)
+    per_state = np.add.reduceat((codes[:, None] == np.arange(len(STATES))).astype(np.int64), idx, axis=0)
+    pos = np.arange(len(days))
+    first_alert = np.minimum.reduceat(np.where(codes == 2, pos, len(days)), idx)
+    means = np.add.reduceat(comps, idx, axis=1) / n
+    out = {
+        'period': starts[idx].astype(str), 'days': n,
+        'IASi_min': np.minimum.reduceat(iasi, idx), 'IASi_mean': np.add.reduceat(iasi, idx) / n,
+        'IASi_max': np.maximum.reduceat(iasi, idx),
+    }
+    rows = []
+    for i in range(len(idx)):
+        row = {'period': str(out['period'][i]), 'days': int(n_days[i])}
+        row.update({k: round(float(out[k][i]), 4) for k in ('IASi_min', 'IASi_mean', 'IASi_max')})
+        row.update({c: round(float(means[j, i]), 4) for j, c in enumerate(CHANNELS)})
+        row['estado_days'] = {s: int(per_state[i, j]) for j, s in enumerate(STATES)}
+        row['first_alert'] = str(days[first_alert[i]]) if first_alert[i] < len(days) else None
+        rows.append(row)
+    return rows
+
+
+def _digest(days, iasi, comps, k):
+    h = hashlib.sha256(days[:k].astype(np.int64).tobytes())
+    h.update(iasi[:k].tobytes())
+    h.update(np.ascontiguousarray(comps[:, :k]).tobytes())
+    return h.hexdigest()
+
+
+def build(tl, th, prev=None):
+    """Rollups document for timeline rows tl; reuses prev's closed periods when tl only appends days."""
+    days, iasi, comps = timeline_arrays(tl)
+    th = {k: float(th[k]) for k in ('observation', 'caution_max')}
+    k = int(prev.get('n_days', 0)) if prev else 0
+    append = (prev is not None and prev.get('thresholds') == th and 0 < k <= len(days)
+              and str(days[k - 1]) == prev.get('through') and _digest(days, iasi, comps, k) == prev.get('digest'))
+    doc = {'through': str(days[-1]) if len(days) else None, 'n_days': len(days), 'thresholds': th,
+           'digest': _digest(days, iasi, comps, len(days))}
+    lo = len(days)
+    for res in RESOLUTIONS:
+        if not append:
+            doc[res] = aggregate(days, iasi, comps, th, res)
+            continue
+        cut = period_start(days[k - 1:k], res)[0]
+        keep = [r for r in prev[res] if r['period'] < str(cut)]
+        i = int(np.searchsorted(days, cut))
+        doc[res] = keep + aggregate(days[i:], iasi[i:], comps[:, i:], th, res)
+        lo = min(lo, i)
+    doc['incremental'] = bool(append)
+    doc['recomputed_days'] = len(days) - lo if append else len(days)
+    return doc
+
+
+def load(outdir):
+    p = Path(outdir) / 'rollups.json'
+    try:
+        return json.loads(p.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def refresh(outdir, tl, th=None, source_sha=None):
+    """Update <outdir>/rollups.json for timeline tl (incrementally when possible) and return it.
+    source_sha is the sha256 of the iasi.json it was built from (checked by the server)."""
+    if th is None:
+        import run_eval_batch as reb
+        th = reb.TH
+    prev = load(outdir)
+    if prev is not None and source_sha and prev.get('source_sha256') == source_sha:
+        return prev
+    doc = build(tl, th, prev)
+    doc['source_sha256'] = source_sha
+    p = Path(outdir) / 'rollups.json'
+    tmp = p.with_name(f'rollups.json.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_text(json.dumps(doc, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, p)
+    return doc
+
+
+def rows_since(rows, date):
+    """Rollup rows from the period containing date onwards."""
+    periods = [r['period'] for r in rows]
+    i = max(0, int(np.searchsorted(periods, date, side='right')) - 1)
+    return rows[i:]
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Rollups semanales/mensuales/anuales de timelines IASi')
+    ap.add_argument('-e', '--event', action='append', help='Eventos (por defecto todos los de outputs/indices)')
+    args = ap.parse_args()
+    names = args.event or sorted(p.parent.name for p in OUT_INDICES.glob('*/iasi.json'))
+    for name in names:
+        body = (OUT_INDICES / name / 'iasi.json').read_bytes()
+        tl = json.loads(body.decode('utf-8')).get('timeline') or []
+        doc = refresh(OUT_INDICES / name, tl, source_sha=hashlib.sha256(body).hexdigest())
+        print(f"{name}: {doc['n_days']} filas -> " + ', '.join(f'{len(doc[r])} {r}' for r in RESOLUTIONS)
+              + (f" (incremental, {doc['recomputed_days']} filas recalculadas)" if doc.get('incremental') else ''))
+
+
+if __name__ == '__main__':
+    main()
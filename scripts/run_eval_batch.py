@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 # Equipo: Los Abejorros Científicos
 # Evalúa 4 eventos andinos y exporta timelines y métricas
-import csv, math, os
+import argparse, csv, math, os
 from pathlib import Path
 import json
-from datetime import datetime, timedelta
+from datetime import timedelta
 from collections import defaultdict
 import yaml
+import numpy as np
+from channels import load_registry, to_float
+from timebase import DAY_S, RESOLUTIONS, load_resolution, parse_time, parse_times
+from telemetry import stage, write_run_summary
+from signal_table import SignalTable, read_table
 
 ROOT = Path(__file__).resolve().parents[1]
 CFG = ROOT / "config"
@@ -43,72 +48,145 @@ EVENTS = [
 	{"name":"EC_CO_1906","lat":1.0,"lon":-80.0,"aoi":"config/aoi_ec_co_1906.geojson","feat":"data/features/features_ec_co_1906.csv"},
 ]
 
+# Resolución del eje de tiempo (config/join.yaml: day | hour); las salidas diarias son el valor por defecto
+RESOLUTION = load_resolution()
+# puntos de la timeline por día (ventanas de etiquetas y bloques bootstrap en filas)
+PER_DAY = DAY_S // RESOLUTIONS[RESOLUTION]
+
+# Canales declarados en config/channels.yaml (scripts/channels.py); KERNEL puntúa todos a la vez
+REGISTRY = load_registry()
+KERNEL = REGISTRY.compile(WEIGHTS)
+COMPONENTS = KERNEL.components
+
 def sigmoid(x): return 1.0/(1.0+math.exp(-x))
 def clip(x, lo=0.0, hi=1.0): return max(lo, min(hi, x))
 
 def read_csv(path):
-	p=Path(path); 
-	if not p.exists(): return []
-	with p.open("r", encoding="utf-8") as f:
-		rows=list(csv.DictReader(f))
-	return rows
-
-def join_by_date(dicts):
-	"""Une listas de dict por 'date' con 'última observación válida' simple."""
-	dates=set()
-	for d in dicts:
-		for r in d: dates.add(r["date"])
-	dates=sorted(dates)
-	lastA=lastR=lastM=lastS=None
-	lastD=None
-	out=[]
-	A, R, M, S = dicts[0], dicts[1], dicts[2], dicts[3]
-	D = dicts[4]
-	A_by={r["date"]:r for r in A}
-	R_by={r["date"]:r for r in R}
-	M_by={r["date"]:r for r in M}
-	S_by={r["date"]:r for r in S}
-	D_by={r["date"]:r for r in D}
-	for dt in dates:
-		if dt in A_by: lastA=A_by[dt]
-		if dt in R_by: lastR=R_by[dt]
-		if dt in M_by: lastM=M_by[dt]
-		if dt in S_by: lastS=S_by[dt]
-		if dt in D_by: lastD=D_by[dt]
-		out.append({"date":dt,"A":lastA,"R":lastR,"M":lastM,"S":lastS,"D":lastD})
-	return out
+	"""signal_table.SignalTable del CSV (columnas numpy tipadas; vacía si no existe)."""
+	return read_table(path)
+
+def join_tables(tables, step=None, channels=None, resolution=None):
+	"""calendar_join.DenseJoin de tablas {canal: filas}: calendario denso (diario u horario), última
+	observación válida por canal y antigüedad máxima por canal (config/join.yaml), como arreglos."""
+	from calendar_join import DenseJoin
+	return DenseJoin(tables, step, channels, resolution)
+
+def join_by_date(dicts, step=None, channels=None, resolution=None):
+	"""Filas dict de join_tables: {'date', <canal>: fila o None, 'age', 'w'}. Acepta {canal: filas}
+	o la lista histórica [A, R, M, S, D(, G)]."""
+	tables = dicts if isinstance(dicts, dict) else dict(zip(("A","R","M","S","D","G"), dicts))
+	return join_tables(tables, step, channels, resolution).rows()
+
+# canal -> CSV de las señales compartidas (scope: signal en channels.yaml)
+SIGNAL_FILES = {ch.name: ch.path() for ch in REGISTRY.signals()}
+# Observaciones geolocalizadas (lat/lon[/station_id]) de eventos con AOI puntual: radio de búsqueda
+SIGNAL_RADIUS_KM = 200.0
+_SIGNALS = None
+
+def load_signals():
+	"""{canal: (filas sin ubicación, SpaceTimeIndex de las geolocalizadas o None)}; se carga una vez.
+	Las columnas z (r_zscore, s_activity_z) se recalculan desde las crudas según config/zscore.yaml."""
+	global _SIGNALS
+	if _SIGNALS is None:
+		from signal_index import load_signal_table
+		_SIGNALS = {ch: load_signal_table(path) for ch, path in SIGNAL_FILES.items()}
+		apply_rolling_zscores(_SIGNALS)
+	return _SIGNALS
+
+def apply_rolling_zscores(sig):
+	from rolling_zscore import ZScoreStore, apply_to_index, apply_to_rows, load_config
+	cfg = load_config()
+	for ch, fn in SIGNAL_FILES.items():
+		name = Path(fn).stem
+		if name not in cfg:
+			continue
+		with stage("zscore") as st:
+			store = ZScoreStore(name, cfg[name])
+			plain, idx = sig[ch]
+			st.rows = apply_to_rows(plain, store) + apply_to_index(idx, store)
+			store.save()
 
 def build_signal_tables():
-	A = read_csv(DATA/"signals"/"animals.csv")
-	R = read_csv(DATA/"signals"/"radon.csv")
-	M = read_csv(DATA/"signals"/"marine.csv")
-	S = read_csv(DATA/"signals"/"sensors.csv")
-	return A,R,M,S
+	"""{canal: serie regional (filas sin lat/lon)} de las señales compartidas por todos los eventos."""
+	return {ch: plain for ch, (plain, _) in load_signals().items()}
+
+def event_signal_tables(ev):
+	"""{canal: filas} de las señales del evento: series regionales + observaciones geolocalizadas dentro de su AOI
+	(o a SIGNAL_RADIUS_KM del punto), agregadas por día u hora (RESOLUTION; media/máx/conteo) vía el índice
+	espacio-temporal. Un día (hora) con observaciones locales reemplaza al valor regional de ese día (hora)."""
+	sig = load_signals()
+	out = {}
+	geom = None
+	if any(idx is not None for _, idx in sig.values()):
+		from aoi_index import load_geometry
+		try:
+			geom = load_geometry(ROOT/ev["aoi"])
+		except Exception:
+			geom = None
+	start = parse_date(ev["start"]).toordinal() - 719163 if ev.get("start") else None
+	end = parse_date(ev["end"]).toordinal() - 719163 if ev.get("end") else None
+	for ch, (plain, idx) in sig.items():
+		if idx is None:
+			out[ch] = plain
+			continue
+		if geom is not None and geom.geom_type in ("Polygon", "MultiPolygon"):
+			sel = idx.within_geometry(geom, start, end)
+		else:
+			sel = idx.within_radius(ev["lat"], ev["lon"], SIGNAL_RADIUS_KM, start, end)
+		local = {r["date"]: r for r in idx.daily(sel, resolution=RESOLUTION)}
+		merged = {r["date"]: r for r in plain if r.get("date") not in local}
+		merged.update(local)
+		out[ch] = [merged[d] for d in sorted(merged)]
+	return out
+
+def states_for(iasi):
+	"""state_for vectorizado."""
+	iasi = np.asarray(iasi, dtype=np.float64)
+	codes = np.where(iasi < TH["observation"], 0, np.where(iasi <= TH["caution_max"], 1, 2))
+	return np.array(["Observación", "Precaución", "Alerta"])[codes].tolist()
+
+def state_for(IASi):
+	return "Observación" if IASi < TH["observation"] else ("Precaución" if IASi <= TH["caution_max"] else "Alerta")
+
+def _learned(model, comps, iasi):
+	if model is None or not len(iasi):
+		return iasi
+	from learned_scoring import predict
+	return predict(model, comps.T)
+
+def score_join(join, model=None):
+	"""(componentes (k, días), IASi, estados) de un join_tables con el KERNEL de channels.yaml, cada
+	componente atenuado por la antigüedad de su dato; con model (learned_scoring.load_model) el IASi
+	es la probabilidad calibrada del modelo, en un solo lote."""
+	comps, iasi = KERNEL(join.columns(REGISTRY.inputs()), dict(zip(join.slots, join.weight)))
+	iasi = _learned(model, comps, iasi)
+	return comps, iasi, states_for(iasi)
+
+def score_rows(rows, model=None):
+	"""score_join para filas dict (join_by_date): [(*componentes, IASi, estado)] por fila."""
+	cols = {(ch, col): np.array([to_float((r.get(ch) or {}).get(col)) for r in rows], dtype=np.float64)
+		for ch, col in REGISTRY.inputs()}
+	w = {ch.name: np.array([(r.get("w") or {}).get(ch.name, 1.0) for r in rows], dtype=np.float64)
+		for ch in REGISTRY.channels}
+	comps, iasi = KERNEL(cols, w)
+	iasi = _learned(model, comps, iasi)
+	return [tuple(c) + (float(v), st) for c, v, st in zip(comps.T.tolist(), iasi, states_for(iasi))]
 
 def compute_row(sig):
-	# Transformaciones
-	A_ = clip(float(sig["A"]["a_score"])) if sig["A"] else 0.0
-	R_ = sigmoid(float(sig["R"]["r_zscore"])) if sig["R"] else 0.0
-	if sig["D"]:
-		coh = float(sig["D"]["mean_coh"])
-		d95 = float(sig["D"]["p95_defo_mm"])
-		D_ = clip(d95/20.0) if coh >= 0.3 else 0.0
-	else:
-		D_ = 0.0
-	M_ = clip(float(sig["M"]["m_verified_ratio"])) if sig["M"] else 0.0
-	S_ = sigmoid(float(sig["S"]["s_activity_z"])) if sig["S"] else 0.0
-	IASi = WEIGHTS["alpha"]*A_ + WEIGHTS["beta"]*R_ + WEIGHTS["gamma"]*D_ + WEIGHTS["delta"]*M_ + WEIGHTS["epsilon"]*S_
-	state = "Observación" if IASi < TH["observation"] else ("Precaución" if IASi <= TH["caution_max"] else "Alerta")
-	return A_,R_,D_,M_,S_,IASi,state
-
-def export_timeline(event, rows):
+	"""(*componentes, IASi, estado) de una fila unida; ver score_rows."""
+	return score_rows([sig])[0]
+
+def export_timeline(event, join, model=None):
+	"""outputs/timelines/<evento>_iasi.csv desde un join_tables: una columna por componente y
+	age_<canal> = días desde el dato vigente de cada canal (-1: aún sin datos)."""
+	comps, iasi, states = score_join(join, model)
 	out = OUT_TIMELINES / f"{event['name']}_iasi.csv"
 	with out.open("w", newline="", encoding="utf-8") as f:
-		w = csv.writer(f); 
-		w.writerow(["date","A","R","D","M","S","IASi","estado"])
-		for r in rows:
-			A_,R_,D_,M_,S_,IASi,state = compute_row(r)
-			w.writerow([r["date"], f"{A_:.4f}", f"{R_:.4f}", f"{D_:.4f}", f"{M_:.4f}", f"{S_:.4f}", f"{IASi:.4f}", state])
+		w = csv.writer(f)
+		w.writerow(["date"] + COMPONENTS + ["IASi","estado"] + [f"age_{c}" for c in join.slots])
+		for t, d in enumerate(join.dates()):
+			w.writerow([d] + [f"{v:.4f}" for v in comps[:, t]] + [f"{iasi[t]:.4f}", states[t]]
+				+ join.age[:, t].tolist())
 
 def fake_metrics():
 	# Placeholder simple: pon valores realistas cuando tengas etiquetas
@@ -119,19 +197,21 @@ def fake_metrics():
 	}
 
 # === Métricas y etiquetado ===
-def parse_date(s):
-	return datetime.strptime(s, "%Y-%m-%d").date()
+def parse_date(s, resolution=None):
+	"""datetime (UTC, sin tz) de una fecha YYYY-MM-DD o timestamp ISO; con resolution se trunca a su día/hora."""
+	return parse_time(s, resolution)
 
 def load_eq_catalog(path_csv, mw_min=6.5):
 	"""
 	CSV esperado: date, mw [, lat, lon, depth]
-	date en YYYY-MM-DD
+	date en YYYY-MM-DD o timestamp ISO, truncado a la unidad de la timeline (RESOLUTION): un sismo
+	cuenta desde el día (hora) siguiente al suyo. También acepta la lista de filas ya leída.
 	"""
-	rows = read_csv(path_csv)
+	rows = path_csv if isinstance(path_csv, (list, SignalTable)) else read_csv(path_csv)
 	out = []
 	for r in rows:
 		try:
-			d = parse_date(r["date"])
+			d = parse_date(r["date"], RESOLUTION)
 			mw = float(r.get("mw", "0"))
 			if mw >= mw_min:
 				out.append({"date": d, "mw": mw})
@@ -141,9 +221,9 @@ def load_eq_catalog(path_csv, mw_min=6.5):
 
 def labels_from_catalog(timeline_dates, eq_catalog, window_days):
 	"""
-	timeline_dates: lista de date() en orden ascendente
-	eq_catalog: lista de {"date": date, "mw": float}
-	Devuelve y_true por día: 1 si hay sismo ≥ Mw_min en próximos N días, 0 si no.
+	timeline_dates: lista de datetime (parse_date) en orden ascendente, diaria u horaria
+	eq_catalog: lista de {"date": datetime, "mw": float}
+	Devuelve y_true por fila: 1 si hay sismo ≥ Mw_min en próximos N días, 0 si no.
 	"""
 	eq_dates = [e["date"] for e in eq_catalog]
 	y_true = [0]*len(timeline_dates)
@@ -205,10 +285,11 @@ def false_alarms_per_month(y_true, y_score, thr, dates):
 		future_positive = any(y_true[j]==1 for j in range(i, len(y_true)))
 		if not future_positive:
 			fa += 1
-	months = max(1, (dates[-1] - dates[0]).days / 30.4375)
+	months = max(1, (dates[-1] - dates[0]).total_seconds() / DAY_S / 30.4375)
 	return fa / months
 
-def lead_time_days(y_true, y_score, thr, dates):
+def lead_time_days(y_true, y_score, thr, dates, max_days=None):
+	"""Días medios desde la última alarma hasta cada día positivo; con max_days, cada uno acotado a max_days."""
 	yhat = [1 if s >= thr else 0 for s in y_score]
 	event_days = [i for i, t in enumerate(y_true) if t==1]
 	if not event_days: return 0.0
@@ -222,8 +303,8 @@ def lead_time_days(y_true, y_score, thr, dates):
 		j = last_on_idx[i]
 		if j == -1:
 			continue
-		dt = (dates[i] - dates[j]).days
-		deltas.append(dt)
+		dt = (dates[i] - dates[j]).total_seconds() / DAY_S
+		deltas.append(dt if max_days is None else min(dt, max_days))
 	return sum(deltas)/len(deltas) if deltas else 0.0
 
 def brier_score(y_true, y_score):
@@ -231,8 +312,10 @@ def brier_score(y_true, y_score):
 	if n == 0: return 0.0
 	return sum((float(t) - float(s))**2 for t, s in zip(y_true, y_score)) / n
 
-def evaluate_timeline_metrics(timeline_rows, eq_catalog_csv, window_days, thr_grid=None):
-	dates = [parse_date(r["date"]) for r in timeline_rows]
+def evaluate_timeline_metrics(timeline_rows, eq_catalog_csv, window_days, thr_grid=None, boot=None):
+	"""Métricas puntuales; con boot={"resamples", "seed", "conf"[, "block"]} agrega "ci" con intervalos
+	bootstrap por bloques (scripts/bootstrap_ci.py) de cada métrica."""
+	dates = parse_times([r["date"] for r in timeline_rows])
 	scores = [float(r["IASi"]) for r in timeline_rows]
 	cat = load_eq_catalog(eq_catalog_csv, mw_min=6.5)
 	y_true = labels_from_catalog(dates, cat, window_days)
@@ -241,9 +324,9 @@ def evaluate_timeline_metrics(timeline_rows, eq_catalog_csv, window_days, thr_gr
 		thr_grid = [round(x/100, 2) for x in range(65, 81)]
 	best_thr, best_f1 = best_threshold_f1(y_true, scores, thr_grid)
 	fa_pm = false_alarms_per_month(y_true, scores, best_thr, dates)
-	lt_days = lead_time_days(y_true, scores, best_thr, dates)
+	lt_days = lead_time_days(y_true, scores, best_thr, dates, window_days)
 	brier = brier_score(y_true, scores)
-	return {
+	out = {
 		"auc_pr": round(pr, 4),
 		"f1": round(best_f1, 4),
 		"false_alarm_pm": round(fa_pm, 3),
@@ -251,38 +334,153 @@ def evaluate_timeline_metrics(timeline_rows, eq_catalog_csv, window_days, thr_gr
 		"brier": round(brier, 4),
 		"best_threshold": round(best_thr, 2)
 	}
+	if boot and boot.get("resamples", 0) > 0 and len(dates) > 1:
+		from bootstrap_ci import intervals
+		months = max(1, (dates[-1] - dates[0]).total_seconds() / DAY_S / 30.4375)
+		# el bootstrap trabaja en filas: ventana y bloque en puntos de la timeline, lead time de vuelta a días
+		block = boot.get("block") and boot["block"] * PER_DAY
+		ci, block = intervals(y_true, scores, best_thr, months, boot["resamples"], boot.get("conf", 0.95),
+			block, window_days * PER_DAY, boot.get("seed", 0))
+		if PER_DAY > 1:
+			ci["lead_time_days"] = tuple(v / PER_DAY for v in ci["lead_time_days"])
+			block = block // PER_DAY if block % PER_DAY == 0 else round(block / PER_DAY, 3)
+		nd = {"auc_pr": 4, "f1": 4, "false_alarm_pm": 3, "lead_time_days": 2, "brier": 4}
+		out["ci"] = {k: [round(lo, nd[k]), round(hi, nd[k])] for k, (lo, hi) in ci.items()}
+		out["bootstrap"] = {"resamples": boot["resamples"], "block_days": block, "conf": boot.get("conf", 0.95)}
+	return out
 
 # Directorio de catálogos sísmicos por evento (puedes crear data/catalogs/)
 CAT_DIR = DATA / "catalogs"
+# Catálogo compartido (con lat/lon) usado cuando un evento no tiene el suyo
+SHARED_CATALOG = CAT_DIR / "USGS_global_6.5plus.csv"
+LABEL_RADIUS_KM = 150.0
+_SHARED = None
 
-def metrics_for_event(ev_name, timeline_csv_path):
-	tl = read_csv(timeline_csv_path)
-	tl_rows = [{"date": r["date"], "IASi": r["IASi"]} for r in tl if "date" in r and "IASi" in r]
+def shared_catalog_for(aoi):
+	"""Sismos del catálogo compartido que el índice espacial de AOIs asigna a aoi
+	(dentro del AOI o a menos de LABEL_RADIUS_KM). La asignación se calcula una vez por corrida."""
+	global _SHARED
+	if _SHARED is None:
+		from aoi_index import AOIIndex
+		cat = read_csv(SHARED_CATALOG)
+		lat, lon = cat.float_column("lat"), cat.float_column("lon")
+		rows = cat.take(np.isfinite(lat) & np.isfinite(lon))
+		hits = AOIIndex(CFG).assign(rows.float_column("lon").tolist(), rows.float_column("lat").tolist(), LABEL_RADIUS_KM)
+		_SHARED = (rows, hits)
+	rows, hits = _SHARED
+	return rows.take(np.array([aoi in h for h in hits], dtype=bool))
+
+def eq_catalog_for(ev_name, aoi=None):
+	"""data/catalogs/<evento>.csv (ruta) o, si no existe, las filas del catálogo compartido asignadas al AOI."""
 	eq_csv = CAT_DIR / f"{ev_name}.csv"
+	if not eq_csv.exists() and aoi and SHARED_CATALOG.exists():
+		return shared_catalog_for(aoi)
+	return str(eq_csv)
+
+def metrics_for_event(ev_name, timeline_csv_path, aoi=None, boot=None):
+	tl = read_csv(timeline_csv_path)
+	tl_rows = ([{"date": d, "IASi": v} for d, v in zip(tl.column("date").tolist(), tl.float_column("IASi").tolist())]
+		if "date" in tl and "IASi" in tl else [])
+	eq_csv = eq_catalog_for(ev_name, aoi)
 	out = {}
 	for win in (7, 14, 30):
-		out[str(win)] = evaluate_timeline_metrics(tl_rows, str(eq_csv), win)
+		out[str(win)] = evaluate_timeline_metrics(tl_rows, eq_csv, win, boot=boot)
 	return out
 
+def write_scoring_meta(mode, model=None, mc=None):
+	"""outputs/timelines/scoring.json: cómo se calcularon los IASi (export_iasi_json lo copia a meta.scoring)."""
+	meta = {"mode": mode}
+	if model is not None:
+		meta.update({"model": model["sha256"], "kind": model["meta"]["kind"], "window_days": model["meta"]["window_days"]})
+	if mc:
+		meta["uncertainty"] = mc
+	(OUT_TIMELINES / "scoring.json").write_text(json.dumps(meta), encoding="utf-8")
+
+# columnas del CSV de métricas por clave de evaluate_timeline_metrics (los intervalos van en <col>_lo/<col>_hi)
+METRIC_COLS = {"auc_pr":"AUC_PR","f1":"F1","false_alarm_pm":"false_alarms_per_month","lead_time_days":"lead_time_days","brier":"brier"}
+
 def export_metrics(event, metrics):
 	for win, m in metrics.items():
 		out = OUT_METRICS / f"{event['name']}_metrics_{win}d.csv"
+		header = ["AUC_PR","F1","false_alarms_per_month","lead_time_days","brier","best_threshold"]
+		row = [m["auc_pr"],m["f1"],m["false_alarm_pm"],m["lead_time_days"],m["brier"],m["best_threshold"]]
+		if "ci" in m:
+			for k, col in METRIC_COLS.items():
+				header += [f"{col}_lo", f"{col}_hi"]
+				row += m["ci"][k]
+			b = m["bootstrap"]
+			header += ["ci_level","bootstrap_resamples","bootstrap_block_days"]
+			row += [b["conf"], b["resamples"], b["block_days"]]
 		with out.open("w", newline="", encoding="utf-8") as f:
 			w = csv.writer(f)
-			w.writerow(["AUC_PR","F1","false_alarms_per_month","lead_time_days","brier","best_threshold"])
-			w.writerow([m["auc_pr"],m["f1"],m["false_alarm_pm"],m["lead_time_days"],m["brier"],m["best_threshold"]])
+			w.writerow(header)
+			w.writerow(row)
+
 
+def event_tables(ev):
+	"""{canal: filas} de todos los canales de channels.yaml para un evento."""
+	sig = event_signal_tables(ev)
+	return {ch.name: sig[ch.name] if ch.scope == "signal" else read_csv(ch.path(ev)) for ch in REGISTRY.channels}
+
+def event_join(ev):
+	"""join_tables del evento: señales + archivos por evento (features InSAR, GNSS, ...)."""
+	return join_tables(event_tables(ev))
+
+def event_union(ev):
+	"""Serie diaria unida de un evento como filas dict (join_by_date)."""
+	return event_join(ev).rows()
 
 def main():
-	A,R,M,S = build_signal_tables()
+	ap = argparse.ArgumentParser(description="Timelines IASi y métricas por evento")
+	ap.add_argument("--scoring", choices=["linear","learned"], default=os.environ.get("IASI_SCORING", "linear"),
+		help="linear: combinación fija de weights.yaml; learned: modelo de scripts/learned_scoring.py")
+	ap.add_argument("--model", default=os.environ.get("IASI_MODEL", "latest"), help="sha256 (o prefijo) del modelo, o latest")
+	ap.add_argument("--bootstrap", type=int, default=int(os.environ.get("IASI_BOOTSTRAP", "0")),
+		help="Remuestreos bootstrap por bloques para intervalos de las métricas (por defecto 0: sin intervalos; p. ej. 1000)")
+	ap.add_argument("--ci", type=float, default=0.95, help="Nivel de confianza de los intervalos")
+	ap.add_argument("--block-days", type=int, default=None, help="Largo de bloque (por defecto max(ventana, n^1/3))")
+	ap.add_argument("--seed", type=int, default=0)
+	ap.add_argument("--mc-samples", type=int, default=int(os.environ.get("IASI_MC_SAMPLES", "0")),
+		help="Muestras Monte Carlo por día para bandas de incertidumbre del IASi (0: sin bandas)")
+	ap.add_argument("--mc-mem-mb", type=float, default=64, help="Memoria por bloque de días de las bandas")
+	args = ap.parse_args()
+	boot = {"resamples": args.bootstrap, "conf": args.ci, "block": args.block_days, "seed": args.seed}
+	model = None
+	if args.scoring == "learned":
+		from learned_scoring import load_model
+		model = load_model(args.model)
+		print(f"Scoring aprendido: modelo {model['sha256'][:12]} ({model['meta']['kind']})")
+	mc = None
+	if args.mc_samples > 0:
+		from uncertainty_bands import QUANTILES, export_bands
+		mc = {"samples": args.mc_samples, "seed": args.seed, "quantiles": list(QUANTILES)}
+	write_scoring_meta(args.scoring, model, mc)
+	with stage("load") as st:
+		sig = load_signals()
+		st.rows = sum(len(plain) + (len(idx) if idx is not None else 0) for plain, idx in sig.values())
 	for ev in EVENTS:
-		D = read_csv(ev["feat"])
-		union = join_by_date([A,R,M,S,D])
-		export_timeline(ev, union)
-	# Calcula métricas reales usando catálogo en data/catalogs/<evento>.csv
+		with stage("join") as st:
+			join = event_join(ev)
+			st.rows = len(join)
 		tl_path = OUT_TIMELINES / f"{ev['name']}_iasi.csv"
-		m = metrics_for_event(ev["name"], str(tl_path))
-		export_metrics(ev, m)
+		with stage("score") as st:
+			export_timeline(ev, join, model)
+			st.rows = len(join)
+			st.bytes_written = tl_path.stat().st_size
+		bands_path = OUT_TIMELINES / f"{ev['name']}_bands.csv"
+		if mc:
+			with stage("bands") as st:
+				export_bands(ev, join, args.mc_samples, args.seed, args.mc_mem_mb, model)
+				st.rows = len(join) * args.mc_samples
+				st.bytes_written = bands_path.stat().st_size
+		elif bands_path.exists():
+			bands_path.unlink()  # bandas de una corrida anterior ya no corresponden a esta timeline
+	# Calcula métricas reales usando catálogo en data/catalogs/<evento>.csv
+		with stage("metrics") as st:
+			m = metrics_for_event(ev["name"], str(tl_path), ev["aoi"], boot)
+			export_metrics(ev, m)
+			st.rows = len(join)
+	write_run_summary("run_eval_batch")
 	print("OK: timelines y métricas exportadas en outputs/")
 
 if __name__=="__main__":
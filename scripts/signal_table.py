@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+signal_table.py
+Compact typed in-memory table for the CSVs of the pipeline (signals, features,
+GNSS, catalogs, timelines, bands, metrics).
+
+A SignalTable holds one NumPy array per column: numeric columns as int64 /
+float64 (empty cells as NaN), text columns (and date) as fixed-width unicode
+arrays. That is a few bytes per value instead of one dict per row with a Python
+str per value (csv.DictReader), and numbers are parsed once, by the pandas C
+parser with round-trip precision (bit-identical to float()).
+
+  table.column(name)        the column array (zero-copy)
+  table.float_column(name)  float64 view / parse (NaN: missing column, empty or non-numeric)
+  table.t                   date index: int64 epoch seconds (timebase.py), parsed once
+  table.valid               False for rows whose date is empty or unparseable (their t is 0);
+                            sorted() and between() leave those rows out
+  table[i:j], table.between(start, end)
+                            zero-copy row slices (between() on a date-sorted table)
+  table[i], iter(table)     lazy Row views (__slots__) for legacy callers: a Mapping like the
+                            csv.DictReader row, with numbers as float / int and empty numeric
+                            cells as ''; assignment writes back into the column
+
+Usage:
+  python scripts/signal_table.py bench --rows 2000000        # peak RSS: DictReader vs SignalTable
+"""
+import argparse
+import csv
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+from channels import to_float
+from timebase import valid_epoch
+
+log = logging.getLogger(__name__)
+
+# text columns of the pipeline CSVs: read as str even when every value looks like a number
+# (station codes such as 0042, dates), so they keep their exact spelling
+TEXT_COLUMNS = ('date', 'station_id', 'event', 'source', 'estado', 'max_date')
+
+
+class Row(Mapping):
+    """Lazy view of row i of a SignalTable."""
+    __slots__ = ('_table', '_i')
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, key):
+        v = self._table.cols[key][self._i]
+        if isinstance(v, np.floating):
+            return '' if v != v else float(v)
+        return v.item()
+
+    def __setitem__(self, key, value):
+        t = self._table
+        if key not in t.cols:
+            t.cols[key] = np.full(len(t), np.nan)
+        col = t.cols[key]
+        if col.dtype.kind == 'U' and len(str(value)) > col.dtype.itemsize // 4:
+            col = t.cols[key] = col.astype(f'U{len(str(value))}')     # widen instead of truncating
+        col[self._i] = to_float(value) if col.dtype.kind == 'f' else value
+
+    def __iter__(self):
+        return iter(self._table.cols)
+
+    def __len__(self):
+        return len(self._table.cols)
+
+    def __repr__(self):
+        return f'Row({dict(self)!r})'
+
+
+class SignalTable:
+    """Typed column table; see the module docstring."""
+
+    def __init__(self, cols=None, t=None, ok=None):
+        self.cols = {k: np.asarray(v) for k, v in (cols or {}).items()}
+        self._t, self._ok = t, ok
+        lens = {len(v) for v in self.cols.values()}
+        if len(lens) > 1:
+            raise ValueError(f'columnas de largos distintos: {sorted(lens)}')
+        self._n = lens.pop() if lens else 0
+
+    @classmethod
+    def read_csv(cls, path):
+        """Table of a CSV file (empty table if it does not exist)."""
+        p = Path(path)
+        if not p.exists():
+            return cls()
+        import pandas as pd
+        try:
+            df = read_frame(p)
+        except pd.errors.EmptyDataError:
+            return cls()
+        return cls.from_frame(df)
+
+    @classmethod
+    def from_frame(cls, df):
+        cols = {}
+        for c in df.columns:
+            s = df[c]
+            if s.dtype.kind in 'if':
+                cols[c] = s.to_numpy()
+            elif s.dtype.kind == 'b':
+                cols[c] = s.to_numpy(dtype=np.int64)
+            else:
+                cols[c] = s.fillna('').astype(str).to_numpy(dtype=str)
+        return cls(cols)
+
+    @classmethod
+    def from_rows(cls, rows, columns=None):
+        """Table of dict rows (csv.DictReader / legacy); columns whose values all parse as numbers become float64."""
+        rows = list(rows)
+        columns = columns or list(dict.fromkeys(k for r in rows for k in r))
+        cols = {}
+        for c in columns:
+            vals = [r.get(c, '') for r in rows]
+            num = np.array([to_float(v) for v in vals], dtype=np.float64)
+            text = [v for v, x in zip(vals, num) if x != x and v not in ('', None)]
+            cols[c] = np.array(['' if v is None else str(v) for v in vals], dtype=str) if text or c == 'date' else num
+        return cls(cols)
+
+    def __len__(self):
+        return self._n
+
+    def __bool__(self):
+        return self._n > 0
+
+    @property
+    def columns(self):
+        return list(self.cols)
+
+    def __contains__(self, name):
+        return name in self.cols
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._slice(i)
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return Row(self, i)
+
+    def __iter__(self):
+        return (Row(self, i) for i in range(self._n))
+
+    def _slice(self, s):
+        if self._t is None:
+            return SignalTable({k: v[s] for k, v in self.cols.items()})
+        return SignalTable({k: v[s] for k, v in self.cols.items()}, self._t[s], self._ok[s])
+
+    def column(self, name):
+        return self.cols[name]
+
+    def set_column(self, name, values):
+        """Add or replace a column (same length as the table)."""
+        values = np.asarray(values)
+        if len(values) != self._n:
+            raise ValueError(f'columna {name!r}: {len(values)} valores para {self._n} filas')
+        self.cols[name] = values
+
+    def float_column(self, name):
+        """float64 values of a column; NaN for a missing column and for empty / non-numeric cells."""
+        col = self.cols.get(name)
+        if col is None:
+            return np.full(self._n, np.nan)
+        if col.dtype.kind in 'iuf':
+            return col.astype(np.float64, copy=False)
+        return np.fromiter((to_float(v) for v in col.tolist()), dtype=np.float64, count=self._n)
+
+    @property
+    def t(self):
+        """int64 epoch seconds of the date column (parsed once; 0 where not valid)."""
+        if self._t is None:
+            self._t, self._ok = valid_epoch(self.cols['date'].tolist() if self._n else [])
+        return self._t
+
+    @property
+    def valid(self):
+        """Rows with a parseable date."""
+        self.t
+        return self._ok
+
+    def take(self, idx):
+        """Rows idx (int indices or boolean mask), copied."""
+        idx = np.asarray(idx)
+        if self._t is None:
+            return SignalTable({k: v[idx] for k, v in self.cols.items()})
+        return SignalTable({k: v[idx] for k, v in self.cols.items()}, self._t[idx], self._ok[idx])
+
+    def sorted(self):
+        """Table sorted by date (stable) without the rows of invalid date; self when already so."""
+        t, ok = self.t, self.valid
+        if not ok.all():
+            idx = np.flatnonzero(ok)
+            return self.take(idx[np.argsort(t[idx], kind='stable')])
+        if len(t) < 2 or bool(np.all(t[1:] >= t[:-1])):
+            return self
+        return self.take(np.argsort(t, kind='stable'))
+
+    def between(self, start=None, end=None):
+        """Slice of a date-sorted table with start <= t <= end (epoch seconds); zero-copy unless
+        rows of invalid date have to be left out."""
+        tab = self if self.valid.all() else self.take(self.valid)
+        t = tab.t
+        lo = 0 if start is None else int(np.searchsorted(t, start, 'left'))
+        hi = len(t) if end is None else int(np.searchsorted(t, end, 'right'))
+        return tab[lo:hi]
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self.cols.values())
+
+
+def read_table(path):
+    """SignalTable.read_csv(path)."""
+    return SignalTable.read_csv(path)
+
+
+def read_frame(path):
+    """pandas DataFrame of a pipeline CSV: TEXT_COLUMNS as str, numbers with round-trip precision,
+    empty cells as NaN. Rows with more fields than the header are skipped with a warning."""
+    import pandas as pd
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        df = pd.read_csv(path, dtype=dict.fromkeys(TEXT_COLUMNS, str), na_values=[''], keep_default_na=False,
+                         float_precision='round_trip', on_bad_lines='warn')
+    bad = [w for w in caught if issubclass(w.category, pd.errors.ParserWarning)]
+    if bad:
+        log.warning('%s: filas con más campos que la cabecera omitidas: %s', Path(path).name,
+                    '; '.join(str(w.message).strip() for w in bad))
+    for w in caught:
+        if w not in bad:
+            warnings.warn_explicit(w.message, w.category, w.filename, w.lineno)
+    return df
+
+
+def _peak_child(mode, path):
+    code = ('import csv, resource, sys\n'
+            f'sys.path.insert(0, {str(Path(__file__).resolve().parent)!r})\n'
+            'from signal_table import read_table\n'
+            f'p = {str(path)!r}\n'
+            # current RSS (not the import-time peak) as the baseline of the peak
+            'base = int(open("/proc/self/statm").read().split()[1]) * resource.getpagesize() // 1024\n'
+            + ('rows = list(csv.DictReader(open(p, encoding="utf-8")))\n' if mode == 'dict' else
+               'rows = read_table(p)\n')
+            + 'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base, len(rows))\n')
+    if mode == 'table':
+        # pandas import cost is not data: load it before the baseline
+        code = code.replace('from signal_table import read_table\n', 'from signal_table import read_table\nimport pandas\n')
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+    return int(out[0]) / 1024, int(out[1]), time.perf_counter() - t0
+
+
+def cmd_bench(args):
+    rng = np.random.default_rng(0)
+    n = args.rows
+    days = (np.datetime64('1950-01-01') + np.arange(n) // 24).astype(str)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'radon.csv'
+        with path.open('w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            w.writerow(['date', 'r_ppm', 'r_zscore', 'source'])
+            for i in range(0, n, 100_000):
+                k = min(100_000, n - i)
+                ppm = np.round(rng.uniform(5, 60, k), 2)
+                z = np.round(rng.normal(size=k), 4)
+                w.writerows(zip(days[i:i + k], ppm, z, rng.choice(['st_a', 'st_b', 'regional'], k)))
+        size = path.stat().st_size / 2 ** 20
+        d_mb, d_n, d_s = _peak_child('dict', path)
+        t_mb, t_n, t_s = _peak_child('table', path)
+    print(f'{n} filas ({size:.0f} MB CSV): csv.DictReader pico +{d_mb:.0f} MB en {d_s:.1f}s; '
+          f'SignalTable pico +{t_mb:.0f} MB en {t_s:.1f}s ({d_mb / max(t_mb, 1):.1f}x menos memoria)')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Tabla tipada en memoria para los CSV del pipeline')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    be = sub.add_parser('bench')
+    be.add_argument('--rows', type=int, default=2_000_000)
+    args = ap.parse_args()
+    cmd_bench(args)
+
+
+if __name__ == '__main__':
+    main()
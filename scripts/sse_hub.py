@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+sse_hub.py
+Server-Sent Events hub for the upload server. It runs an asyncio server in one
+background thread so hundreds of idle EventSource clients cost a socket and a
+small queue each, not a thread each.
+
+Flask handlers call hub.publish(type, data) from any thread. Every client has a
+bounded queue: a client that falls behind by more than queue_size messages is
+disconnected and, when the browser reconnects with Last-Event-ID, the missed
+messages are replayed from a ring buffer.
+
+Endpoints (on the hub port, default 5002):
+  GET /events?token=...[&event=<name>]    text/event-stream
+  GET /events/stats                       clients, sent/dropped counters, RSS
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux /proc, fallback to ru_maxrss)."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return None
+
+
+class _Client:
+    __slots__ = ('queue', 'event', 'writer', 'overflow')
+
+    def __init__(self, queue, event, writer):
+        self.queue = queue
+        self.event = event
+        self.writer = writer
+        self.overflow = False
+
+
+class SSEHub:
+    def __init__(self, host='0.0.0.0', port=5002, token=None, heartbeat_s=15.0,
+                 queue_size=256, max_clients=2000, replay=1000, logger=None):
+        self.host = host
+        self.port = int(port)
+        self.token = token
+        self.heartbeat_s = float(heartbeat_s)
+        self.queue_size = int(queue_size)
+        self.max_clients = int(max_clients)
+        self.logger = logger
+        self._ring = deque(maxlen=int(replay))
+        self._next_id = 1
+        self._id_lock = threading.Lock()
+        self._clients = set()
+        self._loop = None
+        self._ready = threading.Event()
+        self.stats = {'published': 0, 'sent': 0, 'disconnected_slow': 0, 'rejected': 0}
+
+    @property
+    def running(self):
+        return self._loop is not None and self._ready.is_set()
+
+    # --- lifecycle ---
+    def start(self):
+        t = threading.Thread(target=self._run, name='sse-hub', daemon=True)
+        t.start()
+        self._ready.wait(5)
+        return t
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port, backlog=1024))
+        if self.logger:
+            self.logger.info('SSE hub listening on %s:%s', self.host, self.port)
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+
+    # --- publishing (thread-safe) ---
+    def publish(self, etype, data):
+        with self._id_lock:
+            mid = self._next_id
+            self._next_id += 1
+        payload = dict(data)
+        payload.setdefault('ts', time.time())
+        msg = (mid, etype, payload.get('event'),
+               f'id: {mid}\nevent: {etype}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n'.encode('utf-8'))
+        self.stats['published'] += 1
+        if self._loop is None:
+            self._ring.append(msg)
+            return mid
+        self._loop.call_soon_threadsafe(self._fanout, msg)
+        return mid
+
+    def _fanout(self, msg):
+        self._ring.append(msg)
+        for c in list(self._clients):
+            if c.event and msg[2] and msg[2] != c.event:
+                continue
+            try:
+                c.queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                # backpressure: drop the slow client; it reconnects and replays via Last-Event-ID
+                if not c.overflow:
+                    c.overflow = True
+                    self.stats['disconnected_slow'] += 1
+
+    # --- HTTP ---
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+        except Exception:
+            writer.close()
+            return
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            writer.close()
+            return
+        headers = {}
+        for ln in lines[1:]:
+            if ':' in ln:
+                k, v = ln.split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+        url = urlsplit(target)
+        qs = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if method != 'GET':
+            return await self._reply(writer, 405, {'ok': False, 'error': 'method not allowed'})
+        if url.path == '/events/stats':
+            return await self._reply(writer, 200, {'ok': True, **self.snapshot()})
+        if url.path != '/events':
+            return await self._reply(writer, 404, {'ok': False, 'error': 'Not found'})
+        auth = headers.get('authorization', '')
+        tok = qs.get('token') or (auth.split(' ', 1)[1] if auth.startswith('Bearer ') else auth)
+        if self.token and tok != self.token:
+            return await self._reply(writer, 401, {'ok': False, 'error': 'Unauthorized - invalid token'})
+        if len(self._clients) >= self.max_clients:
+            self.stats['rejected'] += 1
+            return await self._reply(writer, 503, {'ok': False, 'error': 'too many clients'})
+        await self._stream(writer, qs.get('event'), headers.get('last-event-id') or qs.get('lastEventId'))
+
+    async def _reply(self, writer, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        reason = {200: 'OK', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+                  503: 'Service Unavailable'}.get(code, 'OK')
+        writer.write(f'HTTP/1.1 {code} {reason}\r\nContent-Type: application/json\r\n'
+                     f'Access-Control-Allow-Origin: *\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, event, last_id):
+        client = _Client(asyncio.Queue(self.queue_size), event, writer)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\nX-Accel-Buffering: no\r\n\r\n'
+                     b'retry: 3000\n\n')
+        if last_id and str(last_id).isdigit():
+            for msg in list(self._ring):
+                if msg[0] > int(last_id) and not (event and msg[2] and msg[2] != event):
+                    writer.write(msg[3])
+        self._clients.add(client)
+        try:
+            await writer.drain()
+            while not client.overflow:
+                try:
+                    msg = await asyncio.wait_for(client.queue.get(), timeout=self.heartbeat_s)
+                    writer.write(msg[3])
+                    self.stats['sent'] += 1
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError, OSError):
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    def snapshot(self):
+        return {'clients': len(self._clients), 'rss_bytes': rss_bytes(), **self.stats}
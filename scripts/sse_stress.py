@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Stress test for the SSE hub (/events): opens N idle EventSource-like connections
+and reports the hub's RSS growth per connection.
+
+Usage:
+  python scripts/upload_server.py            # in another terminal
+  python scripts/sse_stress.py --clients 500 --hold 30
+  python scripts/sse_stress.py --standalone --clients 500   # starts an in-process hub
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=5002)
+    p.add_argument('--token', default='devtoken')
+    p.add_argument('--clients', type=int, default=500)
+    p.add_argument('--hold', type=float, default=10.0, help='Seconds to keep connections open')
+    p.add_argument('--standalone', action='store_true', help='Run the hub in this process (no upload server); RSS then includes the client side too')
+    return p.parse_args()
+
+
+async def get_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET /events/stats HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return json.loads(data.split(b'\r\n\r\n', 1)[1])
+
+
+async def open_client(host, port, token):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET /events?token={token} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    if b' 200 ' not in head.split(b'\r\n', 1)[0]:
+        raise RuntimeError(head.split(b'\r\n', 1)[0].decode())
+    return reader, writer
+
+
+async def run(args):
+    before = await get_stats(args.host, args.port)
+    t0 = time.perf_counter()
+    conns = []
+    for i in range(0, args.clients, 100):
+        batch = [open_client(args.host, args.port, args.token) for _ in range(min(100, args.clients - i))]
+        conns += await asyncio.gather(*batch)
+    t_open = time.perf_counter() - t0
+    await asyncio.sleep(min(args.hold, 2.0))
+    during = await get_stats(args.host, args.port)
+    await asyncio.sleep(max(0.0, args.hold - 2.0))
+    for _, w in conns:
+        w.close()
+    rss0, rss1 = before.get('rss_bytes') or 0, during.get('rss_bytes') or 0
+    print(f"clientes abiertos: {during['clients']} (en {t_open:.2f}s)")
+    print(f"RSS hub: {rss0/1e6:.1f} MB -> {rss1/1e6:.1f} MB")
+    print(f"memoria por conexión: {(rss1 - rss0) / max(1, args.clients) / 1024:.1f} KiB")
+
+
+def main():
+    args = parse_args()
+    if args.standalone:
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        from sse_hub import SSEHub
+        SSEHub(host=args.host, port=args.port, token=args.token, max_clients=args.clients + 10).start()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
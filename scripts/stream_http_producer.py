@@ -3,8 +3,20 @@
 Simple example that posts a satellite CSV file to the upload server (/upload_sat).
 Usage:
   python scripts/stream_http_producer.py --file example.csv --event Valdivia_1960 --token devtoken
+
+Large files (chunked, parallel and resumable):
+  python scripts/stream_http_producer.py -f big.csv -e Maule_2010 --chunked --chunk-mb 8 --workers 4
+If the transfer is interrupted, run the same command again: the upload id is kept in
+<file>.upload.json and only the chunks the server does not have yet are sent.
 """
 import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
 import requests
 
 
@@ -15,12 +27,104 @@ def parse_args():
     p.add_argument('--url', default='http://localhost:5001/upload_sat')
     p.add_argument('--token', default='devtoken')
     p.add_argument('--run-pipeline', action='store_true')
+    p.add_argument('--chunked', action='store_true', help='Use the resumable chunked protocol')
+    p.add_argument('--chunk-mb', type=float, default=8.0, help='Chunk size in MB (chunked mode)')
+    p.add_argument('--workers', type=int, default=4, help='Parallel chunk uploads (chunked mode)')
+    p.add_argument('--retries', type=int, default=5, help='Retries per chunk (chunked mode)')
     return p.parse_args()
 
 
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for buf in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def read_chunk(path, index, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(index * chunk_size)
+        return f.read(chunk_size)
+
+
+def put_chunk(session, base, upload_id, path, index, chunk_size, headers, retries):
+    data = read_chunk(path, index, chunk_size)
+    h = dict(headers or {})
+    h['X-Chunk-SHA256'] = hashlib.sha256(data).hexdigest()
+    h['Content-Type'] = 'application/octet-stream'
+    for attempt in range(retries + 1):
+        try:
+            r = session.put(f'{base}/{upload_id}/{index}', data=data, headers=h, timeout=120)
+            if r.status_code == 200:
+                return index
+            if r.status_code in (400, 404, 422):
+                raise RuntimeError(f'chunk {index}: {r.status_code} {r.text}')
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+        time.sleep(min(30, 2 ** attempt))
+    raise RuntimeError(f'chunk {index}: sin éxito tras {retries} reintentos')
+
+
+def chunked_upload(args, headers):
+    path = Path(args.file)
+    base = args.url.rstrip('/') + '/chunked'
+    size = path.stat().st_size
+    state_file = Path(str(path) + '.upload.json')
+    session = requests.Session()
+
+    upload_id = None
+    if state_file.exists():
+        st = json.loads(state_file.read_text(encoding='utf-8'))
+        if st.get('size') == size and st.get('mtime') == path.stat().st_mtime and st.get('event') == args.event:
+            r = session.get(f"{base}/{st['upload_id']}", headers=headers, timeout=30)
+            if r.status_code == 200:
+                upload_id, chunk_size = st['upload_id'], st['chunk_size']
+                missing = r.json()['missing']
+                print(f'Reanudando {upload_id}: faltan {len(missing)} chunks')
+    if upload_id is None:
+        body = {'event': args.event, 'size': size, 'chunk_size': int(args.chunk_mb * 1024 * 1024),
+                'sha256': file_sha256(path), 'filename': path.name,
+                'run_pipeline': 'true' if args.run_pipeline else 'false'}
+        r = session.post(base, json=body, headers=headers, timeout=30)
+        r.raise_for_status()
+        j = r.json()
+        if j.get('duplicate'):
+            print(f"Contenido ya ingerido para {args.event} (job {j.get('duplicate_of')}); no se transfiere.")
+            return
+        upload_id, chunk_size = j['upload_id'], j['chunk_size']
+        missing = list(range(j['total_chunks']))
+        state_file.write_text(json.dumps({'upload_id': upload_id, 'chunk_size': chunk_size, 'size': size,
+                                          'mtime': path.stat().st_mtime, 'event': args.event}), encoding='utf-8')
+        print(f"Upload {upload_id} (job {j.get('job_id')}): {j['total_chunks']} chunks de {chunk_size} bytes")
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futs = [pool.submit(put_chunk, session, base, upload_id, path, i, chunk_size, headers, args.retries)
+                for i in missing]
+        done = 0
+        for fut in as_completed(futs):
+            fut.result()
+            done += 1
+            if done % 10 == 0 or done == len(futs):
+                print(f'  {done}/{len(futs)} chunks enviados')
+    dt = max(time.time() - t0, 1e-6)
+    print(f'Transferencia: {size / 1e6:.1f} MB en {dt:.1f}s ({size / 1e6 / dt:.1f} MB/s)')
+
+    r = session.post(f'{base}/{upload_id}/complete', headers=headers, timeout=600)
+    print('STATUS', r.status_code)
+    print(r.text)
+    if r.status_code == 200:
+        os.remove(state_file)
+
+
 def main():
     args = parse_args()
     headers = {'Authorization': f'Bearer {args.token}'} if args.token else None
+    if args.chunked:
+        chunked_upload(args, headers)
+        return
     params = {'event': args.event}
     if args.run_pipeline:
         params['run_pipeline'] = 'true'
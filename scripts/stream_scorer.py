@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+stream_scorer.py
+Long-running IASi scorer for live feeds. Reads NDJSON observations, one per line,
+from stdin or a local socket, keeps per-event carried-forward state in memory
+(same "last valid observation" semantics as join_by_date in run_eval_batch.py,
+including the per-channel staleness of config/join.yaml: a channel whose last
+observation is older than max_age_days is dropped or decayed, as in
+calendar_join.DenseJoin) and writes a JSON line every time an event changes
+state (Observación / Precaución / Alerta). Ages are measured from the event's
+latest calendar unit, so they are re-evaluated on every observation of the event.
+
+Observation lines:
+  {"event": "Maule_2010", "channel": "R", "date": "2010-02-01", "r_zscore": 1.3}
+  {"channel": "A", "date": "2010-02-01", "value": 0.4}          # no event: every event
+  {"event": "Maule_2010", "channel": "D", "date": "2010-02-01", "mean_coh": 0.6, "p95_defo_mm": 12}
+Channels, fields and transforms are those of the channel registry
+(config/channels.yaml): A a_score, R r_zscore, M m_verified_ratio,
+S s_activity_z, D mean_coh + p95_defo_mm, G gnss_disp_mm, ...; "value" is
+accepted for single-field channels. "date" may be a date or an ISO timestamp;
+observations are keyed by their calendar unit (day, or hour with
+config/join.yaml resolution: hour). Observations older than the event's current
+unit are counted as late and ignored.
+
+Each observation updates one transformed component of its event and the weighted
+sum, so the cost per observation is O(1) whatever the history length. State is
+checkpointed to outputs/stream/checkpoint.json every --checkpoint-s seconds and
+on exit, and restored on start (--fresh to ignore it).
+
+Usage:
+  python scripts/stream_scorer.py < feed.ndjson
+  python scripts/stream_scorer.py --listen unix:/tmp/iasi.sock --out outputs/stream/transitions.ndjson
+  python scripts/stream_scorer.py --listen tcp:127.0.0.1:5003
+  python scripts/stream_scorer.py bench --obs 1000000     # replay benchmark (target 100k obs/s)
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+import run_eval_batch as reb
+from calendar_join import load_config as load_join_config
+from timebase import DAY_S, epoch, label
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT_STREAM = ROOT / 'outputs' / 'stream'
+CHECKPOINT = OUT_STREAM / 'checkpoint.json'
+TARGET_OBS_S = 100_000
+
+# one slot per registry channel; a component is the max of its channels' slots (D: InSAR, GNSS)
+SLOT = {ch.name: i for i, ch in enumerate(reb.REGISTRY.channels)}
+COMP_SLOTS = [tuple(SLOT[ch.name] for ch in reb.REGISTRY.channels if ch.component == c)
+              for c in reb.COMPONENTS]
+_SCALAR = {ch.name: ch.scalar for ch in reb.REGISTRY.channels}
+# (slot, max_age, half_life or 0 for mode drop), in seconds, of channels with a join.yaml staleness limit
+STALE = [(SLOT[name], c['max_age_days'] * DAY_S, (c['half_life_days'] or 0) * DAY_S if c['mode'] == 'decay' else 0)
+         for name, c in load_join_config()[2].items() if name in SLOT and c['max_age_days'] is not None]
+_EPOCH = {}
+
+
+def unit_epoch(key):
+    """Epoch seconds of a time_key() label (cached: feeds repeat the same few units)."""
+    t = _EPOCH.get(key)
+    if t is None:
+        if len(_EPOCH) > 100_000:
+            _EPOCH.clear()
+        t = _EPOCH[key] = epoch(key)
+    return t
+
+
+def time_key(value):
+    """Calendar unit of an observation date / timestamp: YYYY-MM-DD, or YYYY-MM-DDTHH:MM at hour resolution."""
+    return value[:10] if reb.RESOLUTION == 'day' else label(value, reb.RESOLUTION)
+
+
+def transform(channel, obs):
+    """Transformed component for one observation (channels.Channel.scalar)."""
+    return _SCALAR[channel](obs)
+
+
+def state_for(iasi, th):
+    return 'Observación' if iasi < th['observation'] else ('Precaución' if iasi <= th['caution_max'] else 'Alerta')
+
+
+class EventState:
+    """Carried-forward components of one event; t[slot] is the epoch of the calendar unit of the
+    slot's last observation (None: unknown) and now that of the event's latest unit."""
+    __slots__ = ('date', 'comp', 'iasi', 'state', 'n', 't', 'now')
+
+    def __init__(self, date='', comp=None, iasi=0.0, state='', n=0, t=None):
+        self.date = date
+        self.comp = comp or [0.0] * len(SLOT)
+        self.iasi = iasi
+        self.state = state
+        self.n = n
+        self.t = t or [None] * len(SLOT)
+        self.now = unit_epoch(date) if date else None
+
+
+class StreamScorer:
+    def __init__(self, weights=None, th=None, events=(), emit=None):
+        self.w = (reb.REGISTRY.compile(weights) if weights else reb.KERNEL).weights.tolist()
+        self.th = th or reb.TH
+        self.events = {name: EventState() for name in events}
+        self.emit = emit or (lambda rec: None)
+        self.counts = {'observations': 0, 'late': 0, 'invalid': 0, 'transitions': 0}
+        self.lock = threading.Lock()
+
+    def _score(self, ev):
+        comp, now, ts = ev.comp, ev.now, ev.t
+        # join.yaml staleness (calendar_join.staleness) of every slot at the event's latest unit
+        for s, max_age, half_life in STALE:
+            t = ts[s]
+            if t is not None and now - t > max_age:
+                if comp is ev.comp:
+                    comp = list(comp)
+                comp[s] *= 0.5 ** ((now - t - max_age) / half_life) if half_life else 0.0
+        return sum(w * c for w, c in zip(self.w, self.comp_view(comp)))
+
+    @staticmethod
+    def comp_view(comp):
+        return [comp[s[0]] if len(s) == 1 else max(comp[i] for i in s) for s in COMP_SLOTS]
+
+    def _apply(self, name, ev, slot, value, date, t):
+        if date < ev.date:
+            self.counts['late'] += 1
+            return
+        ev.date, ev.now = date, t
+        ev.comp[slot] = value
+        ev.t[slot] = t
+        ev.n += 1
+        ev.iasi = self._score(ev)
+        st = state_for(ev.iasi, self.th)
+        if st != ev.state:
+            prev, ev.state = ev.state, st
+            self.counts['transitions'] += 1
+            self.emit({'event': name, 'date': date, 'IASi': round(ev.iasi, 4), 'estado': st, 'previo': prev or None})
+
+    def feed(self, obs):
+        """Apply one parsed observation."""
+        self.counts['observations'] += 1
+        try:
+            ch = obs['channel']
+            value = transform(ch, obs)
+            slot = SLOT[ch]
+            date = time_key(obs['date'])
+            t = unit_epoch(date)
+        except (KeyError, TypeError, ValueError):
+            self.counts['invalid'] += 1
+            return
+        name = obs.get('event')
+        if name is None:
+            for n, ev in self.events.items():
+                self._apply(n, ev, slot, value, date, t)
+            return
+        ev = self.events.get(name)
+        if ev is None:
+            ev = self.events[name] = EventState()
+        self._apply(name, ev, slot, value, date, t)
+
+    def feed_line(self, line):
+        try:
+            obs = json.loads(line)
+        except ValueError:
+            self.counts['observations'] += 1
+            self.counts['invalid'] += 1
+            return
+        self.feed(obs)
+
+    def snapshot(self):
+        return {'saved_at': time.time(), 'counts': dict(self.counts),
+                'events': {n: {'date': e.date, 'comp': e.comp, 'IASi': e.iasi, 'estado': e.state, 'n': e.n,
+                               't': e.t}
+                           for n, e in self.events.items()}}
+
+    def restore(self, snap):
+        for n, e in snap.get('events', {}).items():
+            # a checkpoint taken with fewer channels restores their slots as 0
+            comp = (list(e['comp']) + [0.0] * len(SLOT))[:len(SLOT)]
+            # checkpoints without observation times: ages unknown until the slot is observed again
+            t = (list(e.get('t') or []) + [None] * len(SLOT))[:len(SLOT)]
+            self.events[n] = EventState(e['date'], comp, e['IASi'], e['estado'], e['n'], t)
+        for k, v in snap.get('counts', {}).items():
+            self.counts[k] = v
+
+
+class Checkpointer:
+    def __init__(self, scorer, path=CHECKPOINT, every_s=10.0):
+        self.scorer = scorer
+        self.path = Path(path)
+        self.every_s = every_s
+        self.last = time.monotonic()
+
+    def load(self):
+        if self.path.exists():
+            self.scorer.restore(json.loads(self.path.read_text(encoding='utf-8')))
+            return True
+        return False
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.scorer.snapshot(), ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.path)
+        self.last = time.monotonic()
+
+    def maybe_save(self):
+        if time.monotonic() - self.last >= self.every_s:
+            self.save()
+
+
+def _writer(out):
+    lock = threading.Lock()
+
+    def emit(rec):
+        line = json.dumps(rec, ensure_ascii=False) + '\n'
+        with lock:
+            out.write(line)
+            out.flush()
+    return emit
+
+
+def serve(scorer, ckpt, listen):
+    """Accept NDJSON producers on unix:<path> or tcp:<host>:<port> until interrupted."""
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for k, line in enumerate(self.rfile, 1):
+                with scorer.lock:
+                    scorer.feed_line(line)
+                    if k % 1024 == 0:
+                        ckpt.maybe_save()
+            with scorer.lock:
+                ckpt.maybe_save()
+
+    kind, _, addr = listen.partition(':')
+    if kind == 'unix':
+        if os.path.exists(addr):
+            os.unlink(addr)
+        server = socketserver.ThreadingUnixStreamServer(addr, Handler)
+    elif kind == 'tcp':
+        host, _, port = addr.rpartition(':')
+        server = socketserver.ThreadingTCPServer((host or '127.0.0.1', int(port)), Handler)
+    else:
+        raise SystemExit(f'--listen debe ser unix:<ruta> o tcp:<host>:<puerto>, no {listen}')
+    server.daemon_threads = True
+    print(f'stream_scorer escuchando en {listen}', file=sys.stderr)
+    stop = threading.Event()
+
+    def ticker():
+        # checkpoint also when producers are idle
+        while not stop.wait(ckpt.every_s):
+            with scorer.lock:
+                ckpt.maybe_save()
+    threading.Thread(target=ticker, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+        if kind == 'unix' and os.path.exists(addr):
+            os.unlink(addr)
+
+
+def run_stdin(scorer, ckpt, src=sys.stdin):
+    for k, line in enumerate(src, 1):
+        scorer.feed_line(line)
+        if k % 1024 == 0:
+            ckpt.maybe_save()
+
+
+def bench(n_obs, n_events):
+    """Replay synthetic NDJSON through one scorer and check it against the batch kernel
+    (run_eval_batch.KERNEL with calendar_join.staleness weights)."""
+    import random
+    from datetime import date as _date, timedelta
+
+    import numpy as np
+
+    from calendar_join import FOREVER, staleness
+    rnd = random.Random(0)
+    events = [f'EV{i:03d}' for i in range(n_events)]
+    chans = reb.REGISTRY.channels
+    lines = []
+    day = 0
+    for i in range(n_obs):
+        if i % (n_events * len(chans)) == 0:
+            day += 1
+        date = (_date(2000, 1, 1) + timedelta(days=day)).isoformat()
+        ch = chans[i % len(chans)]
+        obs = {'event': events[rnd.randrange(n_events)], 'channel': ch.name, 'date': date}
+        for col in ch.inputs:
+            # around the active range of the transform: gates straddle their threshold
+            obs[col] = round(rnd.gauss(ch.center, 1.5 * ch.scale) if ch.kind == 'sigmoid'
+                             else rnd.uniform(0, 1.5 * (ch.scale if col == ch.column else 2 * ch.gate_min)), 3)
+        lines.append(json.dumps(obs))
+    scorer = StreamScorer(events=events)
+    t0 = time.perf_counter()
+    for line in lines:
+        scorer.feed_line(line)
+    dt = time.perf_counter() - t0
+    rate = n_obs / dt
+    # reference: the batch kernel on the last observation of every channel per event, weighted by
+    # its age at the event's last observation day
+    last = {}
+    for line in lines:
+        o = json.loads(line)
+        last.setdefault(o['event'], {})[o['channel']] = o
+    join_cfg = load_join_config()[2]
+    worst = 0.0
+    for name, obs in last.items():
+        now = max(o['date'] for o in obs.values())
+        cols = {(c, col): np.array([float(o[col])]) for c, o in obs.items() for col in reb.REGISTRY.by_name[c].inputs}
+        w = {c: staleness([(epoch(now) - epoch(o['date'])) / DAY_S], join_cfg.get(c, FOREVER)) for c, o in obs.items()}
+        worst = max(worst, abs(float(reb.KERNEL(cols, w)[1][0]) - scorer.events[name].iasi))
+    print(f'{n_obs} observaciones, {n_events} eventos: {dt:.2f}s -> {rate:,.0f} obs/s '
+          f'(objetivo {TARGET_OBS_S:,}: {"OK" if rate >= TARGET_OBS_S else "NO"}); '
+          f'{scorer.counts["transitions"]} transiciones; máx |ΔIASi| vs kernel batch = {worst:.2e}')
+    return rate >= TARGET_OBS_S and worst < 1e-9
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        ap = argparse.ArgumentParser(description='Benchmark de reproducción del scorer en streaming')
+        ap.add_argument('cmd')
+        ap.add_argument('--obs', type=int, default=1_000_000)
+        ap.add_argument('--events', type=int, default=50)
+        args = ap.parse_args()
+        sys.exit(0 if bench(args.obs, args.events) else 1)
+    ap = argparse.ArgumentParser(description='Scorer IASi en streaming (NDJSON)')
+    ap.add_argument('--listen', help='unix:<ruta> o tcp:<host>:<puerto> (por defecto: stdin)')
+    ap.add_argument('--out', help='Archivo NDJSON de transiciones (por defecto: stdout)')
+    ap.add_argument('--checkpoint', default=str(CHECKPOINT))
+    ap.add_argument('--checkpoint-s', type=float, default=10.0)
+    ap.add_argument('--fresh', action='store_true', help='No restaurar el último checkpoint')
+    args = ap.parse_args()
+    out = open(args.out, 'a', encoding='utf-8') if args.out else sys.stdout
+    scorer = StreamScorer(events=[ev['name'] for ev in reb.EVENTS], emit=_writer(out))
+    ckpt = Checkpointer(scorer, args.checkpoint, args.checkpoint_s)
+    if not args.fresh and ckpt.load():
+        print(f'Estado restaurado desde {ckpt.path} ({scorer.counts["observations"]} observaciones)', file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        if args.listen:
+            serve(scorer, ckpt, args.listen)
+        else:
+            run_stdin(scorer, ckpt)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with scorer.lock:
+            ckpt.save()
+        print(f'stream_scorer: {json.dumps(scorer.counts)}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+synthetic_data.py
+Seeded synthetic inputs for every channel of config/channels.yaml, at any scale,
+written under --out with the repository layout (data/..., config/aoi_*.geojson).
+
+Events: the pipeline's run_eval_batch.EVENTS first (real mainshock dates), then
+SYN_<k> events along the Andean margin. Each event covers --years of data, with
+its mainshock 80 % of the way in. Per event:
+
+  signals   each scope: signal channel (animals, radon, marine, sensors): --stations
+            located series (lat, lon, station_id) inside the event AOI, plus one
+            regional series (no location) over the union of the event windows;
+            daily or hourly (--resolution, default config/join.yaml)
+  D         InSAR acquisitions every --revisit days (some scenes lost), acquisition
+            time kept at hour resolution; coherence sometimes under the gate
+  G, ...    other scope: event channels as daily series (GNSS daily solutions)
+  catalog   data/catalogs/<event>.csv (date, mw, lat, lon, depth): the mainshock,
+            Gutenberg-Richter background seismicity and an Omori-Utsu aftershock
+            sequence (largest aftershock ~ Mw - 1.2, Båth)
+  AOI       config/aoi_*.geojson: a polygon around the epicenter sized to the rupture
+            length (Wells & Coppersmith)
+  rasters   (--rasters) data/rasters/<event>/defo.npy + coh.npy + dates.txt + grid.json,
+            the (T, H, W) stack layout of raster_features.py, on the D acquisition dates
+
+Values are AR(1) processes (autocorrelation time --corr-days, the same at hour
+resolution) mapped to each column's range (MODELS), plus a precursor anomaly that
+ramps up over --precursor-days before the mainshock and decays after it, so the
+IASi has something to find. Station outages (--gaps-per-year, mean --gap-days)
+are left out as missing rows.
+
+Each file (or, for the shared signal files, each event's part of it) is one task,
+run in --workers processes and streamed to disk in blocks of BLOCK_ROWS rows; the
+signal parts are then concatenated. Every task draws from its own
+SeedSequence(seed, task), so the output is identical for any worker count.
+
+Usage:
+  python scripts/synthetic_data.py --events 4 --years 10                 # -> outputs/synthetic/
+  python scripts/synthetic_data.py --events 200 --years 30 --stations 10 --workers 8
+  python scripts/synthetic_data.py --events 20 --resolution hour --rasters --out /tmp/iasi_big
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from channels import load_registry
+from timebase import DAY_S, RESOLUTIONS, epoch, format_times, load_resolution
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT = ROOT / 'outputs' / 'synthetic'
+BLOCK_ROWS = 1 << 18
+# mainshocks of run_eval_batch.EVENTS (same as bootstrap_minimal_data.create_catalogs)
+MAINSHOCKS = {'Valdivia_1960': ('1960-05-22', 9.5), 'Maule_2010': ('2010-02-27', 8.8),
+              'Illapel_2015': ('2015-09-16', 8.3), 'EC_CO_1906': ('1906-01-31', 8.8)}
+MW_MIN = 4.5
+B_VALUE = 1.0
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# column -> (f(z, a, u), decimals or None for integers): z is the AR(1) state of the series
+# (N(0, 1)), a the anomaly level (0..1, see _anomaly) and u an independent uniform per row
+MODELS = {
+    'a_score': (lambda z, a, u: _sigmoid(-1.5 + 0.8 * z + 3.0 * a), 3),
+    'r_ppm': (lambda z, a, u: 20.0 * np.exp(0.25 * z + 0.8 * a), 2),
+    'r_zscore': (lambda z, a, u: z + 3.2 * a, 4),
+    'm_events_count': (lambda z, a, u: np.floor(-np.log1p(-u) * 2.0 * np.exp(0.5 * z + a)), None),
+    'm_verified_ratio': (lambda z, a, u: _sigmoid(-0.5 + 0.7 * z + 2.0 * a), 3),
+    's_activity_z': (lambda z, a, u: z + 3.0 * a, 4),
+    's_duration_h': (lambda z, a, u: 2.0 * np.exp(0.4 * z + 0.7 * a), 2),
+    'mean_coh': (lambda z, a, u: 0.25 + 0.6 * u, 3),
+    'p95_defo_mm': (lambda z, a, u: 3.0 * np.exp(0.3 * z) + 30.0 * a, 2),
+    'mean_defo_mm': (lambda z, a, u: 0.4 * (3.0 * np.exp(0.3 * z) + 30.0 * a), 2),
+    'area_defo_gt10mm_km2': (lambda z, a, u: 40.0 * np.maximum(0.0, 3.0 * np.exp(0.3 * z) + 30.0 * a - 10.0), 1),
+    'gnss_disp_mm': (lambda z, a, u: 1.5 * np.exp(0.4 * z) + 15.0 * a, 2),
+    'gnss_disp_max_mm': (lambda z, a, u: (1.5 * np.exp(0.4 * z) + 15.0 * a) * (1.2 + 0.6 * u), 2),
+    'gnss_n_stations': (lambda z, a, u: 4.0 + np.floor(8.0 * u), None),
+    'gnss_rate_mm_d': (lambda z, a, u: 0.3 * z + 2.0 * a, 3),
+}
+# numeric columns without a model (new channels in channels.yaml)
+DEFAULT_MODEL = (lambda z, a, u: z + 3.0 * a, 4)
+
+
+def _seq(seed, *key):
+    """SeedSequence of one task: the same draws whatever the worker count or task order."""
+    return np.random.SeedSequence([seed] + [zlib.crc32(str(k).encode()) for k in key])
+
+
+def _slug(name):
+    return name.lower()
+
+
+def rupture_km(mw):
+    """Rupture length (Wells & Coppersmith 1994, all slip types)."""
+    return 10 ** (-2.44 + 0.59 * mw)
+
+
+def make_events(n, years, seed):
+    """Event dicts (run_eval_batch.EVENTS keys plus mainshock, window and rupture size)."""
+    import run_eval_batch as reb
+    span = int(round(years * 365.25))
+    out = []
+    for k in range(n):
+        rng = np.random.default_rng(_seq(seed, 'event', k))
+        base = reb.EVENTS[k] if k < len(reb.EVENTS) else None
+        if base is not None:
+            ev = dict(base)
+        else:
+            lat = float(rng.uniform(-45.0, 2.0))
+            name = f'SYN_{k:04d}'
+            ev = {'name': name, 'lat': round(lat, 3), 'lon': round(float(-72.0 - 0.12 * max(0.0, lat + 18.0)
+                                                                           - rng.uniform(0.0, 1.5)), 3),
+                  'aoi': f'config/aoi_{_slug(name)}.geojson', 'feat': f'data/features/features_{_slug(name)}.csv'}
+        day, mw = MAINSHOCKS.get(ev['name'], (None, None))
+        if day is None:
+            day = str(np.datetime64('1990-01-01') + int(rng.integers(0, 30 * 365)))
+            mw = round(min(9.5, 7.0 + float(rng.exponential(0.45))), 1)
+        t_main = epoch(day) + int(rng.integers(0, DAY_S))
+        start = t_main // DAY_S - int(span * 0.8)
+        ev.update({'mainshock': day, 'mw': mw, 't_main': t_main, 'start_day': start, 'end_day': start + span,
+                   'rupture_km': round(rupture_km(mw), 1), 'acq_s': int(rng.integers(0, DAY_S))})
+        out.append(ev)
+    return out
+
+
+def _ellipse(ev, scale=1.0):
+    """(semi-axis N-S, semi-axis E-W) in degrees of the event's AOI ellipse."""
+    a_km = max(50.0, ev['rupture_km'] / 2) * scale
+    return a_km / 111.32, a_km / 2 / (111.32 * max(0.2, math.cos(math.radians(ev['lat']))))
+
+
+def aoi_geojson(ev, seed):
+    rng = np.random.default_rng(_seq(seed, 'aoi', ev['name']))
+    a, b = _ellipse(ev)
+    th = np.linspace(0, 2 * np.pi, 33)[:-1]
+    r = rng.uniform(0.9, 1.1, len(th))
+    ring = [[round(ev['lon'] + b * ri * math.sin(t), 4), round(ev['lat'] + a * ri * math.cos(t), 4)]
+            for t, ri in zip(th, r)]
+    return {'type': 'FeatureCollection', 'features': [{
+        'type': 'Feature', 'properties': {'name': f"AOI_{ev['name']}"},
+        'geometry': {'type': 'Polygon', 'coordinates': [ring + ring[:1]]}}]}
+
+
+def _anomaly(t, ev, days):
+    """0 -> 1 over the `days` before the mainshock, exponential decay after it."""
+    dt = (np.asarray(t, dtype=np.int64) - ev['t_main']) / DAY_S
+    return np.where(dt <= 0, np.clip(1.0 + dt / days, 0.0, 1.0), np.exp(-np.maximum(dt, 0.0) / days))
+
+
+def _ar1(e, phi, x0):
+    """x[:, j] = phi * x[:, j - 1] + e[:, j] for the (k, m) innovations e, from state x0 (k,),
+    vectorized over blocks of steps (phi ** -block stays far from overflow)."""
+    k, m = e.shape
+    out = np.empty_like(e)
+    block = int(min(256, max(1, 300 * (-1.0 / math.log(phi)) if 0 < phi < 1 else 256)))
+    p = phi ** np.arange(1, block + 1)
+    for j0 in range(0, m, block):
+        n = min(block, m - j0)
+        out[:, j0:j0 + n] = p[:n] * (x0[:, None] + np.cumsum(e[:, j0:j0 + n] / p[:n], axis=1))
+        x0 = out[:, j0 + n - 1]
+    return out
+
+
+def _outages(rng, n, per_day, cfg):
+    """(starts, ends) point ranges of the station outages of a series of n points."""
+    count = rng.poisson(cfg['gaps_per_year'] * n / per_day / 365.25)
+    starts = np.sort(rng.integers(0, max(n, 1), count))
+    ends = np.maximum.accumulate(starts + rng.geometric(1.0 / max(1.0, cfg['gap_days'] * per_day), count))
+    return starts, ends
+
+
+def _kept(pos, starts, ends):
+    if not len(starts):
+        return np.ones(len(pos), dtype=bool)
+    i = np.searchsorted(starts, pos, 'right') - 1
+    return (i < 0) | (pos >= ends[np.maximum(i, 0)])
+
+
+def _ascii(x, decimals):
+    """(n, width) uint8 ASCII of x with fixed decimals (None: integer), right-aligned and
+    left-padded with NUL bytes, which _write drops: -12.5 -> b'\\0\\0-12.50'."""
+    x = np.asarray(x, dtype=np.float64)
+    dec = decimals or 0
+    q = np.rint(np.abs(x) * 10.0 ** dec).astype(np.int64)
+    neg = (x < 0) & (q > 0)
+    nd = len(str(int(q.max() // 10 ** dec))) if len(q) else 1
+    w = 1 + nd + (dec + 1 if dec else 0)
+    out = np.zeros((len(q), w), dtype=np.uint8)
+    col = w - 1
+    for _ in range(dec):
+        out[:, col] = 48 + q % 10
+        q //= 10
+        col -= 1
+    if dec:
+        out[:, col] = 46
+        col -= 1
+    lead = np.full(len(q), col)
+    for k in range(nd):
+        has = (q > 0) | (k == 0)
+        out[has, col] = 48 + q[has] % 10
+        lead[has] = col
+        q //= 10
+        col -= 1
+    out[np.flatnonzero(neg), lead[neg] - 1] = 45
+    return out
+
+
+def _write(f, fields, n):
+    """Append n CSV rows to the binary file f. A field is (values, decimals) for a number
+    column, an array of str for a text column or one str for a constant column. The rows are
+    laid out as one NUL-padded byte matrix and compacted in a single pass, so formatting costs
+    a few numpy operations per column instead of a Python call per value."""
+    if not n:
+        return
+    sep = np.full((n, 1), 44, dtype=np.uint8)
+    parts = []
+    for v in fields:
+        if isinstance(v, tuple):
+            parts.append(_ascii(*v))
+        elif isinstance(v, str):
+            if v:
+                parts.append(np.broadcast_to(np.frombuffer(v.encode(), dtype=np.uint8), (n, len(v.encode()))))
+        else:
+            s = np.asarray(v)
+            s = s if s.dtype.kind == 'S' else s.astype('S')
+            parts.append(s.view(np.uint8).reshape(n, s.dtype.itemsize))
+        parts.append(sep)
+    parts[-1] = np.full((n, 1), 10, dtype=np.uint8)
+    buf = np.hstack(parts).ravel()
+    f.write(buf[buf != 0].tobytes())
+
+
+def _columns(ch, z, a, u, text):
+    """_write fields of the channel columns; text columns get the value `text`."""
+    out = []
+    for c in ch['columns']:
+        if c in MODELS or c in ch['numeric']:
+            fn, dec = MODELS.get(c, DEFAULT_MODEL)
+            out.append((fn(z, a, u), dec))
+        else:
+            out.append(text)
+    return out
+
+
+def _series_task(task):
+    """Rows of k AR(1) series on the calendar points of the windows: the located stations of an
+    event (ev) or the regional series (ev None, anomaly from every event nearby). No header."""
+    path, ch, ev, events, windows, cfg = (task[k] for k in ('path', 'channel', 'event', 'events', 'windows', 'cfg'))
+    rng = np.random.default_rng(_seq(cfg['seed'], 'series', ch['name'], ev['name'] if ev else '-'))
+    unit = RESOLUTIONS[cfg['resolution']]
+    per_day = DAY_S // unit
+    phi = math.exp(-1.0 / (cfg['corr_days'] * per_day))
+    prec = cfg['precursor_days']
+    if ev is not None:
+        k = cfg['stations']
+        a, b = _ellipse(ev, 0.7)
+        r, th = np.sqrt(rng.random(k)), rng.uniform(0, 2 * np.pi, k)
+        lat = ev['lat'] + a * r * np.cos(th)
+        lon = ev['lon'] + b * r * np.sin(th)
+        # byte strings: tiled per row without a str -> bytes conversion
+        sid = np.array([f"{ev['name']}_{ch['name']}{i:02d}" for i in range(k)], dtype='S')
+        loc = np.array([f'{y:.4f},{x:.4f},{s.decode()}' for y, x, s in zip(lat, lon, sid)], dtype='S')
+    else:
+        k = 1
+        tm = np.array([e['t_main'] for e in events])
+    rows = 0
+    with open(path, 'wb') as f:
+        for d0, d1 in windows:
+            n = (d1 - d0) * per_day
+            gaps = [_outages(rng, n, per_day, cfg) for _ in range(k)]
+            x0 = rng.standard_normal(k)
+            m = max(1, BLOCK_ROWS // k)
+            for j0 in range(0, n, m):
+                j1 = min(n, j0 + m)
+                pos = np.arange(j0, j1)
+                t = d0 * DAY_S + pos * unit
+                z = _ar1(rng.standard_normal((k, j1 - j0)) * math.sqrt(1 - phi * phi), phi, x0)
+                x0 = z[:, -1]
+                u = rng.random((k, j1 - j0))
+                if ev is not None:
+                    an = _anomaly(t, ev, prec)
+                else:
+                    # regional series: a third of the strongest anomaly of the events around
+                    an = np.zeros(len(t))
+                    near = np.flatnonzero((tm <= t[-1] + prec * DAY_S) & (tm >= t[0] - 20 * prec * DAY_S))
+                    for i in near:
+                        np.maximum(an, 0.3 * _anomaly(t, events[i], prec), out=an)
+                keep = np.stack([_kept(pos, s, e) for s, e in gaps]).T.ravel()
+                # time-major rows: all stations of a calendar point, then the next point
+                zz, uu = z.T.ravel()[keep], u.T.ravel()[keep]
+                aa = np.repeat(an, k)[keep]
+                dates = np.repeat(format_times(t, cfg['resolution']).astype('S'), k)[keep]
+                if ev is not None:
+                    _write(f, [dates] + _columns(ch, zz, aa, uu, np.tile(sid, j1 - j0)[keep])
+                           + [np.tile(loc, j1 - j0)[keep]], len(zz))
+                else:
+                    _write(f, [dates] + _columns(ch, zz, aa, uu, 'regional') + ['', '', ''], len(zz))
+                rows += len(zz)
+    return rows
+
+
+def scene_times(ev, cfg):
+    """Epoch seconds of the InSAR acquisitions of an event (every revisit days, some lost)."""
+    rng = np.random.default_rng(_seq(cfg['seed'], 'scenes', ev['name']))
+    rev = cfg['revisit']
+    days = np.arange(ev['start_day'] + int(rng.integers(0, rev)), ev['end_day'], rev)
+    days = days[rng.random(len(days)) >= cfg['scene_loss']]
+    return days * DAY_S + ev['acq_s']
+
+
+def _event_task(task):
+    """Per-event channel file with header: acquisitions for the gated (InSAR) channel, else a daily series."""
+    path, ch, ev, cfg = (task[k] for k in ('path', 'channel', 'event', 'cfg'))
+    rng = np.random.default_rng(_seq(cfg['seed'], 'event_channel', ch['name'], ev['name']))
+    if ch['kind'] == 'gated_scale':
+        t = scene_times(ev, cfg)
+        phi = math.exp(-cfg['revisit'] / cfg['corr_days'])
+        labels = format_times(t, cfg['resolution'])
+    else:
+        n = ev['end_day'] - ev['start_day']
+        starts, ends = _outages(rng, n, 1, cfg)
+        pos = np.flatnonzero(_kept(np.arange(n), starts, ends))
+        t = (ev['start_day'] + pos) * DAY_S
+        phi = math.exp(-1.0 / cfg['corr_days'])
+        labels = format_times(t, 'day')
+    z = _ar1(rng.standard_normal((1, len(t))) * math.sqrt(1 - phi * phi), phi, rng.standard_normal(1))[0]
+    fields = _columns(ch, z, _anomaly(t, ev, cfg['precursor_days']), rng.random(len(t)), ev['name'])
+    with open(path, 'wb') as f:
+        f.write((','.join(['date'] + ch['columns']) + '\n').encode('utf-8'))
+        _write(f, [labels] + fields, len(t))
+    return len(t)
+
+
+def _gr(rng, n, m_max):
+    """n Gutenberg-Richter magnitudes >= MW_MIN (b = B_VALUE), truncated at m_max."""
+    beta = B_VALUE * math.log(10)
+    u = rng.random(n)
+    return MW_MIN - np.log1p(-u * (1 - math.exp(-beta * (m_max - MW_MIN)))) / beta
+
+
+def _catalog_task(task):
+    """data/catalogs/<event>.csv: background seismicity, the mainshock and its aftershocks."""
+    path, ev, cfg = (task[k] for k in ('path', 'event', 'cfg'))
+    rng = np.random.default_rng(_seq(cfg['seed'], 'catalog', ev['name']))
+    t0, t1 = ev['start_day'] * DAY_S, ev['end_day'] * DAY_S
+    n_bg = rng.poisson(cfg['background_per_year'] * (t1 - t0) / DAY_S / 365.25)
+    t_bg = rng.integers(t0, t1, n_bg)
+    m_bg = _gr(rng, n_bg, 8.0)
+    # aftershocks: GR count with the largest one at mw - 1.2; Omori-Utsu times (p = 1.1, c = 0.05 d)
+    n_as = min(cfg['max_aftershocks'], int(10 ** (B_VALUE * (ev['mw'] - 1.2 - MW_MIN))))
+    p, c, span = 1.1, 0.05, min(cfg['aftershock_days'], (t1 - ev['t_main']) / DAY_S)
+    q = 1.0 - p
+    u = rng.random(n_as)
+    dt = (c ** q + u * ((span + c) ** q - c ** q)) ** (1.0 / q) - c
+    t_as = ev['t_main'] + (dt * DAY_S).astype(np.int64)
+    m_as = _gr(rng, n_as, ev['mw'] - 0.3)
+    half = ev['rupture_km'] / 2 / 111.32
+    lat = np.concatenate([ev['lat'] + rng.uniform(-1.5, 1.5, n_bg), [ev['lat']],
+                          ev['lat'] + rng.normal(0, half / 2, n_as)])
+    lon = np.concatenate([ev['lon'] + rng.uniform(-1.5, 1.5, n_bg), [ev['lon']],
+                          ev['lon'] + rng.normal(0, half / 6, n_as)])
+    t = np.concatenate([t_bg, [ev['t_main']], t_as])
+    mw = np.concatenate([m_bg, [ev['mw']], m_as])
+    depth = np.concatenate([rng.uniform(10, 70, n_bg), [rng.uniform(15, 35)], rng.uniform(5, 50, n_as)])
+    order = np.argsort(t, kind='stable')
+    if cfg['resolution'] == 'day':
+        dates = format_times(t[order], 'day')
+    else:
+        dates = np.char.add(t[order].astype('datetime64[s]').astype(str), 'Z')
+    with open(path, 'wb') as f:
+        f.write(b'date,mw,lat,lon,depth\n')
+        _write(f, [dates, (mw[order], 1), (lat[order], 3), (lon[order], 3), (depth[order], 1)], len(t))
+    return len(t)
+
+
+def _smooth(rng, h, w, cells=8):
+    """Smooth random field (h, w): coarse normals upsampled with bilinear interpolation."""
+    g = rng.standard_normal((cells + 1, cells + 1))
+    y, x = np.linspace(0, cells, h), np.linspace(0, cells, w)
+    y0, x0 = np.minimum(y.astype(int), cells - 1), np.minimum(x.astype(int), cells - 1)
+    fy, fx = (y - y0)[:, None], (x - x0)[None, :]
+    return ((g[y0][:, x0] * (1 - fx) + g[y0][:, x0 + 1] * fx) * (1 - fy)
+            + (g[y0 + 1][:, x0] * (1 - fx) + g[y0 + 1][:, x0 + 1] * fx) * fy)
+
+
+def _raster_task(task):
+    """data/rasters/<event>/: defo / coh (T, H, W) float32 stacks on the D acquisition dates."""
+    out, ev, cfg = Path(task['path']), task['event'], task['cfg']
+    rng = np.random.default_rng(_seq(cfg['seed'], 'raster', ev['name']))
+    out.mkdir(parents=True, exist_ok=True)
+    a, b = _ellipse(ev, 1.3)
+    w = cfg['raster_px']
+    h = max(8, int(round(w * a / b)))
+    grid = {'lon0': ev['lon'] - b, 'lat0': ev['lat'] + a, 'dlon': 2 * b / w, 'dlat': 2 * a / h, 'width': w, 'height': h}
+    (out / 'grid.json').write_text(json.dumps(grid), encoding='utf-8')
+    t = scene_times(ev, cfg)
+    (out / 'dates.txt').write_text(''.join(f'{d}\n' for d in format_times(t, 'day')), encoding='utf-8')
+    # deformation bump on the rupture (sigma ~ a quarter of its length) scaled by the anomaly
+    yy = np.linspace(1.3, -1.3, h)[:, None]
+    xx = np.linspace(-1.3, 1.3, w)[None, :]
+    bump = np.exp(-(yy ** 2 + (2 * xx) ** 2) / 0.5).astype(np.float32)
+    an = _anomaly(t, ev, cfg['precursor_days'])
+    defo = np.lib.format.open_memmap(out / 'defo.npy', 'w+', np.float32, (len(t), h, w))
+    coh = np.lib.format.open_memmap(out / 'coh.npy', 'w+', np.float32, (len(t), h, w))
+    for i in range(len(t)):
+        defo[i] = np.abs(bump * (30.0 * an[i] + 2.0) + 1.5 * _smooth(rng, h, w))
+        coh[i] = np.clip(0.55 + 0.2 * _smooth(rng, h, w) - 0.25 * rng.random(), 0.0, 1.0)
+    defo.flush()
+    coh.flush()
+    del defo, coh
+    return len(t)
+
+
+TASKS = {'series': _series_task, 'event': _event_task, 'catalog': _catalog_task, 'raster': _raster_task}
+
+
+def _run(task):
+    return TASKS[task['kind']](task)
+
+
+def _windows(events):
+    """Union of the event windows as sorted (start_day, end_day) intervals."""
+    out = []
+    for s, e in sorted((ev['start_day'], ev['end_day']) for ev in events):
+        if out and s <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return [tuple(w) for w in out]
+
+
+def _channel(ch):
+    return {'name': ch.name, 'columns': ch.columns, 'numeric': ch.numeric, 'kind': ch.kind}
+
+
+def generate(out, n_events, years, cfg, workers=None):
+    """Write the synthetic tree under out; returns (rows, files, bytes)."""
+    out = Path(out)
+    reg = load_registry()
+    events = make_events(n_events, years, cfg['seed'])
+    rel = lambda p: out / Path(p).relative_to(ROOT)
+    tasks, parts = [], {}
+    for ch in reg.signals():
+        final = rel(ch.path())
+        final.parent.mkdir(parents=True, exist_ok=True)
+        header = ','.join(['date'] + ch.columns + ['lat', 'lon', 'station_id'])
+        names = ['regional'] + [ev['name'] for ev in events]
+        parts[final] = (header, [final.with_name(f'{final.name}.part-{i:05d}') for i in range(len(names))])
+        for i, p in enumerate(parts[final][1]):
+            ev = events[i - 1] if i else None
+            # only the regional series needs every event (its anomaly); the stations need their own
+            tasks.append({'kind': 'series', 'path': p, 'channel': _channel(ch), 'cfg': cfg, 'event': ev,
+                          'events': None if ev else events,
+                          'windows': [(ev['start_day'], ev['end_day'])] if ev else _windows(events)})
+    for ev in events:
+        for ch in reg.event_channels():
+            p = rel(ch.path(ev))
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tasks.append({'kind': 'event', 'path': p, 'channel': _channel(ch), 'event': ev, 'cfg': cfg})
+        p = out / 'data' / 'catalogs' / f"{ev['name']}.csv"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tasks.append({'kind': 'catalog', 'path': p, 'event': ev, 'cfg': cfg})
+        if cfg['rasters']:
+            tasks.append({'kind': 'raster', 'path': out / 'data' / 'rasters' / ev['name'], 'event': ev, 'cfg': cfg})
+        aoi = out / ev['aoi']
+        aoi.parent.mkdir(parents=True, exist_ok=True)
+        aoi.write_text(json.dumps(aoi_geojson(ev, cfg['seed']), indent=2), encoding='utf-8')
+    (out / 'events.json').write_text(json.dumps(events, indent=2, ensure_ascii=False), encoding='utf-8')
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = list(pool.map(_run, tasks))
+    else:
+        counts = [_run(t) for t in tasks]
+    rows = sum(c for t, c in zip(tasks, counts) if t['kind'] != 'raster')
+    for final, (header, ps) in parts.items():
+        with open(final, 'wb') as f:
+            f.write((header + '\n').encode('utf-8'))
+            for p in ps:
+                with open(p, 'rb') as src:
+                    shutil.copyfileobj(src, f, 1 << 24)
+                p.unlink()
+    files = [p for p in out.rglob('*') if p.is_file()]
+    return rows, len(files), sum(p.stat().st_size for p in files)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Generador de datos sintéticos reproducibles para todos los canales')
+    ap.add_argument('--out', default=str(OUT))
+    ap.add_argument('--events', type=int, default=4)
+    ap.add_argument('--years', type=float, default=10.0)
+    ap.add_argument('--stations', type=int, default=5, help='Estaciones geolocalizadas por evento y señal')
+    ap.add_argument('--resolution', choices=tuple(RESOLUTIONS), default=None,
+                    help='Resolución de las señales (por defecto la de config/join.yaml)')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--workers', type=int, default=None)
+    ap.add_argument('--corr-days', type=float, default=10.0, help='Tiempo de autocorrelación AR(1)')
+    ap.add_argument('--precursor-days', type=float, default=30.0)
+    ap.add_argument('--gaps-per-year', type=float, default=2.0)
+    ap.add_argument('--gap-days', type=float, default=5.0, help='Duración media de un corte de estación')
+    ap.add_argument('--revisit', type=int, default=12, help='Días entre adquisiciones InSAR')
+    ap.add_argument('--scene-loss', type=float, default=0.1)
+    ap.add_argument('--background-per-year', type=float, default=30.0, help=f'Sismos de fondo Mw >= {MW_MIN} por año')
+    ap.add_argument('--aftershock-days', type=float, default=365.0)
+    ap.add_argument('--max-aftershocks', type=int, default=20000)
+    ap.add_argument('--rasters', action='store_true', help='Escribe también rásters de deformación por evento')
+    ap.add_argument('--raster-px', type=int, default=128)
+    args = ap.parse_args()
+    cfg = {'seed': args.seed, 'resolution': args.resolution or load_resolution(), 'stations': args.stations,
+           'corr_days': args.corr_days, 'precursor_days': args.precursor_days, 'gaps_per_year': args.gaps_per_year,
+           'gap_days': args.gap_days, 'revisit': args.revisit, 'scene_loss': args.scene_loss,
+           'background_per_year': args.background_per_year, 'aftershock_days': args.aftershock_days,
+           'max_aftershocks': args.max_aftershocks, 'rasters': args.rasters, 'raster_px': args.raster_px}
+    t0 = time.perf_counter()
+    rows, files, size = generate(args.out, args.events, args.years, cfg, args.workers)
+    dt = time.perf_counter() - t0
+    print(f'{rows:,} filas en {files} archivos ({size / 2 ** 20:.0f} MB) en {dt:.1f}s '
+          f'({rows / dt / 1e6:.2f} M filas/s); eventos en {Path(args.out) / "events.json"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+telemetry.py
+Low-overhead stage instrumentation shared by the upload server and the CLI scripts.
+
+    from telemetry import TELEMETRY, stage
+    with stage('join') as st:
+        union = join_by_date(...)
+        st.rows = len(union)
+
+Each stage records a latency histogram plus rows / bytes read / bytes written
+counters. The server exposes them in Prometheus text format on /metrics; CLI
+scripts call write_run_summary() to leave a JSON timing summary of the run in
+outputs/timings/<script>.json, which the server folds into its own registry
+after running the script in the background. When the server runs a script for
+an upload job it sets IASI_JOB_ID, which is copied into the summary so the
+server can attribute the stage timings to that job.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+OUT_TIMINGS = ROOT / 'outputs' / 'timings'
+
+# seconds; covers sub-ms header checks up to multi-minute pipeline runs
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+STAGES = ('upload_receive', 'header_check', 'ingest_parse', 'join', 'score', 'metrics', 'export', 'publish')
+
+
+class _StageStats:
+    __slots__ = ('counts', 'sum', 'count', 'rows', 'bytes_read', 'bytes_written', 'errors')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.errors = 0
+
+
+class _StageTimer:
+    __slots__ = ('registry', 'name', 'rows', 'bytes_read', 'bytes_written', 't0', 'elapsed')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.t0
+        self.registry.observe(self.name, self.elapsed, self.rows, self.bytes_read, self.bytes_written,
+                              error=exc_type is not None)
+        return False
+
+
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._gauges = {}
+        self.started = time.time()
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def observe(self, name, seconds, rows=0, bytes_read=0, bytes_written=0, error=False):
+        i = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            st = self._stages.get(name)
+            if st is None:
+                st = self._stages[name] = _StageStats()
+            st.counts[i] += 1
+            st.sum += seconds
+            st.count += 1
+            st.rows += rows
+            st.bytes_read += bytes_read
+            st.bytes_written += bytes_written
+            if error:
+                st.errors += 1
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def add_gauge(self, name, delta):
+        with self._lock:
+            self._gauges[name] = self._gauges.get(name, 0) + delta
+
+    def summary(self):
+        """JSON-friendly totals per stage (used for the per-run CLI summary)."""
+        with self._lock:
+            return {
+                name: {'count': st.count, 'seconds': round(st.sum, 6), 'rows': st.rows,
+                       'bytes_read': st.bytes_read, 'bytes_written': st.bytes_written, 'errors': st.errors}
+                for name, st in self._stages.items()
+            }
+
+    def merge_summary(self, summary):
+        """Fold a per-run summary (from a subprocess) into this registry, one observation per stage."""
+        for name, s in (summary or {}).get('stages', {}).items():
+            self.observe(name, float(s.get('seconds', 0.0)), int(s.get('rows', 0)),
+                         int(s.get('bytes_read', 0)), int(s.get('bytes_written', 0)), error=bool(s.get('errors')))
+
+    def render_prometheus(self):
+        out = []
+        with self._lock:
+            stages = {k: (list(v.counts), v.sum, v.count, v.rows, v.bytes_read, v.bytes_written, v.errors)
+                      for k, v in self._stages.items()}
+            gauges = dict(self._gauges)
+        out.append('# HELP iasi_stage_seconds Latency of pipeline stages in seconds.')
+        out.append('# TYPE iasi_stage_seconds histogram')
+        for name in sorted(stages):
+            counts, total, n = stages[name][:3]
+            acc = 0
+            for b, c in zip(BUCKETS, counts):
+                acc += c
+                out.append(f'iasi_stage_seconds_bucket{{stage="{name}",le="{b}"}} {acc}')
+            out.append(f'iasi_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {n}')
+            out.append(f'iasi_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            out.append(f'iasi_stage_seconds_count{{stage="{name}"}} {n}')
+        for metric, idx, help_ in (('iasi_stage_rows_total', 3, 'Rows processed per stage.'),
+                                   ('iasi_stage_bytes_read_total', 4, 'Bytes read per stage.'),
+                                   ('iasi_stage_bytes_written_total', 5, 'Bytes written per stage.'),
+                                   ('iasi_stage_errors_total', 6, 'Stage executions that raised.')):
+            out.append(f'# HELP {metric} {help_}')
+            out.append(f'# TYPE {metric} counter')
+            for name in sorted(stages):
+                out.append(f'{metric}{{stage="{name}"}} {stages[name][idx]}')
+        for g in sorted(gauges):
+            out.append(f'# TYPE {g} gauge')
+            out.append(f'{g} {gauges[g]}')
+        out.append('# TYPE iasi_process_start_time_seconds gauge')
+        out.append(f'iasi_process_start_time_seconds {self.started:.3f}')
+        return '\n'.join(out) + '\n'
+
+
+TELEMETRY = Telemetry()
+
+
+def stage(name):
+    return TELEMETRY.stage(name)
+
+
+def summary_path(script):
+    return OUT_TIMINGS / f'{script}.json'
+
+
+def write_run_summary(script, extra=None):
+    """Write outputs/timings/<script>.json with this process' stage totals; returns the dict."""
+    data = {
+        'script': script,
+        'pid': os.getpid(),
+        'job_id': os.environ.get('IASI_JOB_ID'),
+        'started': TELEMETRY.started,
+        'finished': time.time(),
+        'wall_seconds': round(time.time() - TELEMETRY.started, 6),
+        'stages': TELEMETRY.summary(),
+    }
+    if extra:
+        data.update(extra)
+    try:
+        OUT_TIMINGS.mkdir(parents=True, exist_ok=True)
+        summary_path(script).write_text(json.dumps(data, indent=2), encoding='utf-8')
+    except Exception:
+        pass
+    return data
+
+
+def read_run_summary(script, since=None, job_id=None):
+    """Summary written by a script run that finished after `since` (epoch s) and,
+    if given, belongs to job_id; else None."""
+    p = summary_path(script)
+    try:
+        data = json.loads(p.read_text(encoding='utf-8'))
+    except Exception:
+        return None
+    if since is not None and data.get('finished', 0) < since:
+        return None
+    if job_id is not None and data.get('job_id') != job_id:
+        return None
+    return data
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+timebase.py
+Time axis of the pipeline: int64 epoch seconds (UTC) at a configurable
+resolution (config/join.yaml resolution: day | hour).
+
+Inputs may carry plain dates (YYYY-MM-DD) or ISO timestamps
+(YYYY-MM-DDTHH[:MM[:SS[.fff]]], 'T' or space, optional Z or +HH:MM offset, which
+is converted to UTC). Parsing is vectorized through numpy datetime64[s]; only
+inputs with an explicit offset (numpy warns on those) take the per-value
+datetime.fromisoformat path. to_epoch() raises ValueError on empty or unparseable
+values; readers of CSV tables use valid_epoch(), which returns a validity mask so
+one bad row can be skipped instead of aborting the run (numpy would otherwise
+turn '' into NaT, i.e. int64 min, a sentinel that looks like a real time).
+Calendar points are labelled with format_times(): YYYY-MM-DD at day resolution,
+so daily CSV / JSON outputs keep their historical format, and YYYY-MM-DDTHH:MM
+at hour resolution.
+
+Usage:
+  python scripts/timebase.py 2010-02-27T06:34:14Z "2010-02-27 03:34-03:00" 2010-02-27
+"""
+import re
+import sys
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_PATH = ROOT / 'config' / 'join.yaml'
+# seconds per calendar unit
+RESOLUTIONS = {'day': 86400, 'hour': 3600}
+DAY_S = RESOLUTIONS['day']
+# numpy NaT as int64 (empty / 'NaT' input); never returned by to_epoch()
+NAT = np.iinfo(np.int64).min
+# values per batch when valid_epoch() has to locate the bad ones
+_BATCH = 4096
+_OFFSET = re.compile(r'(Z|[+-]\d\d:?\d\d)$')
+
+
+def load_resolution(path=CFG_PATH):
+    """Calendar resolution of config/join.yaml ('day' when missing)."""
+    p = Path(path)
+    cfg = (yaml.safe_load(p.read_text(encoding='utf-8')) or {}) if p.exists() else {}
+    res = str(cfg.get('resolution', 'day'))
+    if res not in RESOLUTIONS:
+        raise ValueError(f'join.yaml: resolution debe ser una de {tuple(RESOLUTIONS)}, no {res!r}')
+    return res
+
+
+def _utc(s):
+    """Naive UTC ISO string for a timestamp with a Z / ±HH:MM suffix."""
+    d = datetime.fromisoformat(s[:-1] + '+00:00' if s.endswith('Z') else s)
+    return d.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _parse(vals):
+    """int64 epoch seconds, NAT for empty / 'NaT' values; ValueError on unparseable values."""
+    if not vals:
+        return np.empty(0, dtype=np.int64)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            return np.array(vals, dtype='datetime64[s]').astype(np.int64)
+    except Warning:
+        # numpy has no time zones: convert Z / ±HH:MM timestamps to naive UTC first
+        vals = [str(v).strip() for v in vals]
+        vals = [_utc(v) if len(v) > 10 and _OFFSET.search(v) else v for v in vals]
+        return np.array(vals, dtype='datetime64[s]').astype(np.int64)
+
+
+def to_epoch(values):
+    """int64 epoch seconds of date / ISO timestamp strings (ValueError on empty or unparseable values)."""
+    vals = list(values)
+    t = _parse(vals)
+    bad = np.flatnonzero(t == NAT)
+    if len(bad):
+        raise ValueError(f'fecha vacía o inválida: {vals[bad[0]]!r} ({len(bad)} valores)')
+    return t
+
+
+def _parse_each(vals):
+    try:
+        return _parse(vals)
+    except (ValueError, TypeError):
+        if len(vals) == 1:
+            return np.array([NAT], dtype=np.int64)
+        # only the batches holding a bad value are parsed one by one
+        step = max(1, len(vals) // 16) if len(vals) <= _BATCH else _BATCH
+        return np.concatenate([_parse_each(vals[i:i + step]) for i in range(0, len(vals), step)])
+
+
+def valid_epoch(values):
+    """(t, ok): to_epoch() that never raises; ok is False for empty / unparseable values, whose t is 0."""
+    t = _parse_each(list(values))
+    ok = t != NAT
+    return np.where(ok, t, 0), ok
+
+
+def epoch(value):
+    """to_epoch() of one value, as int."""
+    return int(to_epoch([value])[0])
+
+
+def parse_time(value, resolution=None):
+    """Naive UTC datetime of a date or ISO timestamp string (truncated to its calendar unit if resolution)."""
+    t = epoch(value)
+    if resolution:
+        t = int(floor(t, resolution))
+    return datetime.fromtimestamp(t, tz=timezone.utc).replace(tzinfo=None)
+
+
+def parse_times(values):
+    """parse_time() of many values at once (vectorized parse)."""
+    return to_epoch(values).astype('datetime64[s]').astype(object).tolist()
+
+
+def floor(t, resolution='day'):
+    """Epoch seconds truncated to the start of their calendar unit."""
+    step = RESOLUTIONS[resolution]
+    return np.asarray(t, dtype=np.int64) // step * step
+
+
+def format_times(t, resolution='day'):
+    """Labels of epoch seconds: YYYY-MM-DD (day) or YYYY-MM-DDTHH:MM (hour)."""
+    unit = 'D' if resolution == 'day' else 'm'
+    return np.asarray(t, dtype=np.int64).astype('datetime64[s]').astype(f'datetime64[{unit}]').astype(str)
+
+
+def label(value, resolution='day'):
+    """Calendar unit label of one date / timestamp string."""
+    s = str(value).strip()
+    # without a UTC offset the label is a prefix of the string: skip the numpy parse (streaming path)
+    if len(s) == 10 or (len(s) >= 13 and s[10] in 'T ' and not _OFFSET.search(s)):
+        if resolution == 'day':
+            return s[:10]
+        return s[:10] + 'T' + (s[11:13] if len(s) > 10 else '00') + ':00'
+    return str(format_times([floor(epoch(s), resolution)], resolution)[0])
+
+
+def main():
+    res = load_resolution()
+    for v in sys.argv[1:]:
+        t = epoch(v)
+        print(f'{v!r}: {t} s -> {label(v, res)} ({res})')
+
+
+if __name__ == '__main__':
+    main()
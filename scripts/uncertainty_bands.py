@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+uncertainty_bands.py
+Monte Carlo uncertainty bands for the IASi timelines of run_eval_batch.py.
+
+Every raw transform input of the channel registry (config/channels.yaml: a_score,
+r_zscore, mean_coh, p95_defo_mm, ...) is perturbed with Gaussian noise of
+standard deviation taken from the data itself (<column>_sd, when an ingest
+provides it) or from config/uncertainty.yaml. Each day gets `samples` draws,
+held as (samples, days) arrays and pushed through the same scoring kernel as
+the timelines, including the coherence gate of D' and the staleness weights of
+the join, so a day near coh = 0.3 shows up as a wide band. With zero noise the
+draws reproduce the timeline IASi exactly.
+
+The output per day is the IASi quantiles (QUANTILES) and the probability of
+each estado under the thresholds of thresholds.yaml. The day axis is processed
+in blocks sized from mem_mb and the samples in chunks of RNG_SAMPLES (only the
+IASi of a block holds every sample, for the quantiles), so memory stays fixed
+whatever the timeline length and sample count. The noise of day t and sample i
+always comes from the same child of SeedSequence(seed) (one child per RNG_DAYS
+days x RNG_SAMPLES samples), so the bands do not depend on the block size.
+With a learned model (learned_scoring.py), the perturbed components of a block
+are scored in one predict_proba call.
+
+Usage:
+  python scripts/run_eval_batch.py --mc-samples 500          # writes <event>_bands.csv
+  python scripts/uncertainty_bands.py bench --days 7300 --samples 1000
+"""
+import argparse
+import csv
+import logging
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+CFG_PATH = ROOT / 'config' / 'uncertainty.yaml'
+OUT_TIMELINES = ROOT / 'outputs' / 'timelines'
+DEFAULT_SD = {'a_score': 0.05, 'r_zscore': 0.3, 'mean_coh': 0.05, 'p95_defo_mm': 2.0,
+              'gnss_disp_mm': 2.0, 'm_verified_ratio': 0.05, 's_activity_z': 0.3}
+QUANTILES = (0.05, 0.5, 0.95)
+STATES = ('Observación', 'Precaución', 'Alerta')
+RNG_DAYS = 64
+RNG_SAMPLES = 1024
+
+log = logging.getLogger(__name__)
+
+
+def load_noise(path=CFG_PATH):
+    """{column: default standard deviation}; config/uncertainty.yaml overrides DEFAULT_SD."""
+    sd = dict(DEFAULT_SD)
+    p = Path(path)
+    if p.exists():
+        sd.update({k: float(v) for k, v in (yaml.safe_load(p.read_text(encoding='utf-8')) or {}).items()})
+    return sd
+
+
+def join_inputs(join, noise=None):
+    """(inputs, values, sds, weights) for a run_eval_batch.join_tables join: inputs are the
+    (channel, column) transform inputs of the registry, values / sds (len(inputs), days) arrays
+    (NaN value where the channel has no observation), weights {channel: staleness weight}."""
+    import run_eval_batch as reb
+    noise = noise or load_noise()
+    inputs = reb.REGISTRY.inputs()
+    n = len(join)
+    vals = np.full((len(inputs), n), np.nan)
+    sds = np.zeros((len(inputs), n))
+    for k, (ch, col) in enumerate(inputs):
+        if ch not in join.slots:
+            continue
+        vals[k] = join.column(ch, col)
+        sd = join.column(ch, f'{col}_sd')
+        sds[k] = np.where(np.isnan(sd), noise.get(col, 0.0), sd)
+    return inputs, vals, sds, dict(zip(join.slots, join.weight))
+
+
+def _noise(seed, d0, d1, j, samples, k):
+    """Standard normals (k, chunk, d1 - d0) for days [d0, d1) and sample chunk j (samples
+    [j * RNG_SAMPLES, (j + 1) * RNG_SAMPLES) of samples), fixed per RNG_DAYS x RNG_SAMPLES granule:
+    granule (g, 0) is the g-th child of SeedSequence(seed), (g, j) that child's j-th child."""
+    g0, g1 = d0 // RNG_DAYS, -(-d1 // RNG_DAYS)
+    m = min(RNG_SAMPLES, samples - j * RNG_SAMPLES)
+    z = [np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(g, j) if j else (g,)))
+         .standard_normal((k, m, RNG_DAYS)) for g in range(g0, g1)]
+    z = z[0] if len(z) == 1 else np.concatenate(z, axis=2)
+    off = d0 - g0 * RNG_DAYS
+    return z[:, :, off:off + d1 - d0]
+
+
+def bands(inputs, vals, sds, wts=None, samples=500, seed=0, mem_mb=64, model=None, quantiles=QUANTILES):
+    """{'q': (len(quantiles), days), 'p': (len(STATES), days)} for the arrays of join_inputs()."""
+    import run_eval_batch as reb
+    n = vals.shape[1]
+    k = len(inputs)
+    c = len(reb.COMPONENTS)
+    chunk = min(samples, RNG_SAMPLES)
+    # float64 per (sample of a chunk, day): k normals (plus their per-granule copy), k inputs,
+    # the components, the IASi and the temporaries of the transforms; per (sample, day): the
+    # IASi of the block and the quantile workspace; plus the granules straddling the block ends
+    per_day = (chunk * (3 * k + c + 11) + 3 * samples) * 8
+    block = int((mem_mb * 2 ** 20 - 2 * k * chunk * RNG_DAYS * 8) // per_day)
+    if block < 1:
+        log.warning('%d muestras no caben en %s MB (mínimo ≈ %.0f MB); se procesa un día por bloque',
+                    samples, mem_mb, (2 * k * chunk * RNG_DAYS * 8 + per_day) / 2 ** 20)
+        block = 1
+    elif block >= RNG_DAYS:
+        block = block // RNG_DAYS * RNG_DAYS
+    q = np.zeros((len(quantiles), n))
+    p = np.zeros((len(STATES), n))
+    for d0 in range(0, n, block):
+        d1 = min(n, d0 + block)
+        w = None if wts is None else {ch: v[d0:d1] for ch, v in wts.items()}
+        iasi = np.empty((samples, d1 - d0))
+        for j, s0 in enumerate(range(0, samples, chunk)):
+            x = vals[:, None, d0:d1] + sds[:, None, d0:d1] * _noise(seed, d0, d1, j, samples, k)
+            comps, part = reb.KERNEL(dict(zip(inputs, x)), w)
+            if model is not None:
+                from learned_scoring import predict
+                part = predict(model, comps.reshape(c, -1).T).reshape(-1, d1 - d0)
+            iasi[s0:s0 + len(part)] = part
+        q[:, d0:d1] = np.quantile(iasi, quantiles, axis=0)
+        obs = (iasi < reb.TH['observation']).mean(axis=0)
+        alert = (iasi > reb.TH['caution_max']).mean(axis=0)
+        p[:, d0:d1] = obs, 1.0 - obs - alert, alert
+    return {'q': q, 'p': p}
+
+
+def band_columns(quantiles=QUANTILES):
+    return [f'IASi_q{round(qq * 100):02d}' for qq in quantiles] + [f'p_{s}' for s in STATES]
+
+
+def export_bands(event, join, samples=500, seed=0, mem_mb=64, model=None):
+    """outputs/timelines/<event>_bands.csv: IASi quantiles and estado probabilities per day of join."""
+    b = bands(*join_inputs(join), samples, seed, mem_mb, model)
+    out = OUT_TIMELINES / f"{event['name']}_bands.csv"
+    with out.open('w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['date'] + band_columns())
+        for t, d in enumerate(join.dates()):
+            w.writerow([d] + [f'{v:.4f}' for v in b['q'][:, t]] + [f'{v:.4f}' for v in b['p'][:, t]])
+    return out
+
+
+def cmd_bench(args):
+    import run_eval_batch as reb
+    rng = np.random.default_rng(0)
+    n = args.days
+    inputs = reb.REGISTRY.inputs()
+    # inputs around each transform's active range (gates straddling their threshold), some days missing
+    scale = np.array([reb.REGISTRY.by_name[ch].scale for ch, _ in inputs])[:, None]
+    vals = rng.gamma(2.0, 0.5, (len(inputs), n)) * scale
+    vals[rng.random(vals.shape) < 0.1] = np.nan
+    sds = np.array([DEFAULT_SD.get(col, 0.05) for _, col in inputs])[:, None] * np.ones(n)
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    bands(inputs, vals, sds, samples=args.samples, mem_mb=args.mem_mb)
+    dt = time.perf_counter() - t0
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{args.samples} muestras x {n} días en {dt:.2f}s ({args.samples * n / dt / 1e6:.1f} M muestras-día/s); '
+          f'pico RSS +{(rss1 - rss0) / 1024:.0f} MB, presupuesto {args.mem_mb} MB')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Bandas de incertidumbre Monte Carlo del IASi')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    be = sub.add_parser('bench')
+    be.add_argument('--days', type=int, default=7300)
+    be.add_argument('--samples', type=int, default=1000)
+    be.add_argument('--mem-mb', type=float, default=64)
+    args = ap.parse_args()
+    cmd_bench(args)
+
+
+if __name__ == '__main__':
+    main()
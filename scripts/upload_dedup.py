@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+upload_dedup.py
+Per-event index (SQLite) of the content hashes of satellite uploads that were
+already ingested. /upload_sat (and the chunked finalize call) hash the file while
+it is received and claim (event, sha256) before queueing it; an identical retry
+from a field station is then acknowledged as a duplicate without running ingest
+or the pipeline. Claims whose ingest fails are released so the file can be resent.
+
+watcher_ingest.py uses the same index for files dropped directly in the inbox.
+It shares the inbox with the server, so it leaves alone the files the server
+saved there (inbox_name(), is_server_upload()): their job claims, ingests and
+moves them itself.
+
+Usage:
+  python scripts/upload_dedup.py list [--event Maule_2010]
+  python scripts/upload_dedup.py forget <event> [sha256]
+"""
+import argparse
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = ROOT / 'outputs' / 'dedup.sqlite'
+# <event>_<unix time>_<job_id[:8]>, as written by inbox_name()
+INBOX_STEM = re.compile(r'^(?P<event>.+)_\d+_[0-9a-f]{8}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    event TEXT,
+    sha256 TEXT,
+    job_id TEXT,
+    path TEXT,
+    size INTEGER,
+    first_seen REAL,
+    last_seen REAL,
+    hits INTEGER DEFAULT 0,
+    PRIMARY KEY (event, sha256)
+);
+"""
+
+
+def stream_to_file(src, dest, bufsize=1024 * 1024):
+    """Copy a readable stream into dest, hashing it on the way; returns (sha256, size)."""
+    h = hashlib.sha256()
+    size = 0
+    with open(dest, 'wb') as out:
+        for buf in iter(lambda: src.read(bufsize), b''):
+            h.update(buf)
+            size += len(buf)
+            out.write(buf)
+    return h.hexdigest(), size
+
+
+def inbox_name(event, job_id):
+    """Inbox file name of an upload: <event>_<unix time>_<job_id[:8]>.csv."""
+    return f"{event}_{int(time.time())}_{job_id[:8]}.csv"
+
+
+def is_server_upload(path):
+    """True for inbox files named by inbox_name() (owned by an upload job, not by the watcher)."""
+    return INBOX_STEM.match(Path(path).stem) is not None
+
+
+def file_sha256(path, bufsize=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for buf in iter(lambda: f.read(bufsize), b''):
+            h.update(buf)
+    return h.hexdigest()
+
+
+class DedupIndex:
+    def __init__(self, path=DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        con = sqlite3.connect(str(self.path), timeout=10)
+        con.row_factory = sqlite3.Row
+        con.execute('PRAGMA journal_mode=WAL')
+        return con
+
+    def claim(self, event, sha256, job_id=None, path=None, size=None):
+        """Register (event, sha256) for job_id. Returns None if the content is new,
+        else the existing entry (dict) after bumping its hit counter."""
+        now = time.time()
+        with self._lock, self._connect() as con:
+            r = con.execute('SELECT * FROM uploads WHERE event=? AND sha256=?', (event, sha256)).fetchone()
+            if r is not None:
+                con.execute('UPDATE uploads SET hits=hits+1, last_seen=? WHERE event=? AND sha256=?',
+                            (now, event, sha256))
+                return dict(r, hits=r['hits'] + 1, last_seen=now)
+            con.execute('INSERT INTO uploads (event, sha256, job_id, path, size, first_seen, last_seen, hits) '
+                        'VALUES (?,?,?,?,?,?,?,0)', (event, sha256, job_id, str(path) if path else None, size, now, now))
+        return None
+
+    def get(self, event, sha256):
+        with self._connect() as con:
+            r = con.execute('SELECT * FROM uploads WHERE event=? AND sha256=?', (event, sha256)).fetchone()
+        return dict(r) if r else None
+
+    def release(self, event, sha256=None, job_id=None):
+        """Drop a claim (ingest failed) or, without sha256, every entry of event.
+        If job_id is given only that job's claim is removed."""
+        sql, args = 'DELETE FROM uploads WHERE event=?', [event]
+        if sha256:
+            sql += ' AND sha256=?'
+            args.append(sha256)
+        if job_id:
+            sql += ' AND job_id=?'
+            args.append(job_id)
+        with self._lock, self._connect() as con:
+            return con.execute(sql, args).rowcount
+
+    def list(self, event=None, limit=100):
+        sql, args = 'SELECT * FROM uploads', []
+        if event:
+            sql += ' WHERE event=?'
+            args.append(event)
+        sql += ' ORDER BY first_seen DESC LIMIT ?'
+        args.append(int(limit))
+        with self._connect() as con:
+            return [dict(r) for r in con.execute(sql, args)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Índice de contenido de cargas satelitales ya ingeridas')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    ls = sub.add_parser('list')
+    ls.add_argument('--event')
+    ls.add_argument('--limit', type=int, default=50)
+    fg = sub.add_parser('forget', help='Permite re-ingerir un contenido (o todo un evento)')
+    fg.add_argument('event')
+    fg.add_argument('sha256', nargs='?')
+    args = ap.parse_args()
+    idx = DedupIndex()
+    if args.cmd == 'list':
+        for r in idx.list(args.event, args.limit):
+            print(f"{r['event']}\t{r['sha256'][:16]}\tjob={r['job_id']}\thits={r['hits']}\t{r['path']}")
+    else:
+        print(idx.release(args.event, args.sha256), 'entradas eliminadas')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,7 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, redirect, Response
 from flask_cors import CORS
 import yaml
 from pathlib import Path
-import shutil
 import time
 from pathlib import Path
 import json
@@ -11,8 +10,10 @@ import tempfile
 import os
 from importlib import import_module
 import logging
+import subprocess
 import sys
 import csv
+import hashlib
 import json as _json
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -58,6 +59,123 @@ logger.addHandler(ch)
 app.logger.handlers = logger.handlers
 app.logger.setLevel(logger.level)
 
+# Content-addressed history of published iasi.json / AOI files (replaces *.bak.<ts> copies)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from history_store import HistoryStore, load_config as load_history_config
+from event_catalog import EventCatalog
+from sse_hub import SSEHub
+from telemetry import TELEMETRY, stage, read_run_summary
+from job_store import JobStore
+from chunked_upload import ChunkedUploads, ChunkError
+from upload_dedup import DedupIndex, stream_to_file, file_sha256, inbox_name
+from aoi_index import AOIIndex
+from timebase import epoch, format_times, valid_epoch
+import rollups
+HISTORY_CFG = load_history_config(SERVER_CFG)
+HISTORY = HistoryStore.from_config(HISTORY_CFG)
+HISTORY.start_retention(int(HISTORY_CFG['keep_versions']), int(HISTORY_CFG['keep_daily_days']),
+                        float(HISTORY_CFG['prune_interval_s']), logger=logger,
+                        grace_s=float(HISTORY_CFG['blob_grace_s']))
+
+# Event catalog (SQLite) behind /list_indices and /summary; seeded once from disk if empty
+CATALOG = EventCatalog()
+if CATALOG.count() == 0:
+    CATALOG.rebuild(OUT_INDICES, HISTORY)
+
+# Spatial index (STRtree) over config/aoi_*.geojson for bbox / nearest lookups
+AOIS = AOIIndex(CFG_DIR, logger=logger)
+
+# Push channel (SSE) for job lifecycle and IASi state transitions; served by an asyncio hub
+SSE_CFG = SERVER.get('sse') or {}
+HUB = SSEHub(host=SSE_CFG.get('host', '0.0.0.0'), port=SSE_CFG.get('port', 5002), token=API_TOKEN,
+             heartbeat_s=SSE_CFG.get('heartbeat_s', 15), queue_size=SSE_CFG.get('queue_size', 256),
+             max_clients=SSE_CFG.get('max_clients', 2000), logger=logger)
+
+# Inbox status counters are kept in memory (persisted to status.json on every change)
+INBOX = ROOT / 'data' / 'inbox_sat'
+STATUS_FILE = INBOX / 'status.json'
+_status_lock = threading.Lock()
+STATUS = {'processed': 0, 'invalid': 0, 'queued': 0, 'last': None}
+try:
+    if STATUS_FILE.exists():
+        STATUS.update(_json.loads(STATUS_FILE.read_text(encoding='utf-8')))
+except Exception:
+    logger.exception('Could not read status.json')
+
+def update_status(counter, last):
+    with _status_lock:
+        STATUS[counter] = STATUS.get(counter, 0) + 1
+        STATUS['last'] = str(last)
+        snapshot = dict(STATUS)
+        try:
+            INBOX.mkdir(parents=True, exist_ok=True)
+            STATUS_FILE.write_text(_json.dumps(snapshot), encoding='utf-8')
+        except Exception:
+            logger.exception('Could not update status.json (%s)', counter)
+    HUB.publish('status', snapshot)
+
+def catalog_states():
+    rows, _ = CATALOG.query()
+    return {r['name']: r for r in rows}
+
+def publish_state_changes(before, names=None):
+    """Emit a 'state' event for every catalog entry whose IASi estado changed since before."""
+    after = catalog_states()
+    for name, row in after.items():
+        if names is not None and name not in names:
+            continue
+        prev = before.get(name)
+        if prev is None or prev['state'] != row['state']:
+            HUB.publish('state', {'event': name, 'from': prev['state'] if prev else None, 'to': row['state'],
+                                  'iasi': row['last_iasi'], 'date': row['last_date'], 'version': row['version']})
+
+# Resumable chunked uploads staged under data/inbox_sat/chunks/<upload_id>/
+CHUNKED = ChunkedUploads(INBOX / 'chunks', ttl_s=float((SERVER.get('chunked') or {}).get('ttl_hours', 48)) * 3600)
+
+# Upload jobs (id returned by /upload_sat, propagated to the scripts as IASI_JOB_ID)
+JOBS = JobStore()
+
+# Per-event index of already ingested upload contents (sha256) so retried uploads are no-ops
+DEDUP = DedupIndex()
+
+def duplicate_response(event, job_id, sha256, prev, saved=None):
+    """Acknowledge an upload whose content was already ingested for event."""
+    if saved is not None:
+        try:
+            saved.unlink()
+        except OSError:
+            logger.exception('Could not remove duplicate upload %s', saved)
+    logger.info('Duplicate upload for %s (sha256=%s, first job %s)', event, sha256[:12], prev.get('job_id'))
+    JOBS.finish(job_id, 'duplicate', None)
+    update_status('duplicate', saved or sha256)
+    HUB.publish('duplicate', {'event': event, 'job_id': job_id, 'duplicate_of': prev.get('job_id'), 'sha256': sha256})
+    return jsonify({'ok': True, 'queued': False, 'duplicate': True, 'duplicate_of': prev.get('job_id'),
+                    'sha256': sha256, 'job_id': job_id}), 200
+
+def run_script(cmd, script, job_id=None):
+    """Run a pipeline script, fold its per-run timing summary into /metrics and
+    record it as a stage of job_id. Returns (returncode, summary)."""
+    t0 = time.time()
+    env = dict(os.environ)
+    if job_id:
+        env['IASI_JOB_ID'] = job_id
+    rc = subprocess.run([str(c) for c in cmd], env=env).returncode
+    summary = read_run_summary(script, since=t0, job_id=job_id)
+    TELEMETRY.merge_summary(summary)
+    return rc, summary
+
+def summary_rows(summary, *stages):
+    if not summary:
+        return None
+    return max((summary['stages'].get(s, {}).get('rows', 0) for s in stages), default=0)
+
+def record_history(kind, name, target, data):
+    """Store data as a new version of target; seed the log with the file on disk if untracked."""
+    entry, created = HISTORY.record(kind, name, target, data)
+    if not created:
+        logger.info('History: %s/%s unchanged (version %s)', kind, name, entry['version'])
+    return entry, created
+
 def check_token(req):
     auth = req.headers.get('Authorization') or req.headers.get('authorization')
     if not auth:
@@ -105,13 +223,21 @@ def upload_iasi():
     outdir = OUT_INDICES / name
     outdir.mkdir(parents=True, exist_ok=True)
     target = outdir / 'iasi.json'
-    # backup previous
-    if target.exists():
-        bak = outdir / f'iasi.json.bak.{int(time.time())}'
-        shutil.copy2(target, bak)
-    with open(target, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return jsonify({'ok': True, 'path': str(target)})
+    with stage('publish') as st:
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        entry, created = record_history('iasi', name, target, body)
+        target.write_bytes(body)
+        st.rows = len(data.get('timeline') or [])
+        st.bytes_written = len(body)
+        prev = CATALOG.get(name)
+        changed = created or prev is None
+        if changed:
+            CATALOG.upsert(data, version=entry['version'])
+    if changed:
+        before = {name: prev} if prev else {}
+        HUB.publish('published', {'event': name, 'version': entry['version'], 'source': 'upload_iasi'})
+        publish_state_changes(before, {name})
+    return jsonify({'ok': True, 'path': str(target), 'version': entry['version'], 'sha256': entry['sha256']})
 
 @app.route('/upload_aoi', methods=['POST'])
 def upload_aoi():
@@ -122,18 +248,161 @@ def upload_aoi():
     f = request.files['aoi']
     name = request.form.get('name', 'uploaded')
     outp = CFG_DIR / f'aoi_{name}.geojson'
-    # backup
-    if outp.exists():
-        outp.rename(CFG_DIR / f'aoi_{name}.geojson.bak.{int(time.time())}')
-    f.save(outp)
-    return jsonify({'ok': True, 'path': str(outp)})
+    body = f.read()
+    entry, _ = record_history('aoi', name, outp, body)
+    outp.write_bytes(body)
+    if not AOIS.update(outp):
+        logger.warning('Uploaded AOI %s is not valid GeoJSON; not indexed', outp)
+    return jsonify({'ok': True, 'path': str(outp), 'version': entry['version'], 'sha256': entry['sha256']})
+
+
+def bootstrap_option(value):
+    """Bootstrap resamples asked for by a client (bootstrap=<n>, or true for 1000); 0: no intervals."""
+    v = str(value or '').strip().lower()
+    if v == 'true':
+        return 1000
+    return int(v) if v.isdigit() else 0
+
+
+def queue_sat_upload(saved, event, job_id, run_pipeline, date_col, coh_col, p95_col, sha256=None, bootstrap=0):
+    """Header check, duplicate check and background ingest/pipeline for a file already
+    saved in the inbox. Shared by /upload_sat and the chunked upload finalize call;
+    returns the HTTP response. bootstrap > 0 asks run_eval_batch for metric intervals."""
+    inbox = INBOX
+    # prepare inbox subdirs for invalid/processed
+    invalid_dir = inbox / 'invalid'
+    processed_dir = inbox / 'processed'
+    invalid_dir.mkdir(parents=True, exist_ok=True)
+    processed_dir.mkdir(parents=True, exist_ok=True)
+
+    # quick validation of CSV headers (if saved file is present)
+    if saved and saved.exists():
+        t_check = time.time()
+        try:
+            with stage('header_check') as st:
+                with saved.open('r', encoding='utf-8') as fh:
+                    first = fh.readline()
+                st.bytes_read = len(first)
+                hdr = first.strip()
+                header_cols = [c.strip() for c in hdr.split(',') if c.strip()]
+                missing = [c for c in (date_col, coh_col, p95_col) if c not in header_cols]
+            JOBS.stage(job_id, 'header_check', t_check, missing=missing or None)
+            if missing:
+                # move to invalid and return error
+                bad = invalid_dir / saved.name
+                saved.rename(bad)
+                logger.warning('Uploaded sat file %s missing cols: %s -> moved to %s', saved.name, missing, bad)
+                update_status('invalid', bad)
+                JOBS.finish(job_id, 'invalid', f'Missing required columns: {missing}')
+                HUB.publish('invalid', {'event': event, 'job_id': job_id, 'path': str(bad), 'missing': missing})
+                return jsonify({'ok': False, 'error': f'Missing required columns: {missing}', 'moved_to': str(bad), 'job_id': job_id}), 400
+        except Exception as e:
+            logger.exception('Error reading uploaded CSV header')
+            bad = invalid_dir / saved.name
+            try:
+                if saved.exists():
+                    saved.rename(bad)
+            except Exception:
+                logger.exception('Could not move bad file %s', saved)
+            update_status('invalid', bad)
+            JOBS.finish(job_id, 'invalid', f'Error reading CSV header: {e}')
+            HUB.publish('invalid', {'event': event, 'job_id': job_id, 'path': str(bad), 'error': str(e)})
+            return jsonify({'ok': False, 'error': 'Error reading CSV header', 'detail': str(e), 'job_id': job_id}), 400
+
+    if sha256:
+        prev = DEDUP.claim(event, sha256, job_id, saved, saved.stat().st_size if saved and saved.exists() else None)
+        if prev is not None:
+            return duplicate_response(event, job_id, sha256, prev, saved)
+
+    def _bg_process(path, ev, do_pipeline, date_col_local=date_col, coh_col_local=coh_col, p95_col_local=p95_col):
+        errors = []
+        unchanged = False
+        try:
+            JOBS.stage(job_id, 'queued', t_queued)
+            pkg_root = Path(__file__).resolve().parents[1]
+            # call ingest script to append into data/features
+            cmd_ingest = [sys.executable, str(pkg_root / 'scripts' / 'ingest_satellite.py'), '-i', str(path), '-e', ev, '--mode', 'append']
+            # pass column mapping to ingest script if it supports it
+            cmd_ingest.extend(['--date-col', date_col_local, '--coh-col', coh_col_local, '--p95-col', p95_col_local])
+            logger.info('Running ingest command: %s', ' '.join(cmd_ingest))
+            t0 = time.time()
+            rc, summ = run_script(cmd_ingest, 'ingest_satellite', job_id)
+            changed = (summ or {}).get('rows_changed')
+            JOBS.stage(job_id, 'ingested', t0, rows=summary_rows(summ, 'ingest_parse'), rc=rc, rows_changed=changed)
+            if rc != 0:
+                errors.append(f'ingest_satellite exit code {rc}')
+                if sha256:
+                    DEDUP.release(ev, sha256, job_id)
+            HUB.publish('ingested', {'event': ev, 'job_id': job_id, 'path': str(path), 'rows_changed': changed})
+            if do_pipeline and rc == 0 and changed == 0:
+                # every row already stored with the same values: nothing to rescore
+                logger.info('No changed rows for %s; skipping pipeline', ev)
+                do_pipeline = False
+                unchanged = True
+            if do_pipeline:
+                cmd_run = [sys.executable, str(pkg_root / 'scripts' / 'run_eval_batch.py')]
+                if bootstrap:
+                    cmd_run.extend(['--bootstrap', str(bootstrap)])
+                cmd_export = [sys.executable, str(pkg_root / 'scripts' / 'export_iasi_json.py')]
+                logger.info('Running pipeline commands')
+                before = catalog_states()
+                t0 = time.time()
+                rc, summ = run_script(cmd_run, 'run_eval_batch', job_id)
+                JOBS.stage(job_id, 'scored', t0, rows=summary_rows(summ, 'join', 'score'), rc=rc)
+                if rc != 0:
+                    errors.append(f'run_eval_batch exit code {rc}')
+                HUB.publish('scored', {'event': ev, 'job_id': job_id, 'path': str(path)})
+                t0 = time.time()
+                rc, summ = run_script(cmd_export, 'export_iasi_json', job_id)
+                if rc != 0:
+                    errors.append(f'export_iasi_json exit code {rc}')
+                after = catalog_states()
+                versions = {}
+                for name, row in after.items():
+                    if before.get(name, {}).get('version') != row['version']:
+                        versions[name] = row['version']
+                        HUB.publish('published', {'event': name, 'job_id': job_id, 'version': row['version'], 'source': 'pipeline'})
+                JOBS.stage(job_id, 'published', t0, rows=summary_rows(summ, 'publish'), rc=rc, versions=versions or None)
+                publish_state_changes(before)
+            # move processed file to processed dir
+            try:
+                dest = processed_dir / Path(path).name
+                Path(path).rename(dest)
+                logger.info('Moved processed file to %s', dest)
+                update_status('processed', dest)
+            except Exception:
+                logger.exception('Could not move processed file %s', path)
+            logger.info('Background processing finished for %s', path)
+            JOBS.finish(job_id, 'failed' if errors else ('unchanged' if unchanged else
+                                                          ('published' if do_pipeline else 'ingested')),
+                        '; '.join(errors) or None)
+        except Exception as e:
+            logger.exception('Error in background processing: %s', e)
+            if sha256:
+                DEDUP.release(ev, sha256, job_id)
+            JOBS.finish(job_id, 'failed', str(e))
+            HUB.publish('failed', {'event': ev, 'job_id': job_id, 'path': str(path), 'error': str(e)})
+        finally:
+            TELEMETRY.add_gauge('iasi_queue_depth', -1)
+
+    # update queued counter
+    update_status('queued', saved)
+    t_queued = time.time()
+    HUB.publish('queued', {'event': event, 'job_id': job_id, 'path': str(saved), 'run_pipeline': run_pipeline})
+
+    TELEMETRY.add_gauge('iasi_queue_depth', 1)
+    t = threading.Thread(target=_bg_process, args=(saved, event, run_pipeline), daemon=True)
+    t.start()
+
+    return jsonify({'ok': True, 'queued': True, 'path': str(saved), 'job_id': job_id}), 200
 
 
 @app.route('/upload_sat', methods=['POST'])
 def upload_sat():
     """Endpoint to receive satellite table (CSV or JSON) and ingest into data/features.
     Accepts multipart file named 'sat' or JSON payload with keys: event, rows[] or csv text.
-    Optional query param: run_pipeline=true to trigger run_eval_batch.py (background).
+    Optional query param: run_pipeline=true to trigger run_eval_batch.py (background);
+    bootstrap=<n> (or true: 1000) adds bootstrap intervals to its metrics.
     """
     if not check_token(request):
         return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
@@ -143,39 +412,53 @@ def upload_sat():
         return jsonify({'ok': False, 'error': 'event name required (form/event or json.event)'}), 400
 
     # Ensure inbox exists
-    inbox = ROOT / 'data' / 'inbox_sat'
+    inbox = INBOX
     inbox.mkdir(parents=True, exist_ok=True)
 
+    t_created = time.time()
+    job_id = JOBS.create(event, created_at=t_created)
     try:
         saved = None
+        sha256 = None
+        t_recv = time.perf_counter()
         if 'sat' in request.files:
             f = request.files['sat']
-            fname = f"{event}_{int(time.time())}.csv"
+            fname = inbox_name(event, job_id)
             saved = inbox / fname
-            f.save(str(saved))
+            sha256, _ = stream_to_file(f.stream, saved)
             logger.info('Saved uploaded sat file %s for event %s', saved, event)
         elif request.is_json:
             j = request.get_json()
             rows = j.get('rows')
             if rows and isinstance(rows, list) and len(rows) > 0:
                 keys = list(rows[0].keys())
-                fname = f"{event}_{int(time.time())}.csv"
+                fname = inbox_name(event, job_id)
                 saved = inbox / fname
                 with saved.open('w', encoding='utf-8', newline='') as fh:
                     w = csv.writer(fh)
                     w.writerow(keys)
                     for r in rows:
                         w.writerow([r.get(k, '') for k in keys])
+                sha256 = file_sha256(saved)
                 logger.info('Saved JSON rows to %s', saved)
             elif j.get('csv'):
-                fname = f"{event}_{int(time.time())}.csv"
+                fname = inbox_name(event, job_id)
                 saved = inbox / fname
-                saved.write_text(j['csv'], encoding='utf-8')
+                body = j['csv'].encode('utf-8')
+                sha256 = hashlib.sha256(body).hexdigest()
+                saved.write_bytes(body)
                 logger.info('Saved csv text payload to %s', saved)
             else:
-                return jsonify({'ok': False, 'error': 'JSON payload must include rows[] or csv text'}), 400
+                JOBS.finish(job_id, 'invalid', 'JSON payload must include rows[] or csv text')
+                return jsonify({'ok': False, 'error': 'JSON payload must include rows[] or csv text', 'job_id': job_id}), 400
         else:
-            return jsonify({'ok': False, 'error': 'No sat file or JSON payload found'}), 400
+            JOBS.finish(job_id, 'invalid', 'No sat file or JSON payload found')
+            return jsonify({'ok': False, 'error': 'No sat file or JSON payload found', 'job_id': job_id}), 400
+
+        nbytes = saved.stat().st_size if saved and saved.exists() else 0
+        TELEMETRY.observe('upload_receive', time.perf_counter() - t_recv, bytes_read=nbytes)
+        JOBS.set_path(job_id, saved)
+        JOBS.stage(job_id, 'upload_receive', t_created, nbytes=nbytes, sha256=sha256)
 
         # respond quickly and process in background
         run_pipeline = (request.args.get('run_pipeline','false').lower() == 'true') or (request.form.get('run_pipeline','false').lower()=='true')
@@ -184,114 +467,129 @@ def upload_sat():
         date_col = request.form.get('date_col') or request.args.get('date_col') or 'date'
         coh_col = request.form.get('coh_col') or request.args.get('coh_col') or 'mean_coh'
         p95_col = request.form.get('p95_col') or request.args.get('p95_col') or 'p95_defo_mm'
+        bootstrap = bootstrap_option(request.form.get('bootstrap') or request.args.get('bootstrap'))
 
-        # prepare inbox subdirs for invalid/processed
-        invalid_dir = inbox / 'invalid'
-        processed_dir = inbox / 'processed'
-        invalid_dir.mkdir(parents=True, exist_ok=True)
-        processed_dir.mkdir(parents=True, exist_ok=True)
+        return queue_sat_upload(saved, event, job_id, run_pipeline, date_col, coh_col, p95_col, sha256, bootstrap)
+    except Exception as e:
+        logger.exception('upload_sat error')
+        JOBS.finish(job_id, 'failed', str(e))
+        return jsonify({'ok': False, 'error': str(e), 'job_id': job_id}), 500
 
-        # quick validation of CSV headers (if saved file is present)
-        if saved and saved.exists():
-            try:
-                with saved.open('r', encoding='utf-8') as fh:
-                    first = fh.readline()
-                hdr = first.strip()
-                header_cols = [c.strip() for c in hdr.split(',') if c.strip()]
-                missing = [c for c in (date_col, coh_col, p95_col) if c not in header_cols]
-                if missing:
-                    # move to invalid and return error
-                    bad = invalid_dir / saved.name
-                    saved.rename(bad)
-                    logger.warning('Uploaded sat file %s missing cols: %s -> moved to %s', saved.name, missing, bad)
-                    # update status
-                    try:
-                        status_file = inbox / 'status.json'
-                        st = {'processed':0,'invalid':0,'queued':0,'last':None}
-                        if status_file.exists():
-                            st = _json.loads(status_file.read_text(encoding='utf-8'))
-                        st['invalid'] = st.get('invalid',0) + 1
-                        st['last'] = str(bad)
-                        status_file.write_text(_json.dumps(st), encoding='utf-8')
-                    except Exception:
-                        logger.exception('Could not update status.json')
-                    return jsonify({'ok': False, 'error': f'Missing required columns: {missing}', 'moved_to': str(bad)}), 400
-            except Exception as e:
-                logger.exception('Error reading uploaded CSV header')
-                bad = invalid_dir / saved.name
-                try:
-                    if saved.exists():
-                        saved.rename(bad)
-                except Exception:
-                    logger.exception('Could not move bad file %s', saved)
-                try:
-                    status_file = inbox / 'status.json'
-                    st = {'processed':0,'invalid':0,'queued':0,'last':None}
-                    if status_file.exists():
-                        st = _json.loads(status_file.read_text(encoding='utf-8'))
-                    st['invalid'] = st.get('invalid',0) + 1
-                    st['last'] = str(bad)
-                    status_file.write_text(_json.dumps(st), encoding='utf-8')
-                except Exception:
-                    logger.exception('Could not update status.json')
-                return jsonify({'ok': False, 'error': 'Error reading CSV header', 'detail': str(e)}), 400
-
-        def _bg_process(path, ev, do_pipeline, date_col_local=date_col, coh_col_local=coh_col, p95_col_local=p95_col):
-            try:
-                pkg_root = Path(__file__).resolve().parents[1]
-                # call ingest script to append into data/features
-                cmd_ingest = [sys.executable, str(pkg_root / 'scripts' / 'ingest_satellite.py'), '-i', str(path), '-e', ev, '--mode', 'append']
-                # pass column mapping to ingest script if it supports it
-                cmd_ingest.extend(['--date-col', date_col_local, '--coh-col', coh_col_local, '--p95-col', p95_col_local])
-                logger.info('Running ingest command: %s', ' '.join(cmd_ingest))
-                os.system(' '.join(f'"{c}"' if ' ' in str(c) else str(c) for c in cmd_ingest))
-                if do_pipeline:
-                    cmd_run = [sys.executable, str(pkg_root / 'scripts' / 'run_eval_batch.py')]
-                    cmd_export = [sys.executable, str(pkg_root / 'scripts' / 'export_iasi_json.py')]
-                    logger.info('Running pipeline commands')
-                    os.system(' '.join(f'"{c}"' if ' ' in str(c) else str(c) for c in cmd_run))
-                    os.system(' '.join(f'"{c}"' if ' ' in str(c) else str(c) for c in cmd_export))
-                # move processed file to processed dir
-                try:
-                    dest = processed_dir / Path(path).name
-                    Path(path).rename(dest)
-                    logger.info('Moved processed file to %s', dest)
-                    # update status
-                    try:
-                        status_file = inbox / 'status.json'
-                        st = {'processed':0,'invalid':0,'queued':0,'last':None}
-                        if status_file.exists():
-                            st = _json.loads(status_file.read_text(encoding='utf-8'))
-                        st['processed'] = st.get('processed',0) + 1
-                        st['last'] = str(dest)
-                        status_file.write_text(_json.dumps(st), encoding='utf-8')
-                    except Exception:
-                        logger.exception('Could not update status.json after processing')
-                except Exception:
-                    logger.exception('Could not move processed file %s', path)
-                logger.info('Background processing finished for %s', path)
-            except Exception as e:
-                logger.exception('Error in background processing: %s', e)
-
-        # update queued counter
-        try:
-            status_file = inbox / 'status.json'
-            st = {'processed':0,'invalid':0,'queued':0,'last':None}
-            if status_file.exists():
-                st = _json.loads(status_file.read_text(encoding='utf-8'))
-            st['queued'] = st.get('queued',0) + 1
-            st['last'] = str(saved)
-            status_file.write_text(_json.dumps(st), encoding='utf-8')
-        except Exception:
-            logger.exception('Could not update status.json queued counter')
 
-        t = threading.Thread(target=_bg_process, args=(saved, event, run_pipeline), daemon=True)
-        t.start()
+@app.route('/upload_sat/chunked', methods=['POST'])
+def chunked_init():
+    """Start a chunked upload. JSON: event, size, [chunk_size, sha256, filename,
+    run_pipeline, bootstrap, date_col, coh_col, p95_col]. Returns upload_id and chunk layout."""
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    j = request.get_json(silent=True) or {}
+    event = j.get('event')
+    if not event or j.get('size') is None:
+        return jsonify({'ok': False, 'error': 'event and size required'}), 400
+    options = {
+        'run_pipeline': str(j.get('run_pipeline', 'false')).lower() == 'true',
+        'bootstrap': bootstrap_option(j.get('bootstrap')),
+        'date_col': j.get('date_col') or 'date',
+        'coh_col': j.get('coh_col') or 'mean_coh',
+        'p95_col': j.get('p95_col') or 'p95_defo_mm',
+    }
+    job_id = JOBS.create(event)
+    if j.get('sha256'):
+        # content already ingested for this event: skip the transfer entirely
+        prev = DEDUP.get(event, str(j['sha256']).lower())
+        if prev is not None:
+            return duplicate_response(event, job_id, prev['sha256'], prev)
+    try:
+        man = CHUNKED.init(event, j['size'], j.get('chunk_size'), j.get('sha256'), j.get('filename'), options, job_id)
+    except ChunkError as e:
+        JOBS.finish(job_id, 'invalid', str(e))
+        return jsonify({'ok': False, 'error': str(e)}), e.code
+    logger.info('Chunked upload %s started for %s (%s bytes, %s chunks)', man['upload_id'], event, man['size'], man['total_chunks'])
+    return jsonify({'ok': True, 'upload_id': man['upload_id'], 'job_id': job_id,
+                    'chunk_size': man['chunk_size'], 'total_chunks': man['total_chunks']})
+
+
+@app.route('/upload_sat/chunked/<upload_id>', methods=['GET'])
+def chunked_status(upload_id):
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    try:
+        st = CHUNKED.status(upload_id)
+    except ChunkError as e:
+        return jsonify({'ok': False, 'error': str(e)}), e.code
+    return jsonify({'ok': True, **st})
+
 
-        return jsonify({'ok': True, 'queued': True, 'path': str(saved)}), 200
+@app.route('/upload_sat/chunked/<upload_id>/<int:index>', methods=['PUT'])
+def chunked_put(upload_id, index):
+    """Store one chunk (raw body). Optional header X-Chunk-SHA256 is verified."""
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    t0 = time.perf_counter()
+    try:
+        data = request.get_data(cache=False)
+        digest, written = CHUNKED.put_chunk(upload_id, index, data, request.headers.get('X-Chunk-SHA256'))
+    except ChunkError as e:
+        return jsonify({'ok': False, 'error': str(e)}), e.code
+    TELEMETRY.observe('upload_chunk', time.perf_counter() - t0, bytes_read=len(data), bytes_written=len(data) if written else 0)
+    return jsonify({'ok': True, 'index': index, 'sha256': digest, 'stored': written})
+
+
+@app.route('/upload_sat/chunked/<upload_id>/complete', methods=['POST'])
+def chunked_complete(upload_id):
+    """Assemble and validate the chunks, then queue the file exactly like /upload_sat."""
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    try:
+        man = CHUNKED.manifest(upload_id)
+    except ChunkError as e:
+        return jsonify({'ok': False, 'error': str(e)}), e.code
+    event, job_id, opts = man['event'], man['job_id'], man['options']
+    INBOX.mkdir(parents=True, exist_ok=True)
+    saved = INBOX / inbox_name(event, job_id)
+    t0 = time.perf_counter()
+    try:
+        digest, _ = CHUNKED.assemble(upload_id, saved)
+    except ChunkError as e:
+        JOBS.finish(job_id, 'invalid', str(e))
+        return jsonify({'ok': False, 'error': str(e), 'job_id': job_id}), e.code
+    TELEMETRY.observe('upload_receive', time.perf_counter() - t0, bytes_read=man['size'])
+    JOBS.set_path(job_id, saved)
+    JOBS.stage(job_id, 'upload_receive', man['created_at'], nbytes=man['size'], chunks=man['total_chunks'], sha256=digest)
+    logger.info('Chunked upload %s assembled into %s (sha256=%s)', upload_id, saved, digest)
+    try:
+        return queue_sat_upload(saved, event, job_id, opts['run_pipeline'], opts['date_col'], opts['coh_col'], opts['p95_col'],
+                                digest, opts.get('bootstrap', 0))
     except Exception as e:
-        logger.exception('upload_sat error')
-        return jsonify({'ok': False, 'error': str(e)}), 500
+        logger.exception('chunked upload finalize error')
+        JOBS.finish(job_id, 'failed', str(e))
+        return jsonify({'ok': False, 'error': str(e), 'job_id': job_id}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Per-stage timestamps/latency, rows and outcome of one upload job."""
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'ok': False, 'error': 'Not found'}), 404
+    return jsonify({'ok': True, 'job': job})
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Recent jobs, optionally filtered by ?event=; newest first (limit/offset)."""
+    if not check_token(request):
+        return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
+    jobs = JOBS.list(event=request.args.get('event'),
+                     limit=request.args.get('limit', default=50, type=int),
+                     offset=request.args.get('offset', default=0, type=int))
+    fresh = [j['freshness_s'] for j in jobs if j['freshness_s'] is not None]
+    return jsonify({'ok': True, 'jobs': jobs,
+                    'freshness_s': {'last': fresh[0] if fresh else None,
+                                    'max': max(fresh) if fresh else None,
+                                    'mean': round(sum(fresh) / len(fresh), 6) if fresh else None}})
 
 
 @app.route('/health', methods=['GET'])
@@ -306,35 +604,172 @@ def health():
 def status():
     if not check_token(request):
         return jsonify({'ok': False, 'error': 'Unauthorized - invalid token'}), 401
-    inbox = ROOT / 'data' / 'inbox_sat'
-    status_file = inbox / 'status.json'
-    if not status_file.exists():
-        return jsonify({'ok': True, 'status': {}, 'note': 'no status yet'}), 200
+    with _status_lock:
+        data = dict(STATUS)
+    return jsonify({'ok': True, 'status': data}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of stage latencies, rows, bytes and queue depth."""
+    TELEMETRY.set_gauge('iasi_sse_clients', HUB.snapshot()['clients'])
+    return Response(TELEMETRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/events', methods=['GET'])
+def events():
+    """SSE stream lives on the asyncio hub (no thread per client); redirect there."""
+    if not HUB.running:
+        return jsonify({'ok': False, 'error': 'SSE hub not running'}), 503
+    base = SSE_CFG.get('public_url') or f"{request.scheme}://{request.host.rsplit(':', 1)[0]}:{HUB.port}"
+    qs = request.query_string.decode('utf-8')
+    return redirect(f"{base.rstrip('/')}/events" + (f'?{qs}' if qs else ''), code=307)
+
+
+def _float_arg(name):
+    v = request.args.get(name)
+    return float(v) if v not in (None, '') else None
+
+
+@app.route('/list_indices', methods=['GET'])
+def list_indices():
+    """Catalog-backed listing. Optional query params:
+    limit, offset, sort (name|last_date|last_iasi|state|updated_at|version|n_days),
+    order (asc|desc), state (comma separated), q (name substring), min_iasi, updated_since (epoch s),
+    bbox=minx,miny,maxx,maxy (events whose AOI intersects it, via the AOI spatial index).
+    """
     try:
-        data = _json.loads(status_file.read_text(encoding='utf-8'))
-        return jsonify({'ok': True, 'status': data}), 200
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        bbox = _bbox_arg('bbox')
+        rows, total = CATALOG.query(bbox=bbox, aoi_paths=AOIS.query_bbox(*bbox) if bbox else None,
+                                    limit=limit, offset=offset,
+                                    sort=request.args.get('sort', 'name'),
+                                    order=request.args.get('order', 'asc'),
+                                    state=request.args.get('state'),
+                                    q=request.args.get('q'),
+                                    min_iasi=_float_arg('min_iasi'),
+                                    updated_since=_float_arg('updated_since'))
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    return jsonify({'ok': True, 'indices': [r['name'] for r in rows], 'items': rows,
+                    'total': total, 'offset': offset, 'limit': limit})
+
+
+def _bbox_arg(name):
+    v = request.args.get(name)
+    if not v:
+        return None
+    try:
+        minx, miny, maxx, maxy = (float(x) for x in v.split(','))
+    except ValueError:
+        raise ValueError(f'{name} debe ser minx,miny,maxx,maxy')
+    if minx > maxx or miny > maxy:
+        raise ValueError(f'{name}: min > max')
+    return minx, miny, maxx, maxy
+
+
+@app.route('/nearest', methods=['GET'])
+def nearest():
+    """k AOIs closest to lat/lon (distance in km, 0 if inside) with the events that use them."""
+    try:
+        lat, lon = _float_arg('lat'), _float_arg('lon')
+    except ValueError:
+        lat = lon = None
+    if lat is None or lon is None:
+        return jsonify({'ok': False, 'error': 'lat y lon requeridos'}), 400
+    k = max(1, min(request.args.get('k', default=5, type=int), 100))
+    t0 = time.perf_counter()
+    found = AOIS.nearest(lon, lat, k)
+    took = (time.perf_counter() - t0) * 1000
+    events = CATALOG.names_by_aoi(key for key, _ in found)
+    return jsonify({'ok': True, 'lat': lat, 'lon': lon, 'took_ms': round(took, 3),
+                    'results': [{'aoi': key, 'distance_km': d, 'inside': d == 0, 'events': events.get(key, [])}
+                                for key, d in found]})
+
+
+@app.route('/summary', methods=['GET'])
+def summary():
+    try:
+        return jsonify({'ok': True, 'summary': CATALOG.summary()}), 200
     except Exception as e:
-        logger.exception('Error reading status.json')
+        logger.exception('Error building summary')
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 
-@app.route('/list_indices', methods=['GET'])
-def list_indices():
-    items = [p.name for p in OUT_INDICES.iterdir() if p.is_dir()]
-    return jsonify({'ok': True, 'indices': items})
+def timeline_delta(old_tl, new_tl):
+    """Rows of new_tl that are new or changed w.r.t. old_tl (by date) and dates removed."""
+    old_by = {r.get('date'): r for r in old_tl}
+    rows = [r for r in new_tl if old_by.get(r.get('date')) != r]
+    new_dates = set(r.get('date') for r in new_tl)
+    removed = [d for d in old_by if d not in new_dates]
+    return rows, removed
+
+
+def _parse_since(since):
+    """since may be a version token ('v12' or '12') or a date / ISO timestamp, returned as
+    epoch seconds (ValueError if unparseable)."""
+    s = since.strip()
+    if s[:1] in ('v', 'V') and s[1:].isdigit():
+        return 'version', int(s[1:])
+    if s.isdigit():
+        return 'version', int(s)
+    return 'date', epoch(s)
 
 
 @app.route('/get_iasi/<name>', methods=['GET'])
 def get_iasi(name):
+    """Full iasi.json, or with ?since=<version|YYYY-MM-DD> only the timeline rows
+    appended/changed since then plus current meta/metrics and the new version token.
+    ?resolution=week|month|year returns the rollups (rollups.py) instead of daily rows;
+    with since=YYYY-MM-DD, from the period containing that date. Read-only: the version is
+    the latest one in the history store (publish, export and catalog rebuild record it)."""
     target = OUT_INDICES / name / 'iasi.json'
     if not target.exists():
         return jsonify({'ok': False, 'error': 'Not found'}), 404
     try:
-        data = json.loads(target.read_text(encoding='utf-8'))
-        return jsonify({'ok': True, 'data': data})
+        raw = target.read_bytes()
+        latest = HISTORY.latest('iasi', name)
+        version = latest['version'] if latest else None
+        data = json.loads(raw.decode('utf-8'))
+        since = request.args.get('since')
+        try:
+            kind, value = _parse_since(since) if since else (None, None)
+        except ValueError:
+            return jsonify({'ok': False, 'error': 'since must be a version (v12) or a date / ISO timestamp'}), 400
+        resolution = request.args.get('resolution', 'day')
+        if resolution != 'day':
+            if resolution not in rollups.RESOLUTIONS:
+                return jsonify({'ok': False, 'error': f'resolution must be day or one of {rollups.RESOLUTIONS}'}), 400
+            # rollups.json follows iasi.json; refresh() is a no-op when it already matches this version
+            doc = rollups.refresh(target.parent, data.get('timeline') or [], source_sha=latest and latest['sha256'])
+            rows = doc[resolution]
+            if kind == 'date':
+                rows = rollups.rows_since(rows, str(format_times([value])[0]))
+            return jsonify({'ok': True, 'resolution': resolution, 'version': version, 'rows': rows,
+                            'through': doc['through'], 'metrics': data.get('metrics'), 'meta': data.get('meta')})
+        if not since:
+            return jsonify({'ok': True, 'data': data, 'version': version})
+        tl = data.get('timeline') or []
+        if kind == 'version':
+            if value == version:
+                return jsonify({'ok': True, 'delta': True, 'version': version, 'base': value,
+                                'rows': [], 'removed': [], 'metrics': data.get('metrics'), 'meta': data.get('meta')})
+            old = HISTORY.get('iasi', name, value)
+            if old is None:
+                # base version pruned or unknown: client must take the full payload
+                return jsonify({'ok': True, 'delta': False, 'data': data, 'version': version})
+            rows, removed = timeline_delta(json.loads(old.decode('utf-8')).get('timeline') or [], tl)
+        else:
+            t, ok = valid_epoch([str(r.get('date') or '') for r in tl])
+            rows, removed = [r for r, ti, k in zip(tl, t, ok) if k and ti >= value], []
+            value = since.strip()
+        return jsonify({'ok': True, 'delta': True, 'version': version, 'base': value,
+                        'rows': rows, 'removed': removed, 'metrics': data.get('metrics'), 'meta': data.get('meta')})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
     logger.info('Starting upload_server on 0.0.0.0:5001 (API_TOKEN=%s)', API_TOKEN)
+    HUB.start()
     app.run(host='0.0.0.0', port=5001)
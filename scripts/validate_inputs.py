@@ -1,37 +1,25 @@
 #!/usr/bin/env python3
-# Validador de entradas IASi (A/R/D/M/S + features por evento)
+# Validador de entradas IASi: los canales de config/channels.yaml (señales compartidas + archivos por evento)
 # Uso:
 #   python scripts/validate_inputs.py
 #   python scripts/validate_inputs.py --strict   # trata warnings como errores
 
-import csv, sys, argparse
+import sys, argparse
+from collections import Counter
 from pathlib import Path
-from datetime import datetime
+
+from channels import load_registry
+from signal_table import read_table
+from timebase import parse_time
 
 ROOT = Path(__file__).resolve().parents[1]
 DATA = ROOT / "data"
+REGISTRY = load_registry()
+
+# esquema, columnas numéricas y rangos de cada canal salen del registro
+SCHEMAS = {ch.name: ["date"] + ch.columns for ch in REGISTRY.channels}
 
-SCHEMAS = {
-    "features": ["date","mean_defo_mm","p95_defo_mm","mean_coh","area_defo_gt10mm_km2"],
-    "animals":  ["date","a_score","source"],
-    "radon":    ["date","r_ppm","r_zscore"],
-    "marine":   ["date","m_events_count","m_verified_ratio"],
-    "sensors":  ["date","s_activity_z","s_duration_h"],
-}
-
-FEATURE_FILES = [
-    DATA/"features"/"features_valdivia1960.csv",
-    DATA/"features"/"features_maule2010.csv",
-    DATA/"features"/"features_illapel2015.csv",
-    DATA/"features"/"features_ec_co_1906.csv",
-]
-
-SIGNAL_FILES = {
-    "animals": DATA/"signals"/"animals.csv",
-    "radon":   DATA/"signals"/"radon.csv",
-    "marine":  DATA/"signals"/"marine.csv",
-    "sensors": DATA/"signals"/"sensors.csv",
-}
+LOCATION_COLS = ("lat", "lon", "station_id")
 
 WARN_COUNT = 0
 
@@ -48,11 +36,13 @@ def read_csv(path: Path):
     if not path.exists():
         err(f"No existe el archivo: {path}")
         return None, []
-    with path.open("r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        headers = r.fieldnames or []
-        rows = list(r)
-    return headers, rows
+    try:
+        rows = read_table(path)
+    except Exception as e:
+        err(f"{path.name}: CSV ilegible: {e}")
+        return None, []
+    # filas: vistas Row de la SignalTable (números como float, celdas vacías como "")
+    return rows.columns, rows
 
 def check_headers(file_path: Path, headers, required):
     missing = [h for h in required if h not in headers]
@@ -65,16 +55,17 @@ def check_headers(file_path: Path, headers, required):
     return True
 
 def is_date(s):
+    # YYYY-MM-DD o timestamp ISO (YYYY-MM-DDTHH:MM[:SS][Z|±HH:MM]) de feeds horarios y adquisiciones
     try:
-        datetime.strptime(s, "%Y-%m-%d")
-        return True
+        parse_time(s)
+        return len(s) >= 10
     except Exception:
         return False
 
 def check_dates(file_path: Path, rows):
     bad = [r.get("date","") for r in rows if not is_date(r.get("date",""))]
     if bad:
-        err(f"{file_path.name}: fechas inválidas (YYYY-MM-DD): {bad[:5]}{' ...' if len(bad)>5 else ''}")
+        err(f"{file_path.name}: fechas inválidas (YYYY-MM-DD o ISO 8601): {bad[:5]}{' ...' if len(bad)>5 else ''}")
         return False
     return True
 
@@ -138,20 +129,20 @@ def date_series(rows):
     for r in rows:
         s = r.get("date","")
         try:
-            out.append(datetime.strptime(s, "%Y-%m-%d").date())
+            out.append(parse_time(s))
         except Exception:
             pass
     return out
 
 def check_duplicates_and_order(file_path: Path, rows):
     ds = [r.get("date","") for r in rows if r.get("date","")]
-    dup = sorted(set([d for d in ds if ds.count(d) > 1]))
+    dup = sorted(d for d, k in Counter(ds).items() if k > 1)
     ok_all = True
     if dup:
         err(f"{file_path.name}: fechas duplicadas: {dup[:10]}{' ...' if len(dup)>10 else ''}")
         ok_all = False
     try:
-        d_objs = [datetime.strptime(d, "%Y-%m-%d").date() for d in ds]
+        d_objs = [parse_time(d) for d in ds]
         if any(d_objs[i] > d_objs[i+1] for i in range(len(d_objs)-1)):
             warn(f"{file_path.name}: fechas fuera de orden cronológico. Recomendado ordenar ascendente.")
     except Exception:
@@ -172,48 +163,31 @@ def check_coverage(file_path: Path, rows, min_days=7):
         warn(f"{file_path.name}: baja densidad temporal (≈ {density:.3f} puntos/día). Revisa huecos.")
     return True
 
-def validate_features(path: Path):
-    headers, rows = read_csv(path)
-    if headers is None: return False, 1
-    ok1 = check_headers(path, headers, SCHEMAS["features"])
-    ok2 = check_dates(path, rows)
-    ok3 = check_numeric(path, rows, ["mean_defo_mm","p95_defo_mm","mean_coh","area_defo_gt10mm_km2"])
-    check_ranges(path, rows, {
-        "mean_coh": ('range', 0.0, 1.0),
-        "mean_defo_mm": ('min', 0.0),
-        "p95_defo_mm": ('min', 0.0),
-        "area_defo_gt10mm_km2": ('min', 0.0),
-    })
-    low_coh = sum(1 for r in rows if r.get("mean_coh","")!="" and float(r["mean_coh"]) < 0.3)
-    if rows:
-        ratio = low_coh / len(rows)
-        if ratio > 0.5:
-            warn(f"{path.name}: {ratio:.0%} de filas con mean_coh < 0.3, D' podría quedar casi apagado.")
-    ok4 = check_duplicates_and_order(path, rows)
-    ok5 = check_coverage(path, rows, min_days=14)
-    return (ok1 and ok2 and ok3 and ok4 and ok5), 0
+def range_rules(ch):
+    """validate de channels.yaml -> reglas de check_ranges: [lo, hi] o [lo, null]."""
+    return {c: ('range', float(lo), float(hi)) if hi is not None else ('min', float(lo))
+            for c, (lo, hi) in ch.validate.items()}
 
-def validate_signals(name: str, path: Path):
+def validate_channel(ch, path: Path):
     headers, rows = read_csv(path)
     if headers is None: return False, 1
-    ok1 = check_headers(path, headers, SCHEMAS[name])
+    # lat/lon/station_id opcionales en señales: filas geolocalizadas (scripts/signal_index.py)
+    extra = LOCATION_COLS if ch.scope == "signal" else ()
+    ok1 = check_headers(path, [h for h in headers if h not in extra], SCHEMAS[ch.name])
+    located = [r for r in rows if r.get("lat","") != "" and r.get("lon","") != ""] if extra else []
+    if located:
+        check_ranges(path, located, {"lat": ('range', -90.0, 90.0), "lon": ('range', -180.0, 180.0)})
+        ok(f"{path.name}: {len(located)} observaciones geolocalizadas")
     ok2 = check_dates(path, rows)
-    num_cols = {
-        "animals": ["a_score"],
-        "radon": ["r_ppm","r_zscore"],
-        "marine": ["m_events_count","m_verified_ratio"],
-        "sensors": ["s_activity_z","s_duration_h"],
-    }[name]
-    ok3 = check_numeric(path, rows, num_cols, allow_nan=False)
-    if name == "animals":
-        check_ranges(path, rows, {"a_score":('range', 0.0, 1.0)})
-    if name == "marine":
-        check_ranges(path, rows, {"m_verified_ratio":('range', 0.0, 1.0), "m_events_count":('min', 0.0)})
-    if name == "sensors":
-        pass
-    if name == "radon":
-        check_ranges(path, rows, {"r_ppm":('min', 0.0)})
-    ok4 = check_duplicates_and_order(path, rows)
+    ok3 = check_numeric(path, rows, ch.numeric, allow_nan=False)
+    check_ranges(path, rows, range_rules(ch))
+    if ch.kind == "gated_scale" and rows:
+        low = sum(1 for r in rows if r.get(ch.gate, "") != "" and not is_float_ge(r[ch.gate], ch.gate_min))
+        ratio = low / len(rows)
+        if ratio > 0.5:
+            warn(f"{path.name}: {ratio:.0%} de filas con {ch.gate} < {ch.gate_min}, {ch.component}' podría quedar casi apagado.")
+    # la serie regional (sin ubicación) sigue siendo una fila por fecha
+    ok4 = check_duplicates_and_order(path, [r for r in rows if r.get("lat","") == "" or r.get("lon","") == ""])
     ok5 = check_coverage(path, rows, min_days=14)
     return (ok1 and ok2 and ok3 and ok4 and ok5), 0
 
@@ -224,18 +198,23 @@ def main():
 
     critical_errors = 0
 
-    print("== Validando FEATURES por evento ==")
-    for fp in FEATURE_FILES:
-        okf, code = validate_features(fp)
+    from run_eval_batch import EVENTS
+    files = []
+    for ch in REGISTRY.event_channels():
+        files += [(ch, ch.path(ev)) for ev in EVENTS]
+    files += [(ch, ch.path()) for ch in REGISTRY.signals()]
+
+    last = None
+    for ch, fp in files:
+        if ch.scope != last:
+            print(("\n" if last else "") + ("== Validando archivos por evento ==" if ch.scope == "event"
+                                             else "== Validando SEÑALES compartidas =="))
+            last = ch.scope
+        if ch.optional and not fp.exists():
+            continue
+        okf, code = validate_channel(ch, fp)
         if not okf: critical_errors += 1
-        else: ok(f"{fp.name}: esquema y valores básicos OK")
-        if code != 0: critical_errors += 1
-
-    print("\n== Validando SEÑALES A/R/M/S ==")
-    for name, sp in SIGNAL_FILES.items():
-        oks, code = validate_signals(name, sp)
-        if not oks: critical_errors += 1
-        else: ok(f"{sp.name}: esquema y valores básicos OK")
+        else: ok(f"{fp.name} ({ch.name}): esquema y valores básicos OK")
         if code != 0: critical_errors += 1
 
     if args.strict and WARN_COUNT > 0:
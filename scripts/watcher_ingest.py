@@ -2,7 +2,10 @@
 """
 Watcher simple para procesar archivos satelitales colocados en data/inbox_sat.
 Coloca CSV en esa carpeta; el watcher los moverá a data/inbox_sat/processed y ejecutará
-el adaptador + pipeline.
+el adaptador + pipeline. Los archivos cuyo contenido (sha256) ya fue ingerido para el
+mismo evento se mueven a processed sin re-ingerirlos (índice de scripts/upload_dedup.py).
+El evento es el nombre del archivo (<evento>.csv). Los archivos que guarda el servidor
+(<evento>_<unix>_<job>.csv) se ignoran: su job de /upload_sat los ingiere y los mueve.
 
 Uso:
   python scripts/watcher_ingest.py --run-pipeline
@@ -13,6 +16,8 @@ import shutil
 import subprocess
 import argparse
 
+from upload_dedup import DedupIndex, file_sha256, is_server_upload
+
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -29,13 +34,24 @@ def main():
     processed = Path(args.processed)
     inbox.mkdir(parents=True, exist_ok=True)
     processed.mkdir(parents=True, exist_ok=True)
+    dedup = DedupIndex()
     print('Watcher started. Inbox:', inbox)
     while True:
         for f in list(inbox.glob('*.csv')):
+            if is_server_upload(f):
+                continue
+            sha = None
+            event = f.stem
             try:
+                sha = file_sha256(f)
+                prev = dedup.claim(event, sha, path=f)
+                if prev is not None:
+                    shutil.move(str(f), str(processed / f.name))
+                    print('Duplicate of an already ingested file, skipped:', f)
+                    continue
                 print('Processing', f)
                 # call ingest script
-                cmd = ['python', 'scripts/ingest_satellite.py', '-i', str(f), '-e', f.stem, '--mode', 'append']
+                cmd = ['python', 'scripts/ingest_satellite.py', '-i', str(f), '-e', event, '--mode', 'append']
                 subprocess.check_call(cmd)
                 # move to processed
                 dest = processed / f.name
@@ -46,6 +62,8 @@ def main():
                     subprocess.check_call(['python', 'scripts/export_iasi_json.py'])
             except Exception as e:
                 print('Error processing', f, e)
+                if sha:
+                    dedup.release(event, sha)
         time.sleep(args.poll)
 
 